@@ -0,0 +1,109 @@
+"""
+Onlayn backup ning foydalanuvchi kechikishiga ta'siri.
+
+Katta sintetik baza (users + user_activity) yaratadi, keyin oddiy "xabar"
+(update_user_activity + get_content + register_download) kechikishini ikki marta o'lchaydi:
+backupsiz (fon) va run_backup() ishlayotgan paytda.
+
+    python benchmarks/bench_backup.py [--users 200000] [--activity 1000000] [--seconds 5]
+
+Backup vaqtidagi p99 fondan bot.BACKUP_LATENCY_BUDGET_MS dan ko'p oshsa exit code 1.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("ADMIN_ID", "1")
+
+import bot  # noqa: E402
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def fill(path: str, users: int, activity: int, catalog: int) -> None:
+    rnd = random.Random(1)
+    now = int(time.time())
+    con = sqlite3.connect(path)
+    con.executemany(
+        "INSERT INTO users (user_id, username, first_name, joined_ts, last_active_ts) VALUES (?, ?, ?, ?, ?)",
+        ((uid, f"user{uid}", "Bench", now - rnd.randint(0, 365 * 86400), now) for uid in range(1, users + 1)),
+    )
+    con.executemany(
+        "INSERT INTO user_activity (user_id, action, action_ts) VALUES (?, ?, ?)",
+        ((rnd.randint(1, users), "start", now - rnd.randint(0, 90 * 86400)) for _ in range(activity)),
+    )
+    con.executemany(
+        "INSERT INTO content (file_id, title, description, content_type, added_by) VALUES (?, ?, ?, 'movie', 1)",
+        ((f"file_{i}", f"Kino {i}", "tavsif " * 20) for i in range(catalog)),
+    )
+    con.commit()
+    con.close()
+
+
+async def load(db, users: int, catalog: int, seconds: float, workers: int):
+    samples = []
+    deadline = time.perf_counter() + seconds
+
+    async def worker(seed):
+        rnd = random.Random(seed)
+        while time.perf_counter() < deadline:
+            uid, cid = rnd.randint(1, users), rnd.randint(1, catalog)
+            t = time.perf_counter()
+            await db.update_user_activity(uid)
+            await db.get_content(cid)
+            await db.register_download(cid, uid)
+            samples.append((time.perf_counter() - t) * 1000)
+            await asyncio.sleep(0.005)
+
+    await asyncio.gather(*(worker(i) for i in range(workers)))
+    return samples
+
+
+async def run(args) -> int:
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "bench_backup.db")
+    bot.db = bot.DatabaseManager(path)
+    bot.BACKUP_DIR = os.path.join(tmp, "backups")
+    await bot.db.init_db()
+    fill(path, args.users, args.activity, args.catalog)
+    print(f"db: {os.path.getsize(path) / 1048576:.0f} MB")
+
+    base = await load(bot.db, args.users, args.catalog, args.seconds, args.workers)
+
+    backup = asyncio.create_task(bot.run_backup())
+    during = await load(bot.db, args.users, args.catalog, args.seconds, args.workers)
+    report = await backup
+
+    for name, v in (("baseline", base), ("backup", during)):
+        print(f"{name:9s} n={len(v):5d}  p50={pct(v, 50):6.2f}ms  p99={pct(v, 99):6.2f}ms")
+    print(f"backup: {report}")
+
+    delta = pct(during, 99) - pct(base, 99)
+    over = delta > bot.BACKUP_LATENCY_BUDGET_MS or report["failed"]
+    print(f"p99 delta {delta:+.2f}ms (budget {bot.BACKUP_LATENCY_BUDGET_MS}ms)  {'OVER BUDGET' if over else 'ok'}")
+    await bot.db.close()
+    return 1 if over else 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200_000)
+    ap.add_argument("--activity", type=int, default=1_000_000)
+    ap.add_argument("--catalog", type=int, default=20_000)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--workers", type=int, default=20)
+    sys.exit(asyncio.run(run(ap.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
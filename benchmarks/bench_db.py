@@ -0,0 +1,342 @@
+"""
+DatabaseManager mikro-benchmarklari production hajmidagi sintetik bazada.
+
+Standart hajm: 2M users, 50k content (10% serial, har birida 12 qism), 20M content_downloads,
+10M user_activity. --scale bilan kichraytiriladi (masalan --scale 0.01 — tez tekshiruv).
+Yaratish bir necha daqiqa oladi; --db bilan fayl saqlanadi va keyingi ishga tushirishlarda
+qayta ishlatiladi (hajm mos kelsa).
+
+Har bir metod ikki rejimda o'lchanadi: single (bitta task ketma-ket) va concurrent
+(--concurrency ta task bir vaqtda). Natija JSON (--json) — commitlar orasida solishtirish uchun:
+
+    python benchmarks/bench_db.py --db /tmp/prod.db --json base.json
+    ... o'zgarish ...
+    python benchmarks/bench_db.py --db /tmp/prod.db --compare base.json [--tolerance 0.2]
+
+--compare da biror metodning p95 i tolerance dan ko'p oshsa exit code 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("ADMIN_ID", "1")
+
+import bot  # noqa: E402
+
+BASE_SIZES = {"users": 2_000_000, "content": 50_000, "downloads": 20_000_000, "activity": 10_000_000}
+SERIAL_EVERY = 10
+PARTS_PER_SERIAL = 12
+CHUNK = 100_000
+
+
+class FakeUser:
+    def __init__(self, uid: int):
+        self.id = uid
+        self.username = f"user{uid}"
+        self.first_name = "Bench"
+        self.last_name = None
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def zipf_cum(n: int):
+    cum, acc = [], 0.0
+    for i in range(n):
+        acc += 1 / (i + 1)
+        cum.append(acc)
+    return cum
+
+
+def chunks(gen_fn, total: int):
+    done = 0
+    while done < total:
+        n = min(CHUNK, total - done)
+        yield gen_fn(n)
+        done += n
+
+
+# ---------- synthetic data ----------
+def fill(db: bot.DatabaseManager, sizes: dict, seed: int = 42) -> None:
+    """init_db() dan keyin bo'sh bazani sqlite3 orqali to'g'ridan-to'g'ri to'ldiradi."""
+    rnd = random.Random(seed)
+    now = int(time.time())
+    year = 365 * 86400
+    users, content = sizes["users"], sizes["content"]
+
+    cat = sqlite3.connect(db.db_path)
+    cat.execute("PRAGMA synchronous=OFF")
+    cat.executemany(
+        "INSERT INTO content (id, file_id, title, description, content_type, added_by, added_at, downloads_count) "
+        "VALUES (?, ?, ?, ?, ?, 1, '2024-01-01T00:00:00+00:00', 0)",
+        ((i, f"file_{i}", f"Kino {i}", "tavsif " * 10, "serial" if i % SERIAL_EVERY == 0 else "movie")
+         for i in range(1, content + 1)),
+    )
+    cat.executemany(
+        "INSERT INTO serial_parts (serial_id, part_number, file_id, title, added_by, added_at) "
+        "VALUES (?, ?, ?, ?, 1, '2024-01-01T00:00:00+00:00')",
+        ((sid, n, f"part_{sid}_{n}", f"{n}-qism")
+         for sid in range(SERIAL_EVERY, content + 1, SERIAL_EVERY) for n in range(1, PARTS_PER_SERIAL + 1)),
+    )
+    cat.commit()
+
+    hot = cat if not db.split else sqlite3.connect(db.hot_db_path)
+    hot.execute("PRAGMA synchronous=OFF")
+    for batch in chunks(lambda n: [rnd.randint(0, year) for _ in range(n)], users):
+        start = hot.execute("SELECT COALESCE(MAX(user_id), 0) FROM users").fetchone()[0]
+        hot.executemany(
+            "INSERT INTO users (user_id, username, first_name, last_name, joined_ts, last_active_ts, started_once) "
+            "VALUES (?, ?, 'Bench', '', ?, ?, 1)",
+            ((start + i + 1, f"user{start + i + 1}", now - age, now - rnd.randint(0, min(age, 30 * 86400)))
+             for i, age in enumerate(batch)),
+        )
+    hot.commit()
+
+    cum = zipf_cum(content)
+    ids = range(1, content + 1)
+    for n_rows in chunks(lambda n: n, sizes["downloads"]):
+        cids = rnd.choices(ids, cum_weights=cum, k=n_rows)
+        hot.executemany(
+            "INSERT OR IGNORE INTO content_downloads (content_id, user_id, downloaded_ts) VALUES (?, ?, ?)",
+            ((cid, rnd.randint(1, users), now - rnd.randint(0, year)) for cid in cids),
+        )
+    for n_rows in chunks(lambda n: n, sizes["activity"]):
+        hot.executemany(
+            "INSERT INTO user_activity (user_id, action, action_ts) VALUES (?, ?, ?)",
+            ((rnd.randint(1, users), "start" if rnd.random() < 0.1 else "content", now - rnd.randint(0, 90 * 86400))
+             for _ in range(n_rows)),
+        )
+    # kohort jadvallari: bot ularni faollik kelganda to'ldiradi, bu yerda users dan taxminiy holat
+    hot.execute(
+        "INSERT INTO last_active_days (day, users) SELECT last_active_ts / 86400, COUNT(*) FROM users GROUP BY 1"
+    )
+    hot.execute(
+        "INSERT INTO cohort_activity (cohort_day, day, users) "
+        "SELECT joined_ts / 86400, last_active_ts / 86400, COUNT(*) FROM users GROUP BY 1, 2"
+    )
+    hot.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('epoch_migrated', '1')")
+    hot.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('bench_sizes', ?)", (json.dumps(sizes),))
+    hot.commit()
+
+    # downloads_count ni content_downloads bilan moslashtiramiz
+    counts = hot.execute("SELECT content_id, COUNT(*) FROM content_downloads GROUP BY content_id").fetchall()
+    cat.executemany("UPDATE content SET downloads_count = ? WHERE id = ?", ((c, cid) for cid, c in counts))
+    cat.commit()
+    if hot is not cat:
+        hot.close()
+    cat.close()
+
+
+def stored_sizes(db: bot.DatabaseManager):
+    path = db.hot_db_path
+    if not os.path.exists(path):
+        return None
+    con = sqlite3.connect(path)
+    try:
+        row = con.execute("SELECT value FROM meta WHERE key = 'bench_sizes'").fetchone()
+        return json.loads(row[0]) if row else None
+    except sqlite3.Error:
+        return None
+    finally:
+        con.close()
+
+
+async def open_db(args, sizes: dict) -> bot.DatabaseManager:
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_db.db")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    hot = path.replace(".db", "_hot.db") if args.split else None
+    db = bot.DatabaseManager(path, hot)
+    if stored_sizes(db) == sizes:
+        print(f"reusing {path}")
+    else:
+        for p in db.files:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(p + suffix):
+                    os.remove(p + suffix)
+        await db.init_db()
+        await db.close()
+        t0 = time.perf_counter()
+        fill(db, sizes)
+        print(f"generated {sizes} in {time.perf_counter() - t0:.0f}s")
+        db = bot.DatabaseManager(path, hot)
+    # epoch_migrated, download_buckets backfill va h.k. init_db da o'qiladi
+    t0 = time.perf_counter()
+    await db.init_db()
+    print(f"init_db: {time.perf_counter() - t0:.1f}s, " + ", ".join(
+        f"{os.path.basename(p)}={os.path.getsize(p) / 1048576:.0f}MB" for p in db.files))
+    # main() dagi fon yuklash bilan bir xil: add_user / update_user_activity tezkor yo'lda o'lchanadi
+    t0 = time.perf_counter()
+    known = await db.load_known_users()
+    print(f"known_users: {known} in {time.perf_counter() - t0:.1f}s, {db.known_users.nbytes / 1048576:.1f}MB")
+    return db
+
+
+# ---------- operations ----------
+def operations(db: bot.DatabaseManager, sizes: dict):
+    """name -> (og'irmi, rnd -> coroutine). Og'ir metodlar --heavy-iterations marta o'lchanadi."""
+    users, content = sizes["users"], sizes["content"]
+    # yozuvchi metodlar bazani o'zgartiradi: "yangi" foydalanuvchilar har safar haqiqatan yangi bo'lsin
+    con = sqlite3.connect(db.hot_db_path)
+    top = con.execute("SELECT MAX(user_id) FROM users").fetchone()[0]
+    con.close()
+    new_ids = iter(range(top + 1, top + 100_000_000))
+    serials = range(SERIAL_EVERY, content + 1, SERIAL_EVERY)
+
+    def add_user(rnd):
+        # yarmi yangi foydalanuvchi, yarmi qayta /start
+        return db.add_user(FakeUser(next(new_ids) if rnd.random() < 0.5 else rnd.randint(1, users)))
+
+    return {
+        "add_user": (False, add_user),
+        "update_user_activity": (False, lambda rnd: db.update_user_activity(rnd.randint(1, users))),
+        "is_admin": (False, lambda rnd: db.is_admin(rnd.randint(1, users))),
+        "get_channels": (False, lambda rnd: db.get_channels()),
+        "get_content": (False, lambda rnd: db.get_content(rnd.randint(1, content))),
+        "get_serial_parts": (False, lambda rnd: db.get_serial_parts(rnd.choice(serials))),
+        "register_download": (False, lambda rnd: db.register_download(rnd.randint(1, content), rnd.randint(1, users))),
+        "search_content": (False, lambda rnd: db.search_content(f"kino {rnd.randint(1, content)}")),
+        "get_content_page": (False, lambda rnd: db.get_content_page("movie", "downloads", limit=10)),
+        "get_statistics": (True, lambda rnd: db.get_statistics()),
+        "get_retention": (True, lambda rnd: db.get_retention()),
+        "get_all_users": (True, lambda rnd: db.get_all_users()),
+    }
+
+
+async def measure(make, iterations: int, concurrency: int, seed: int) -> dict:
+    samples, errors = [], 0
+    counter = iter(range(iterations))
+
+    async def worker(wseed):
+        nonlocal errors
+        rnd = random.Random(wseed)
+        for _ in counter:
+            t = time.perf_counter()
+            try:
+                await make(rnd)
+            except Exception:
+                errors += 1
+                continue
+            samples.append((time.perf_counter() - t) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(seed * 1000 + i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    if not samples:
+        return {"n": 0, "errors": errors}
+    return {
+        "n": len(samples),
+        "errors": errors,
+        "ops_s": round(len(samples) / elapsed, 1),
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "p50_ms": round(pct(samples, 50), 3),
+        "p95_ms": round(pct(samples, 95), 3),
+        "p99_ms": round(pct(samples, 99), 3),
+    }
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except Exception:
+        return ""
+
+
+async def run(args) -> dict:
+    sizes = {k: max(1, int(v * args.scale)) for k, v in BASE_SIZES.items()}
+    sizes["content"] = max(sizes["content"], SERIAL_EVERY)
+    db = await open_db(args, sizes)
+    ops = operations(db, sizes)
+    selected = args.ops.split(",") if args.ops else list(ops)
+
+    results = {}
+    print(f"{'method':22s} {'mode':10s} {'n':>6s} {'ops/s':>9s} {'p50':>9s} {'p95':>9s} {'p99':>9s} err")
+    for name in selected:
+        heavy, make = ops[name]
+        iterations = args.heavy_iterations if heavy else args.iterations
+        for _ in range(min(iterations, 20)):  # warm-up: sahifa keshi va read pool
+            await make(random.Random(0))
+        results[name] = {}
+        for mode, conc in (("single", 1), ("concurrent", args.concurrency)):
+            r = await measure(make, iterations, conc, args.seed)
+            results[name][mode] = r
+            if r["n"]:
+                print(f"{name:22s} {mode:10s} {r['n']:6d} {r['ops_s']:9.1f} {r['p50_ms']:7.2f}ms "
+                      f"{r['p95_ms']:7.2f}ms {r['p99_ms']:7.2f}ms {r['errors']}")
+            else:
+                print(f"{name:22s} {mode:10s}      0 {'-':>9s} {'-':>9s} {'-':>9s} {'-':>9s} {r['errors']}")
+    await db.flush_download_counts()
+    await db.close()
+    return {
+        "meta": {
+            "commit": git_rev(),
+            "sizes": sizes,
+            "split": args.split,
+            "concurrency": args.concurrency,
+            "sqlite": sqlite3.sqlite_version,
+            "python": sys.version.split()[0],
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """True — regressiya bor. Faqat ikkala faylda bor metod/rejimlar solishtiriladi."""
+    if current["meta"]["sizes"] != baseline["meta"].get("sizes"):
+        print("warning: baseline boshqa hajmda o'lchangan")
+    print(f"\nvs {baseline['meta'].get('commit') or 'baseline'} (tolerance {tolerance:.0%})")
+    bad = False
+    for name, modes in current["results"].items():
+        for mode, r in modes.items():
+            b = baseline["results"].get(name, {}).get(mode)
+            if not b or not b.get("p95_ms") or not r.get("p95_ms"):
+                continue
+            delta = r["p95_ms"] / b["p95_ms"] - 1
+            flag = ""
+            if delta > tolerance:
+                flag, bad = "REGRESSION", True
+            elif delta < -tolerance:
+                flag = "faster"
+            print(f"{name:22s} {mode:10s} p95 {b['p95_ms']:8.2f} -> {r['p95_ms']:8.2f}ms  {delta:+7.1%}  {flag}")
+    return bad
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=float, default=1.0, help="BASE_SIZES ko'paytuvchisi")
+    ap.add_argument("--db", help="sintetik baza fayli (saqlanadi va qayta ishlatiladi)")
+    ap.add_argument("--split", action="store_true", help="katalog + hot bazalar")
+    ap.add_argument("--ops", help="vergul bilan: faqat shu metodlar")
+    ap.add_argument("--iterations", type=int, default=2000)
+    ap.add_argument("--heavy-iterations", type=int, default=5)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", help="natijani JSON faylga yozish")
+    ap.add_argument("--compare", help="baseline JSON")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            sys.exit(1 if compare(result, json.load(f), args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Butun bot bo'yicha oflayn end-to-end yuklama testi.
+
+bot.py dispatcher i haqiqiy long polling bilan ishga tushadi, lekin Telegram o'rniga
+benchmarks/fake_bot_api.py dagi lokal soxta Bot API ga ulanadi (kechikish, jitter, 429).
+Yuklamalar:
+  - start_storm: ko'p yangi foydalanuvchi birdaniga /start bosadi
+  - codes:       virtual foydalanuvchilar ketma-ket kino/serial kodi yuboradi
+  - serial:      serial qismlari bo'ylab "Keyingi/Oldingi" tugmalari
+  - broadcast:   admin barcha foydalanuvchilarga xabar tarqatadi
+
+    python benchmarks/bench_e2e.py [--workloads start_storm,codes,serial,broadcast]
+                                   [--latency-ms 30] [--flood-rate 0.0] [--json out.json]
+                                   [--compare baseline.json --tolerance 0.25]
+
+Kechikish: update soxta serverga qo'yilgandan o'sha chatga birinchi javob kelguncha.
+Natijalar seed bo'yicha takrorlanadi. --compare da p95 yoki throughput tolerance dan
+ko'p yomonlashsa exit code 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("ADMIN_ID", "1")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+import bot  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+WORKLOADS = ("start_storm", "codes", "serial", "broadcast")
+USER_BASE = 10_000_000
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Updates:
+    """Telegram update JSON larini yasaydi (update_id ni FakeBotAPI.push beradi)."""
+
+    def __init__(self):
+        self.message_id = 0
+
+    def _user(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": "Bench", "username": f"user{uid}"}
+
+    def message(self, uid: int, text: str) -> dict:
+        self.message_id += 1
+        msg = {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": self._user(uid),
+            "text": text,
+        }
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"message": msg}
+
+    def callback(self, uid: int, data: str) -> dict:
+        self.message_id += 1
+        return {"callback_query": {
+            "id": "",
+            "from": self._user(uid),
+            "chat_instance": str(uid),
+            "data": data,
+            "message": {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"},
+                "from": {"id": 123456, "is_bot": True, "first_name": "Bench"},
+                "text": "...",
+            },
+        }}
+
+
+async def seed_catalog(movies: int, serials: int, parts: int):
+    contents = [
+        {"file_id": f"movie_{i}", "title": f"Kino {i}", "description": "tavsif", "content_type": "movie"}
+        for i in range(movies)
+    ]
+    contents += [
+        {"file_id": f"serial_{i}", "title": f"Serial {i}", "description": "tavsif", "content_type": "serial"}
+        for i in range(serials)
+    ]
+    ids = await bot.db.bulk_ingest(contents, [], bot.ADMIN_ID)
+    serial_ids = ids[movies:]
+    part_rows = [(sid, n, f"part_{sid}_{n}", f"{n}-qism") for sid in serial_ids for n in range(1, parts + 1)]
+    await bot.db.bulk_ingest([], part_rows, bot.ADMIN_ID)
+    return ids[:movies], serial_ids
+
+
+# ---------- workloads ----------
+async def start_storm(api: FakeBotAPI, upd: Updates, args, rnd: random.Random) -> int:
+    """N ta yangi foydalanuvchi /start; --rate > 0 bo'lsa sekundiga shuncha, aks holda birdaniga."""
+    chats = []
+    for i in range(args.storm_users):
+        uid = USER_BASE + i
+        api.push(upd.message(uid, "/start"), uid, "start_storm")
+        chats.append(uid)
+        if args.rate:
+            await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*(api.wait_idle(uid, args.timeout) for uid in chats))
+    return len(chats)
+
+
+async def closed_loop(api: FakeBotAPI, args, rnd: random.Random, name: str, make_update) -> int:
+    """Har bir virtual foydalanuvchi javobni kutib, "o'ylab" keyin keyingi so'rovni yuboradi."""
+    sent = 0
+
+    async def user(uid: int, urnd: random.Random):
+        nonlocal sent
+        for _ in range(args.requests):
+            api.push(make_update(uid, urnd), uid, name)
+            sent += 1
+            if not await api.wait_idle(uid, args.timeout):
+                return
+            await asyncio.sleep(urnd.uniform(0, 2 * args.think_ms) / 1000)
+
+    await asyncio.gather(*(
+        user(USER_BASE + i, random.Random(rnd.random())) for i in range(args.users)
+    ))
+    return sent
+
+
+async def codes(api, upd, args, rnd, movie_ids, serial_ids):
+    pool = movie_ids * 4 + serial_ids  # kinolar ko'proq so'raladi
+    return await closed_loop(api, args, rnd, "codes", lambda uid, r: upd.message(uid, str(r.choice(pool))))
+
+
+async def serial(api, upd, args, rnd, movie_ids, serial_ids):
+    def make(uid, r):
+        return upd.callback(uid, f"serial_{r.choice(serial_ids)}_{r.randint(1, args.parts)}")
+    return await closed_loop(api, args, rnd, "serial", make)
+
+
+async def broadcast(api, upd, args, rnd) -> int:
+    """Admin: "broadcast" tugmasi, keyin xabar. Hamma copyMessage yetib borguncha kutiladi."""
+    admin = bot.ADMIN_ID
+    expected = len(await bot.db.get_all_users())
+    before = api.calls["copyMessage"]
+    api.push(upd.callback(admin, "broadcast"), admin, "broadcast")
+    await api.wait_idle(admin, args.timeout)
+    api.push(upd.message(admin, "Yangi kino chiqdi!"), admin, "broadcast")
+    t0 = time.perf_counter()
+    deadline = t0 + args.timeout + expected * 0.1
+    while api.calls["copyMessage"] - before < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    copies = api.calls["copyMessage"] - before
+    elapsed = time.perf_counter() - t0
+    print(f"  broadcast: {copies}/{expected} copyMessage in {elapsed:.1f}s -> {copies / elapsed:.1f} msg/s")
+    return 2
+
+
+# ---------- runner ----------
+async def run_workload(name: str, api: FakeBotAPI, upd: Updates, args, movie_ids, serial_ids) -> dict:
+    rnd = random.Random(f"{args.seed}:{name}")
+    t0 = time.perf_counter()
+    if name == "start_storm":
+        sent = await start_storm(api, upd, args, rnd)
+    elif name == "codes":
+        sent = await codes(api, upd, args, rnd, movie_ids, serial_ids)
+    elif name == "serial":
+        sent = await serial(api, upd, args, rnd, movie_ids, serial_ids)
+    else:
+        sent = await broadcast(api, upd, args, rnd)
+    elapsed = time.perf_counter() - t0
+
+    lat = api.latencies.get(name, [])
+    done = len(lat)
+    result = {
+        "updates": sent,
+        "completed": done,
+        "failed": sent - done,
+        "seconds": round(elapsed, 3),
+        "throughput": round(done / elapsed, 2) if elapsed else 0.0,
+    }
+    for p in (50, 95, 99):
+        result[f"p{p}_ms"] = round(pct(lat, p), 2) if lat else None
+    return result
+
+
+async def run(args) -> dict:
+    tmp = tempfile.mkdtemp()
+    bot.TRACE_FILE = ""
+    bot.db = bot.DatabaseManager(
+        os.path.join(tmp, "catalog.db"), os.path.join(tmp, "hot.db") if args.split else None
+    )
+    await bot.db.init_db()
+    await bot.db.load_known_users()
+    movie_ids, serial_ids = await seed_catalog(args.movies, args.serials, args.parts)
+    if args.channels:
+        for i in range(args.channels):
+            await bot.db.add_channel(-1001000000000 - i, f"Kanal {i}", f"bench_channel_{i}", "")
+
+    api = FakeBotAPI(args.latency_ms, args.jitter_ms, args.flood_rate, args.subscribed, args.seed)
+    base_url = await api.start()
+    session = bot.configure_api_session(
+        bot.PooledAiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    )
+    bot.bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    polling = asyncio.create_task(bot.dp.start_polling(bot.bot, handle_signals=False, polling_timeout=1))
+
+    upd = Updates()
+    results = {}
+    try:
+        for name in args.workloads:
+            results[name] = await run_workload(name, api, upd, args, movie_ids, serial_ids)
+    finally:
+        await bot.dp.stop_polling()
+        await polling
+        await session.close()
+        await api.stop()
+        await bot.db.flush_download_counts()
+        await bot.db.close()
+
+    print(f"\nlatency={args.latency_ms}ms±{args.jitter_ms}  flood={args.flood_rate}  subscribed={args.subscribed}  "
+          f"floods={api.floods}")
+    print(f"{'workload':12s} {'updates':>7s} {'done':>6s} {'failed':>6s} {'upd/s':>8s} "
+          f"{'p50':>8s} {'p95':>8s} {'p99':>8s}")
+    for name, r in results.items():
+        fmt = lambda v: f"{v:7.1f}ms" if v is not None else "       -"  # noqa: E731
+        print(f"{name:12s} {r['updates']:7d} {r['completed']:6d} {r['failed']:6d} {r['throughput']:8.1f} "
+              f"{fmt(r['p50_ms'])} {fmt(r['p95_ms'])} {fmt(r['p99_ms'])}")
+    print("api calls: " + ", ".join(f"{m}={n}" for m, n in api.calls.most_common()))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """True — regressiya bor."""
+    bad = False
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b:
+            continue
+        if b.get("p95_ms") and r.get("p95_ms") and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            print(f"REGRESSION {name}: p95 {b['p95_ms']}ms -> {r['p95_ms']}ms")
+            bad = True
+        if b.get("throughput") and r["throughput"] < b["throughput"] * (1 - tolerance):
+            print(f"REGRESSION {name}: throughput {b['throughput']} -> {r['throughput']} upd/s")
+            bad = True
+        if r["failed"] > b.get("failed", 0):
+            print(f"REGRESSION {name}: failed {b.get('failed', 0)} -> {r['failed']}")
+            bad = True
+    return bad
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workloads", default=",".join(WORKLOADS))
+    ap.add_argument("--storm-users", type=int, default=1000)
+    ap.add_argument("--rate", type=float, default=0.0, help="start_storm: update/s (0 = birdaniga)")
+    ap.add_argument("--users", type=int, default=100, help="codes/serial: virtual foydalanuvchilar")
+    ap.add_argument("--requests", type=int, default=10, help="har bir virtual foydalanuvchi so'rovlari")
+    ap.add_argument("--think-ms", type=float, default=200.0)
+    ap.add_argument("--movies", type=int, default=2000)
+    ap.add_argument("--serials", type=int, default=200)
+    ap.add_argument("--parts", type=int, default=12)
+    ap.add_argument("--channels", type=int, default=1)
+    ap.add_argument("--latency-ms", type=float, default=30.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--flood-rate", type=float, default=0.0)
+    ap.add_argument("--subscribed", type=float, default=1.0, help="obuna bo'lganlar ulushi")
+    ap.add_argument("--timeout", type=float, default=15.0, help="bitta javobni kutish chegarasi, s")
+    ap.add_argument("--split", action="store_true", help="katalog + hot bazalar")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", help="natijalarni faylga yozish (keyingi --compare uchun baseline)")
+    ap.add_argument("--compare", help="baseline JSON fayl")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args()
+    args.workloads = [w.strip() for w in args.workloads.split(",") if w.strip()]
+    for w in args.workloads:
+        if w not in WORKLOADS:
+            ap.error(f"noma'lum workload: {w}")
+
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            sys.exit(1 if compare(results, json.load(f), args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Katalog keshining xotira benchmarki.
+
+--serials x --parts (standart 2000 x 50 = 100k qism) sintetik katalog yaratadi, barcha
+seriallarni get_content + get_serial_parts orqali keshga yuklaydi va keshda qolgan xotirani
+(tracemalloc) o'lchaydi. Taqqoslash uchun xuddi shu qatorlar eski ko'rinishda — har qatorga
+dict — qancha joy olishi ham hisoblanadi (satrlar umumiy, farq faqat qator konteynerida).
+
+    python benchmarks/bench_memory.py [--serials 2000] [--parts 50] [--budget-mb 25]
+
+Kesh xotirasi --budget-mb dan oshsa exit code 1.
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("ADMIN_ID", "1")
+
+import bot  # noqa: E402
+
+
+def build_catalog(path: str, serials: int, parts: int) -> None:
+    con = sqlite3.connect(path)
+    con.executemany(
+        "INSERT INTO content (id, file_id, title, description, content_type, added_by, added_at, downloads_count) "
+        "VALUES (?, '', ?, ?, 'serial', 1, '2024-01-01T00:00:00+00:00', 0)",
+        ((sid, f"Serial {sid}", "tavsif " * 10) for sid in range(1, serials + 1)),
+    )
+    con.executemany(
+        "INSERT INTO serial_parts (serial_id, part_number, file_id, title, added_by, added_at) "
+        "VALUES (?, ?, ?, ?, 1, '2024-01-01T00:00:00+00:00')",
+        ((sid, n, f"BAACAgIAAxkBAAI{sid:08d}{n:04d}", f"{n}-qism")
+         for sid in range(1, serials + 1) for n in range(1, parts + 1)),
+    )
+    con.commit()
+    con.close()
+
+
+def traced() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def run(args) -> int:
+    path = os.path.join(tempfile.mkdtemp(), "bench_memory.db")
+    db = bot.DatabaseManager(path)
+    await db.init_db()
+    build_catalog(path, args.serials, args.parts)
+    # butun katalog keshga sig'sin va o'lchov davomida eskirmasin
+    db.content_cache = bot.LRUCache(maxsize=args.serials + 1)
+    db.parts_cache = bot.LRUCache(maxsize=args.serials + 1)
+    ids = range(1, args.serials + 1)
+
+    tracemalloc.start()
+    before = traced()
+    t0 = time.perf_counter()
+    for sid in ids:
+        await db.get_content(sid)
+        await db.get_serial_parts(sid)
+    load_s = time.perf_counter() - t0
+    cached = traced() - before
+
+    # eski ko'rinish: o'sha qatorlar dict sifatida (satrlar umumiy — farq faqat konteynerda)
+    contents = [await db.get_content(sid) for sid in ids]
+    part_lists = [await db.get_serial_parts(sid) for sid in ids]
+    tracemalloc.stop()
+    rows = contents + [p for parts in part_lists for p in parts]
+    tuple_bytes = sum(sys.getsizeof(r) for r in rows)
+    dict_bytes = sum(sys.getsizeof(r._asdict()) for r in rows)
+
+    total_parts = sum(len(p) for p in part_lists)
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for sid in ids:
+            await db.get_serial_parts(sid)
+    warm_us = (time.perf_counter() - t0) / (args.rounds * len(ids)) * 1e6
+    await db.close()
+
+    mb = cached / 1048576
+    over = mb > args.budget_mb
+    print(f"catalog: {len(ids)} serials, {total_parts} parts, loaded in {load_s:.1f}s")
+    print(f"cache     {mb:7.1f}MB  ({cached / total_parts:.0f} B/part incl. strings and LRU entries)")
+    print(f"rows      tuples {tuple_bytes / 1048576:.1f}MB vs dicts {dict_bytes / 1048576:.1f}MB "
+          f"({dict_bytes / tuple_bytes:.1f}x); same cache with dict rows ~{(cached - tuple_bytes + dict_bytes) / 1048576:.1f}MB")
+    print(f"warm get_serial_parts {warm_us:.2f}us/call")
+    print(f"budget {args.budget_mb:g}MB {'OVER BUDGET' if over else 'ok'}")
+    return 1 if over else 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--serials", type=int, default=2000)
+    ap.add_argument("--parts", type=int, default=50)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--budget-mb", type=float, default=25.0)
+    sys.exit(asyncio.run(run(ap.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+FTS5 qidiruv benchmarki.
+
+100k sarlavhali sintetik katalog yaratadi va DatabaseManager.search_content()
+kechikishini o'lchaydi (prefix, ko'p so'zli, kirill, xato yozilgan so'rovlar va
+inline rejimdagi qisqa/keng prefikslar — eng og'ir holat).
+
+    python benchmarks/bench_search.py [--titles 100000] [--budget-ms 10]
+
+Budjetdan oshsa exit code 1.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("ADMIN_ID", "1")
+
+import bot  # noqa: E402
+
+WORDS = (
+    "qasoskorlar interstellar o'rgimchak odam temir yulduzlar urushi qirol sher "
+    "tungi shahar sirli orol oxirgi samuray qora pantera muzlik davri kapitan "
+    "amerika matritsa terminator gladiator avatar titanik joker batman supermen "
+    "ko'k dengiz qaroqchilari tez va g'azabli jurassic dunyo oltin o'g'ri "
+    "mahalla yigitlari sevgi qissasi baxt kaliti ona yurt g'alaba kuni"
+).split()
+
+QUERIES = {
+    "prefix": ["inter", "qasos", "terminat", "gladi", "yulduz", "batm"],
+    "multi": ["temir odam", "qora pantera", "oxirgi samuray", "sirli orol"],
+    "cyrillic": ["Интерстеллар", "Қасоскорлар", "Ғалаба куни", "Ўргимчак одам"],
+    "typo": ["intersteler", "gladiatr", "terminatr", "matrisa"],
+    # inline rejimda har harfdan keyin so'rov ketadi: qisqa va keng prefikslar eng og'ir holat
+    "broad": ["ba", "bo", "ma", "sa ba", "baba", "qo"],
+}
+
+
+SYLLABLES = "ba bo qa qo sa sho cha ka ki ma mo na ni ra ro ta to ya yo za gu lu du xa".split()
+
+
+def make_vocab(rnd: random.Random, size: int):
+    vocab = set()
+    while len(vocab) < size:
+        vocab.add("".join(rnd.choices(SYLLABLES, k=rnd.randint(2, 4))))
+    return sorted(vocab)
+
+
+def build_catalog(path: str, n: int, seed: int = 42) -> None:
+    """
+    Haqiqiy katalogga o'xshash taqsimot: so'zlar Zipf bo'yicha tanlanadi,
+    WORDS dagi taniqli nomlar esa sarlavhalarning ~2% ida uchraydi.
+    """
+    rnd = random.Random(seed)
+    vocab = make_vocab(rnd, 30_000)
+    cum, acc = [], 0.0
+    for i in range(len(vocab)):
+        acc += 1 / (i + 1)
+        cum.append(acc)
+    con = sqlite3.connect(path)
+    rows = []
+    for i in range(n):
+        words = rnd.choices(vocab, cum_weights=cum, k=rnd.randint(1, 4))
+        if rnd.random() < 0.02:
+            words.insert(0, rnd.choice(WORDS))
+        title = " ".join(words).title()
+        desc = " ".join(rnd.choices(vocab, cum_weights=cum, k=rnd.randint(4, 12)))
+        ctype = "serial" if i % 5 == 0 else "movie"
+        rows.append((f"file_{i}", title, desc, ctype, 1, "2024-01-01T00:00:00+00:00", rnd.randint(0, 5000)))
+    con.executemany(
+        "INSERT INTO content (file_id, title, description, content_type, added_by, added_at, downloads_count) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    con.commit()
+    con.close()
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def run(args) -> int:
+    path = os.path.join(tempfile.mkdtemp(), "bench_search.db")
+    db = bot.DatabaseManager(path)
+    await db.init_db()
+
+    t0 = time.perf_counter()
+    build_catalog(path, args.titles)
+    await db.rebuild_search_index()
+    print(f"catalog: {args.titles} titles, indexed in {time.perf_counter() - t0:.1f}s")
+
+    failed = False
+    for name, queries in QUERIES.items():
+        for q in queries:  # warm-up
+            await db.search_content(q)
+        samples = []
+        for _ in range(args.rounds):
+            for q in queries:
+                t = time.perf_counter()
+                await db.search_content(q)
+                samples.append((time.perf_counter() - t) * 1000)
+        p50, p95, p99 = pct(samples, 50), pct(samples, 95), pct(samples, 99)
+        over = p95 > args.budget_ms
+        failed |= over
+        print(
+            f"{name:9s} n={len(samples):4d}  p50={p50:6.2f}ms  p95={p95:6.2f}ms  "
+            f"p99={p99:6.2f}ms  mean={statistics.mean(samples):6.2f}ms  {'OVER BUDGET' if over else 'ok'}"
+        )
+    return 1 if failed else 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--titles", type=int, default=100_000)
+    ap.add_argument("--rounds", type=int, default=50)
+    ap.add_argument("--budget-ms", type=float, default=10.0)
+    sys.exit(asyncio.run(run(ap.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Bitta fayl va bo'lingan (katalog + hot) baza joylashuvini aralash yukda solishtiradi.
+
+Bir vaqtda ishlaydi:
+  - hot yozuvlar: update_user_activity, register_download, save_join_request
+  - admin katalog yozuvlari: add_content, add_serial_part
+  - o'qishlar: get_content
+
+    python benchmarks/bench_split_db.py [--seconds 10] [--users 50] [--catalog 5000]
+
+Har bir rejim uchun umumiy throughput va har bir amal sinfi bo'yicha p50/p99 chiqadi.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("ADMIN_ID", "1")
+
+import bot  # noqa: E402
+
+
+class FakeUser:
+    def __init__(self, uid: int):
+        self.id = uid
+        self.username = f"user{uid}"
+        self.first_name = "Bench"
+        self.last_name = None
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def timed(samples, name, coro):
+    t = time.perf_counter()
+    await coro
+    samples[name].append((time.perf_counter() - t) * 1000)
+
+
+async def prepare(db: bot.DatabaseManager, catalog: int, users: int):
+    await db.init_db()
+    ids = []
+    for i in range(catalog):
+        ids.append(await db.add_content(f"file_{i}", f"Kino {i}", "tavsif", "serial" if i % 10 == 0 else "movie", 1))
+    for uid in range(1, users + 1):
+        await db.add_user(FakeUser(uid))
+    return ids
+
+
+async def user_worker(db, uid, ids, deadline, samples, rnd):
+    while time.perf_counter() < deadline:
+        cid = rnd.choice(ids)
+        await timed(samples, "read:get_content", db.get_content(cid))
+        await timed(samples, "hot:activity", db.update_user_activity(uid))
+        await timed(samples, "hot:download", db.register_download(cid, uid))
+        if rnd.random() < 0.1:
+            await timed(samples, "hot:join_request", db.save_join_request(-100, uid))
+
+
+async def admin_worker(db, ids, deadline, samples, rnd):
+    part = 1
+    serials = [i for n, i in enumerate(ids) if n % 10 == 0]
+    while time.perf_counter() < deadline:
+        if rnd.random() < 0.5:
+            await timed(samples, "catalog:add_content", db.add_content("f_new", "Yangi kino", "", "movie", 1))
+        else:
+            part += 1
+            await timed(samples, "catalog:add_part", db.add_serial_part(rnd.choice(serials), part, "f_part", "qism", 1))
+        await asyncio.sleep(0.005)
+
+
+async def run_mode(name: str, split: bool, args) -> None:
+    tmp = tempfile.mkdtemp()
+    db = bot.DatabaseManager(os.path.join(tmp, "catalog.db"), os.path.join(tmp, "hot.db") if split else None)
+    ids = await prepare(db, args.catalog, args.users)
+
+    samples = defaultdict(list)
+    rnd = random.Random(7)
+    deadline = time.perf_counter() + args.seconds
+    t0 = time.perf_counter()
+    tasks = [user_worker(db, uid, ids, deadline, samples, random.Random(uid)) for uid in range(1, args.users + 1)]
+    tasks += [admin_worker(db, ids, deadline, samples, rnd) for _ in range(args.admins)]
+    await asyncio.gather(*tasks)
+    await db.flush_download_counts()
+    elapsed = time.perf_counter() - t0
+
+    total = sum(len(v) for v in samples.values())
+    print(f"\n[{name}] {total} ops in {elapsed:.1f}s -> {total / elapsed:.0f} ops/s")
+    for op in sorted(samples):
+        v = samples[op]
+        print(f"  {op:22s} n={len(v):6d}  p50={pct(v, 50):7.2f}ms  p99={pct(v, 99):7.2f}ms")
+
+
+async def run(args) -> None:
+    await run_mode("single", False, args)
+    await run_mode("split", True, args)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--admins", type=int, default=2)
+    ap.add_argument("--catalog", type=int, default=5000)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
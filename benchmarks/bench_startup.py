@@ -0,0 +1,114 @@
+"""
+Ishga tushish vaqti: importlar, sxema tekshiruvi va prewarm (bot.startup()).
+
+bench_db.py dagi sintetik bazani yaratadi (yoki --db dan qayta ishlatadi), keyin har bir
+o'lchov uchun yangi python jarayonida `import bot` + `await bot.startup()` ni ishga tushiradi.
+Birinchi jarayon user_version=0 bilan (to'liq DDL yo'li), qolgan --runs tasi tezkor yo'l.
+
+    python benchmarks/bench_startup.py [--scale 0.1] [--db /tmp/prod.db] [--runs 5]
+                                       [--budget-ms 250] [--import-budget-ms 5000]
+
+Tezkor yo'lning (schema + prewarm) mediani --budget-ms dan (standart bot.STARTUP_BUDGET_MS)
+yoki import mediani --import-budget-ms dan oshsa exit code 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("ADMIN_ID", "1")
+
+
+def child() -> None:
+    """Alohida jarayon: DB_PATH / HOT_DB_PATH muhitdan olinadi."""
+    import bot
+
+    timings = asyncio.run(bot.startup())
+    asyncio.run(bot.db.close())
+    print(json.dumps(timings))
+
+
+def run_child(args) -> dict:
+    env = dict(os.environ, DB_PATH=args.db_path, HOT_DB_PATH=args.hot_path or "", TRACE_FILE="", LOG_LEVEL="WARNING")
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--scale", type=float, default=0.1, help="bench_db.BASE_SIZES ko'paytuvchisi")
+    ap.add_argument("--db", help="sintetik baza fayli (saqlanadi va qayta ishlatiladi)")
+    ap.add_argument("--split", action="store_true")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget-ms", type=float)
+    ap.add_argument("--import-budget-ms", type=float, default=5000.0)
+    args = ap.parse_args()
+    if args.child:
+        child()
+        return
+
+    import bot
+    from bench_db import BASE_SIZES, SERIAL_EVERY, open_db
+
+    budget = args.budget_ms if args.budget_ms is not None else bot.STARTUP_BUDGET_MS
+    sizes = {k: max(1, int(v * args.scale)) for k, v in BASE_SIZES.items()}
+    sizes["content"] = max(sizes["content"], SERIAL_EVERY)
+
+    if args.db:
+        os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+
+    async def prepare():
+        db = await open_db(args, sizes)
+        await db.close()
+        return db
+
+    db = asyncio.run(prepare())
+    args.db_path = db.db_path
+    args.hot_path = db.hot_db_path if db.split else None
+
+    # 1) to'liq DDL yo'li
+    for path in db.files:
+        con = sqlite3.connect(path)
+        con.execute("PRAGMA user_version = 0")
+        con.close()
+    t0 = time.perf_counter()
+    full = run_child(args)
+    print(f"full DDL : schema={full['schema'] * 1000:7.1f}ms  prewarm={full['prewarm'] * 1000:6.1f}ms  "
+          f"process={(time.perf_counter() - t0) * 1000:6.0f}ms")
+
+    # 2) tezkor yo'l
+    runs = []
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        r = run_child(args)
+        r["process"] = time.perf_counter() - t0
+        runs.append(r)
+
+    def med(key):
+        return statistics.median(r[key] for r in runs) * 1000
+
+    for key in ("imports", "module", "schema", "prewarm", "total", "process"):
+        values = [r[key] * 1000 for r in runs]
+        print(f"{key:8s} median={med(key):8.1f}ms  min={min(values):8.1f}ms  max={max(values):8.1f}ms")
+
+    db_ms = med("schema") + med("prewarm")
+    over = db_ms > budget
+    import_over = med("imports") > args.import_budget_ms
+    print(f"schema+prewarm {db_ms:.1f}ms (budget {budget:g}ms) {'OVER BUDGET' if over else 'ok'}")
+    print(f"imports {med('imports'):.0f}ms (budget {args.import_budget_ms:g}ms) {'OVER BUDGET' if import_over else 'ok'}")
+    sys.exit(1 if over or import_over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Lokal soxta Telegram Bot API serveri (aiohttp) — bot.py ni haqiqiy Telegramsiz yuklama testi uchun.
+
+Qo'llab-quvvatlanadi: getMe, getUpdates (long polling), getChatMember, sendMessage, sendVideo,
+copyMessage, editMessageText, answerCallbackQuery, deleteMessage; qolganlari umumiy muvaffaqiyat.
+Har bir chiquvchi chaqiruvga sozlanadigan kechikish (+ jitter) va ehtimol bilan 429 (flood) qo'shiladi.
+
+Kechikish o'lchovi: update navbatga qo'yilgan paytdan o'sha chatga birinchi javob (send*/edit*/
+copy/answerCallbackQuery) qaytguncha. Har bir chatda bir vaqtda ko'pi bilan bitta "kutilayotgan"
+update bo'ladi (workload generatorlar shunga rioya qiladi), ortiqcha javoblar hisobga olinmaydi.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+# javobi Message bo'lgan metodlar; qolganlari True qaytaradi
+MESSAGE_METHODS = {"sendMessage", "sendVideo", "sendDocument", "sendPhoto", "editMessageText", "editMessageReplyMarkup"}
+# foydalanuvchi javob sifatida ko'radigan metodlar
+RESPONSE_METHODS = MESSAGE_METHODS | {"copyMessage", "answerCallbackQuery"}
+FLOOD_METHODS = {"sendMessage", "sendVideo", "copyMessage"}
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        latency_ms: float = 30.0,
+        jitter_ms: float = 10.0,
+        flood_rate: float = 0.0,
+        subscribed_ratio: float = 1.0,
+        seed: int = 1,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.flood_rate = flood_rate
+        self.subscribed_ratio = subscribed_ratio
+        self.rnd = random.Random(seed)
+
+        self._updates: deque = deque()
+        self._new_updates = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1_000_000)
+        self._pending: Dict[int, deque] = defaultdict(deque)      # chat_id -> (t0, workload, callback_id)
+        self._callbacks: Dict[str, int] = {}                       # callback_query_id -> chat_id
+        self._idle: Dict[int, asyncio.Event] = {}                  # chat_id -> javob kutilmayapti
+        self._runner: Optional[web.AppRunner] = None
+
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.calls: Counter = Counter()
+        self.floods = 0
+        self.completed_at = 0.0
+
+    # ---------- server ----------
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    # ---------- workload ----------
+    def push(self, update: Dict, chat_id: int, workload: str) -> None:
+        """
+        Update ni getUpdates navbatiga qo'yadi (update_id shu yerda beriladi — navbat tartibli
+        bo'lishi uchun) va javob kechikishini o'lchashni boshlaydi.
+        """
+        update["update_id"] = next(self._update_ids)
+        callback_id = None
+        if "callback_query" in update:
+            callback_id = update["callback_query"]["id"] = str(update["update_id"])
+            self._callbacks[callback_id] = chat_id
+        self._pending[chat_id].append((time.perf_counter(), workload, callback_id))
+        self._idle.setdefault(chat_id, asyncio.Event()).clear()
+        self._updates.append(update)
+        self._new_updates.set()
+
+    async def wait_idle(self, chat_id: int, timeout: float) -> bool:
+        """Chatdagi barcha update larga javob kelguncha kutadi; timeout bo'lsa False."""
+        event = self._idle.get(chat_id)
+        if event is None:
+            return True
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def outstanding(self) -> int:
+        return sum(len(q) for q in self._pending.values())
+
+    def is_subscribed(self, user_id: int) -> bool:
+        # deterministik: bir xil user har doim bir xil natija
+        return (user_id * 2654435761 % 1000) / 1000 < self.subscribed_ratio
+
+    # ---------- handlers ----------
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        form = dict(await request.post())
+        self.calls[method] += 1
+
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(form))
+        if method == "getMe":
+            return self._ok(BOT_USER)
+
+        delay = max(0.0, self.latency_ms + self.rnd.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+        if method in FLOOD_METHODS and self.flood_rate and self.rnd.random() < self.flood_rate:
+            self.floods += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": "Too Many Requests: retry after 1", "parameters": {"retry_after": 1},
+            })
+
+        if method == "answerCallbackQuery":
+            callback_id = form.get("callback_query_id")
+            chat_id = self._callbacks.pop(callback_id, None)
+            if chat_id is not None:
+                self._complete(chat_id, callback_id)
+        else:
+            chat_id = int(form["chat_id"]) if form.get("chat_id") else None
+            if method in RESPONSE_METHODS and chat_id is not None:
+                self._complete(chat_id)
+
+        if method == "getChatMember":
+            user_id = int(form["user_id"])
+            status = "member" if self.is_subscribed(user_id) else "left"
+            return self._ok({"status": status, "user": {"id": user_id, "is_bot": False, "first_name": "U"}})
+        if method == "copyMessage":
+            return self._ok({"message_id": next(self._message_ids)})
+        if method in MESSAGE_METHODS:
+            return self._ok({
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id or 0, "type": "private"},
+                "from": BOT_USER,
+                "text": form.get("text", ""),
+            })
+        return self._ok(True)
+
+    async def _get_updates(self, form: Dict) -> List[Dict]:
+        offset = int(form.get("offset") or 0)
+        limit = int(form.get("limit") or 100)
+        timeout = float(form.get("timeout") or 0)
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), min(timeout, 1.0))
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._updates, limit))
+
+    def _complete(self, chat_id: int, callback_id: Optional[str] = None) -> None:
+        """
+        Chatdagi eng eski kutilayotgan update ni yopadi. answerCallbackQuery faqat o'z
+        callback ini yopadi — kechikib kelgan javob keyingi update ni yopib qo'ymasin.
+        """
+        queue = self._pending.get(chat_id)
+        if not queue or (callback_id is not None and queue[0][2] != callback_id):
+            return
+        t0, workload, _ = queue.popleft()
+        if not queue:
+            self._idle[chat_id].set()
+        now = time.perf_counter()
+        self.latencies[workload].append((now - t0) * 1000)
+        self.completed_at = now
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.Response(text=json.dumps({"ok": True, "result": result}), content_type="application/json")
@@ -1,52 +1,381 @@
 # bot.py (FINAL)
 import os
+import re
+import csv
+import json
+import random
+import pathlib
+import sys
+import sqlite3
+import time
+import signal
 import asyncio
+import threading
+import inspect
+import contextvars
+import functools
+import hashlib
+import tempfile
+import queue
+import atexit
 import logging
+import logging.handlers
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from contextlib import aclosing, asynccontextmanager
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Optional, Union
+from typing import TYPE_CHECKING, Any, Callable, Hashable, List, Dict, NamedTuple, Optional, Tuple, Union
 
+# ishga tushish bosqichlari (startup() logga yozadi): uchinchi tomon importlari shu nuqtadan.
+# Faqat kamdan-kam kerak bo'ladigan modullar (aiohttp.web, gzip) ishlatiladigan joyda import qilinadi.
+_BOOT_T0 = time.perf_counter()
+
+import ssl
+
+import aiohttp
 import aiosqlite
+import certifi
 from dotenv import load_dotenv
 
-from aiogram import Bot, Dispatcher, Router, F
+from aiogram import BaseMiddleware, Bot, Dispatcher, Router, F, __version__ as AIOGRAM_VERSION
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramBadRequest, TelegramForbiddenError,
+    TelegramNetworkError, TelegramRetryAfter, TelegramServerError,
+)
+from aiogram.methods import GetUpdates
 from aiogram.types import (
     Message, CallbackQuery,
     InlineKeyboardMarkup, InlineKeyboardButton,
-    ChatJoinRequest,
+    ChatJoinRequest, InlineQuery, ChosenInlineResult,
+    InlineQueryResultCachedVideo, InlineQueryResultsButton, FSInputFile,
 )
-from aiogram.filters import Command, CommandStart
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 
+if TYPE_CHECKING:
+    from aiohttp import web
+
+_IMPORTS_DONE = time.perf_counter()
+
 # ===================== CONFIG =====================
 load_dotenv()
 
 TOKEN = os.getenv("BOT_TOKEN", "").strip()
 DB_PATH = os.getenv("DB_PATH", "bot_data.db").strip()
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+# ixtiyoriy: tez-tez yoziladigan jadvallar uchun alohida fayl (users, activity, downloads, join requests).
+# Bo'sh bo'lsa hammasi DB_PATH da. Mavjud bazani bo'lish: python bot.py --split-db
+HOT_DB_PATH = os.getenv("HOT_DB_PATH", "").strip()
+
+# DB maintenance (retention)
+ACTIVITY_RETENTION_DAYS = int(os.getenv("ACTIVITY_RETENTION_DAYS", "90"))
+JOIN_REQUEST_TTL_DAYS = int(os.getenv("JOIN_REQUEST_TTL_DAYS", "30"))
+MAINTENANCE_INTERVAL = int(os.getenv("MAINTENANCE_INTERVAL", "3600"))
+# eski (auto_vacuum=NONE) bazani INCREMENTAL ga o'tkazish uchun bir martalik to'liq VACUUM kerak
+DB_VACUUM_CONVERT = os.getenv("DB_VACUUM_CONVERT", "0") == "1"
+
+# Onlayn backup (snapshotlar BACKUP_DIR ga; BACKUP_INTERVAL=0 — rejali backup o'chirilgan, /backup ishlayveradi)
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups").strip()
+BACKUP_INTERVAL = int(os.getenv("BACKUP_INTERVAL", "21600"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+
+# Prometheus metrikalari: http://METRICS_HOST:METRICS_PORT/metrics (0 — HTTP o'chirilgan, yig'ish ishlayveradi)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip()
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Trace (har bir update uchun spanlar): sekin (TRACE_SLOW_MS dan uzun) va xatoli update lar doim,
+# qolganlari TRACE_SAMPLE_RATE ulushda yoziladi. TRACE_FILE bo'sh — o'chirilgan. Xulosa: python bot.py --trace-summary
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl").strip()
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+
+# /profile <sekund> va `kill -USR1 <pid>` natijalari shu papkaga yoziladi
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles").strip()
+
+# Loglar: LOG_FORMAT=json (bir qatorda bitta JSON) yoki text; LOG_FILE bo'sh — stderr.
+# Bir xil WARNING/ERROR xabarlari LOG_SAMPLE_WINDOW sekundda LOG_SAMPLE_BURST tadan ko'p yozilmaydi.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").strip().lower()
+LOG_FILE = os.getenv("LOG_FILE", "").strip()
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+
+# Bot API HTTP ulanishlari: bitta hovuz, keep-alive va DNS kesh (api.telegram.org — bitta host)
+API_POOL_LIMIT = int(os.getenv("API_POOL_LIMIT", "100"))
+API_KEEPALIVE = float(os.getenv("API_KEEPALIVE", "60"))
+API_DNS_TTL = int(os.getenv("API_DNS_TTL", "3600"))
+# Har bir token uchun send*/copy xabarlar tezligi (msg/s) va burst; 0 — cheklanmaydi (429 baribir qayta uriniladi)
+API_SEND_RATE = float(os.getenv("API_SEND_RATE", "0"))
+API_SEND_BURST = int(os.getenv("API_SEND_BURST", "30"))
+
+# Shu jarayonda qo'shimcha (mirror) botlar: katalog (DB_PATH) va keshlar umumiy, har bir botning
+# users / faollik / yuklanishlar / kanallari o'z hot bazasida. Adminlar va instagram havolalari umumiy.
+# MIRROR_BOT_TOKENS="token1,token2=mirror2.db" yoki BOTS_FILE — JSON: [{"token": "...", "hot_db": "..."}]
+# hot_db berilmasa: DB_PATH yonida <nom>_bot<bot_id>.db
+# Eslatma: Bot API bo'yicha file_id botga xos — katalogdagi videolar mirror bot ham yubora oladigan
+# file_id bilan saqlangan bo'lishi kerak.
+MIRROR_BOT_TOKENS = os.getenv("MIRROR_BOT_TOKENS", "").strip()
+BOTS_FILE = os.getenv("BOTS_FILE", "").strip()
 
 if not TOKEN:
     raise ValueError("BOT_TOKEN .env da yo'q!")
 if not ADMIN_ID:
     raise ValueError("ADMIN_ID .env da yo'q yoki 0!")
 
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
+
+# ===================== LOGGING =====================
+# Event loop faqat yozuvni navbatga qo'yadi; formatlash va I/O — QueueListener thread ida.
+# Kontekst (update_id, user_id, handler, trace_id) navbatga qo'yishdan oldin yozuvga ko'chiriladi:
+# ContextVar lar listener thread iga o'tmaydi.
+LOG_QUEUE_SIZE = 10_000
+LOG_SAMPLE_KEYS_MAX = 10_000
+LOG_CONTEXT_FIELDS = ("update_id", "user_id", "handler", "trace_id")
+
+_log_context: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("log_context", default=None)
+_DIGITS_RE = re.compile(r"\d+")
+
+
+class SamplingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler + takrorlanuvchi xatolarni cheklash. Kalit — raqamlari olib tashlangan xabar
+    ("get_chat_member -100123: ..." hammasi bitta kalit). Oyna tugaganda o'tkazib yuborilganlar
+    soni bitta yozuv bilan xabar qilinadi. Navbat to'lsa yozuv tashlanadi (dropped).
+    """
+
+    def __init__(self, q: queue.Queue, window: float, burst: int):
+        super().__init__(q)
+        self.window = window
+        self.burst = burst
+        self.window_start = time.monotonic()
+        self.seen: Dict[Tuple[str, int, str], List] = {}   # kalit -> [yozildi, o'tkazildi, namuna]
+        self.dropped = 0
+        self.suppressed = 0
+
+    def _sample(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+        # emit() Handler.lock ostida chaqiriladi — alohida qulf kerak emas
+        key = (record.name, record.levelno, _DIGITS_RE.sub("#", record.getMessage())[:200])
+        now = time.monotonic()
+        if now - self.window_start >= self.window or len(self.seen) > LOG_SAMPLE_KEYS_MAX:
+            self._flush_suppressed()
+            self.window_start = now
+        entry = self.seen.setdefault(key, [0, 0, record.getMessage()])
+        if entry[0] < self.burst:
+            entry[0] += 1
+            return True
+        entry[1] += 1
+        self.suppressed += 1
+        return False
+
+    def _flush_suppressed(self) -> None:
+        for (name, level, _), (_, skipped, sample) in self.seen.items():
+            if skipped:
+                summary = logging.makeLogRecord({
+                    "name": name, "levelno": level, "levelname": logging.getLevelName(level),
+                    "msg": f"{skipped} ta o'xshash xabar o'tkazib yuborildi ({self.window:g}s): {sample}",
+                    "suppressed": skipped,
+                })
+                self.enqueue(summary)
+        self.seen.clear()
+
+    def flush_expired(self, force: bool = False) -> None:
+        """
+        Oyna tugagan bo'lsa (yoki force) xulosalarni yozadi — xato oqimi to'satdan to'xtasa,
+        keyingi WARNING kelishini kutmasdan. Taymer thread va chiqishdagi atexit chaqiradi.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.seen and (force or now - self.window_start >= self.window):
+                self._flush_suppressed()
+                self.window_start = now
+
+    def run_flusher(self, stop: threading.Event) -> None:
+        while not stop.wait(self.window):
+            self.flush_expired()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # bazaviy prepare traceback ni xabar matniga qo'shib yuboradi — JSON da alohida maydon bo'lsin
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        ctx = _log_context.get()
+        if ctx:
+            for k, v in ctx.items():
+                setattr(record, k, v)
+        span = _current_span.get()
+        if span is not None:
+            record.trace_id = span.trace.id
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._sample(record):
+            super().emit(record)
+
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k in LOG_CONTEXT_FIELDS + ("suppressed",):
+            v = getattr(record, k, None)
+            if v is not None:
+                out[k] = v
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class TextLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        ctx = " ".join(f"{k}={getattr(record, k)}" for k in LOG_CONTEXT_FIELDS if getattr(record, k, None) is not None)
+        return f"{line} [{ctx}]" if ctx else line
+
+
+def setup_logging() -> Tuple[SamplingQueueHandler, logging.handlers.QueueListener]:
+    if LOG_FILE:
+        target = logging.handlers.WatchedFileHandler(LOG_FILE, encoding="utf-8")
+    else:
+        target = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        target.setFormatter(JsonLogFormatter())
+    else:
+        target.setFormatter(TextLogFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    q: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = SamplingQueueHandler(q, LOG_SAMPLE_WINDOW, LOG_SAMPLE_BURST)
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    listener = logging.handlers.QueueListener(q, target, respect_handler_level=True)
+    listener.start()
+    stop_flusher = threading.Event()
+    if LOG_SAMPLE_BURST > 0:
+        threading.Thread(target=handler.run_flusher, args=(stop_flusher,), name="log-sampler", daemon=True).start()
+
+    def shutdown() -> None:
+        # chiqishda: oxirgi oyna xulosalari va navbatda qolgan yozuvlar ham yozilsin
+        stop_flusher.set()
+        handler.flush_expired(force=True)
+        listener.stop()
+
+    atexit.register(shutdown)
+    return handler, listener
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Outer (dp.update): shu update dagi barcha log yozuvlariga update_id va user_id."""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        token = _log_context.set({"update_id": event.update_id, "user_id": user.id if user else None})
+        try:
+            return await handler(event, data)
+        finally:
+            _log_context.reset(token)
+
+
+log_handler, log_listener = setup_logging()
 logger = logging.getLogger("kino_bot_final")
 
-bot = Bot(token=TOKEN)
+class PooledAiohttpSession(AiohttpSession):
+    """
+    Bot API ulanish hovuzi: keep-alive, host bo'yicha limit va DNS kesh bilan o'z TCPConnector imiz
+    (aiogram ning ichki connector sozlamalariga tegmaymiz). Proxy berilsa aiogram ning o'zi ulaydi.
+    """
+
+    def __init__(self, limit: int = API_POOL_LIMIT, **kwargs: Any):
+        super().__init__(limit=limit, **kwargs)
+        self.pool_limit = limit
+        self._pool: Optional[aiohttp.ClientSession] = None
+
+    async def create_session(self) -> aiohttp.ClientSession:
+        if self.proxy is not None:
+            return await super().create_session()
+        if self._pool is None or self._pool.closed:
+            self._pool = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    ssl=ssl.create_default_context(cafile=certifi.where()),
+                    limit=self.pool_limit,
+                    limit_per_host=self.pool_limit,
+                    keepalive_timeout=API_KEEPALIVE,
+                    ttl_dns_cache=API_DNS_TTL,
+                ),
+                headers={"User-Agent": f"aiogram/{AIOGRAM_VERSION}"},
+            )
+        return self._pool
+
+    async def close(self) -> None:
+        await super().close()
+        if self._pool is not None and not self._pool.closed:
+            await self._pool.close()
+
+
+bot = Bot(token=TOKEN, session=PooledAiohttpSession())
 dp = Dispatcher(storage=MemoryStorage())
 router = Router()
 dp.include_router(router)
+dp.update.outer_middleware(LogContextMiddleware())
+
+# "otib yuborilgan" fon vazifalari: event loop task larga faqat zaif havola saqlaydi,
+# shuning uchun tugaguncha shu yerda ushlab turamiz; xatolari logga yoziladi
+background_tasks: set = set()
+
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+
+def _background_done(task: asyncio.Task) -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Fon vazifasi xatosi: {task.get_coro().__qualname__}", exc_info=task.exception())
+
+
+async def stop_task(task: Optional[asyncio.Task]) -> None:
+    """Cheksiz fon vazifasini to'xtatadi va tugashini kutadi (shutdown da)."""
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
 
 
 def get_utc_now():
     return datetime.now(timezone.utc)
 
 
+def now_ts() -> int:
+    """UTC epoch sekund (DB dagi *_ts ustunlar shu formatda)."""
+    return int(time.time())
+
+
 def normalize_channel_identifier(text: str) -> str:
     """
     Admin kanal qo'shganda:
@@ -70,6 +399,770 @@ def normalize_channel_identifier(text: str) -> str:
     return t
 
 
+# ===================== SEARCH NORMALIZATION =====================
+# O'zbek kirill -> lotin. Apostroflar (o', g', ъ) indeksda tashlab yuboriladi,
+# shunda "O'zbek", "Oʻzbek" va "Ўзбек" bitta "ozbek" tokeniga tushadi.
+_CYR_TO_LAT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo",
+    "ж": "j", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "x", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "",
+    "ы": "i", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "ў": "o", "қ": "q", "ғ": "g", "ҳ": "h",
+}
+_APOSTROPHES = "'`ʻʼ‘’´"
+_SEARCH_TRANSLATE = str.maketrans({**_CYR_TO_LAT, **{c: "" for c in _APOSTROPHES}})
+_SEARCH_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize_search_text(text: str) -> str:
+    """
+    Qidiruv uchun matn: kichik harf, kirill -> lotin, apostroflarsiz.
+    Indeks ham, so'rov ham shu funksiyadan o'tadi.
+    """
+    return (text or "").lower().translate(_SEARCH_TRANSLATE)
+
+
+def search_tokens(text: str) -> List[str]:
+    return _SEARCH_TOKEN_RE.findall(normalize_search_text(text))
+
+
+def _edit_distance_matcher(token: str):
+    """
+    Levenshtein masofasi uchun bit-parallel (Myers/Hyyrö) hisoblagich.
+    token uchun bitmaskalar bir marta quriladi, keyin har bir term uchun O(len(term)).
+    """
+    m = len(token)
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    peq: Dict[str, int] = {}
+    for i, c in enumerate(token):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    def distance(term: str) -> int:
+        pv, mv, score = mask, 0, m
+        for c in term:
+            eq = peq.get(c, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | (~(xh | pv) & mask)
+            mh = pv & xh
+            if ph & last:
+                score += 1
+            elif mh & last:
+                score -= 1
+            ph = ((ph << 1) | 1) & mask
+            mh = (mh << 1) & mask
+            pv = mh | (~(xv | ph) & mask)
+            mv = ph & xv
+        return score
+
+    return distance
+
+
+# ===================== CACHES =====================
+class LRUCache:
+    """
+    Oddiy in-memory LRU (ixtiyoriy TTL bilan).
+    Event loop ichida ishlatiladi, shuning uchun lock kerak emas.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires, value = item
+        if expires and expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl if ttl else 0, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def drop(self, predicate: Callable[[Hashable], bool]) -> int:
+        """predicate(kalit) rost bo'lgan yozuvlarni o'chiradi — O(n), kamdan-kam chaqirish uchun."""
+        keys = [k for k in self._data if predicate(k)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# KnownUsers.recent shu hajmdan oshsa asosiy massivlarga birlashtiriladi (O(n) nusxa, kam bo'ladi)
+KNOWN_USERS_MERGE = 50_000
+
+
+class KnownUsers:
+    """
+    Ma'lum user_id lar va har birining oxirgi faol kuni (epoch // 86400): tartiblangan array('q')
+    va unga parallel array('H') — 10 bayt/user (5M ~ 50 MB). Yangi/o'zgargan yozuvlar avval
+    kichik `recent` dict ga tushadi va KNOWN_USERS_MERGE dan keyin massivlarga qo'shiladi.
+    ready=False — hali yuklanmoqda: get() natijasiga tayanib bo'lmaydi, lekin set() lar saqlanadi.
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.days = array("H")
+        self.recent: Dict[int, int] = {}
+        self.ready = False
+
+    def _find(self, user_id: int) -> int:
+        i = bisect_left(self.ids, user_id)
+        return i if i < len(self.ids) and self.ids[i] == user_id else -1
+
+    def get(self, user_id: int) -> Optional[int]:
+        day = self.recent.get(user_id)
+        if day is not None:
+            return day
+        i = self._find(user_id)
+        return self.days[i] if i >= 0 else None
+
+    def set(self, user_id: int, day: int) -> None:
+        i = self._find(user_id) if self.ready else -1
+        if i >= 0:
+            self.days[i] = day
+            return
+        self.recent[user_id] = day
+        if self.ready and len(self.recent) > KNOWN_USERS_MERGE:
+            self._merge()
+
+    def extend(self, rows: List[Tuple[int, int]]) -> None:
+        """Yuklash: user_id bo'yicha o'sish tartibidagi (user_id, kun) bo'lagi."""
+        self.ids.extend(r[0] for r in rows)
+        self.days.extend(r[1] for r in rows)
+
+    def finish_loading(self) -> None:
+        self._merge()
+        self.ready = True
+
+    def _merge(self) -> None:
+        if not self.recent:
+            return
+        ids, days = array("q"), array("H")
+        start = 0
+        for user_id, day in sorted(self.recent.items()):
+            i = bisect_left(self.ids, user_id, start)
+            ids.extend(self.ids[start:i])
+            days.extend(self.days[start:i])
+            ids.append(user_id)
+            days.append(day)
+            # yuklash paytida yozilgan, massivda ham bor — recent dagi qiymat yangiroq
+            start = i + 1 if i < len(self.ids) and self.ids[i] == user_id else i
+        ids.extend(self.ids[start:])
+        days.extend(self.days[start:])
+        self.ids, self.days, self.recent = ids, days, {}
+
+    @property
+    def nbytes(self) -> int:
+        return (self.ids.itemsize * len(self.ids) + self.days.itemsize * len(self.days)
+                + sys.getsizeof(self.recent))
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.recent)
+
+
+# ===================== METRICS =====================
+# sekundlarda; Prometheus "le" chegaralari
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_INTERVAL = 0.5
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    Jarayon ichidagi hisoblagichlar va histogrammalar, Prometheus text formatida chiqariladi.
+    Issiq yo'lda faqat dict lookup + bisect; hammasi event loop ichida, lock kerak emas.
+    Har bir metrikada bitta label: (metrika, label nomi, label qiymati).
+    """
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, str, str], float] = {}
+        self.caches: Dict[str, LRUCache] = {}
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def observe(self, name: str, label: str, value: str, seconds: float) -> None:
+        key = (name, label, value)
+        h = self.histograms.get(key)
+        if h is None:
+            h = self.histograms[key] = Histogram()
+        h.observe(seconds)
+
+    def inc(self, name: str, label: str, value: str, n: float = 1) -> None:
+        key = (name, label, value)
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def register_cache(self, name: str, cache: LRUCache) -> None:
+        self.caches[name] = cache
+
+    @staticmethod
+    def _labels(label: str, value: str, extra: str = "") -> str:
+        parts = []
+        if label:
+            value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            parts.append(f'{label}="{value}"')
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        lines = []
+        typed = set()
+        for (name, label, value), h in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            acc = 0
+            for le, c in zip(LATENCY_BUCKETS + ("+Inf",), h.counts):
+                acc += c
+                le_label = 'le="%s"' % le
+                lines.append(f"{name}_bucket{self._labels(label, value, le_label)} {acc}")
+            lines.append(f"{name}_sum{self._labels(label, value)} {h.sum:.6f}")
+            lines.append(f"{name}_count{self._labels(label, value)} {acc}")
+        for (name, label, value), n in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self._labels(label, value)} {n:g}")
+
+        lines.append("# TYPE bot_cache_hits_total counter")
+        lines += [f'bot_cache_hits_total{{cache="{n}"}} {c.hits}' for n, c in self.caches.items()]
+        lines.append("# TYPE bot_cache_misses_total counter")
+        lines += [f'bot_cache_misses_total{{cache="{n}"}} {c.misses}' for n, c in self.caches.items()]
+        lines.append("# TYPE bot_cache_entries gauge")
+        lines += [f'bot_cache_entries{{cache="{n}"}} {len(c)}' for n, c in self.caches.items()]
+
+        for collect in self.collectors:
+            lines += collect()
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _log_metrics() -> List[str]:
+    return [
+        "# TYPE bot_log_dropped_total counter",
+        f"bot_log_dropped_total {log_handler.dropped}",
+        "# TYPE bot_log_suppressed_total counter",
+        f"bot_log_suppressed_total {log_handler.suppressed}",
+    ]
+
+
+metrics.collectors.append(_log_metrics)
+
+
+def _timed(fn, metric: str, label: str):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        span = span_start("db", label)
+        error = None
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            error = e
+            metrics.inc(f"{metric}_errors_total", "method", label)
+            raise
+        finally:
+            metrics.observe(f"{metric}_seconds", "method", label, time.perf_counter() - t0)
+            span_end(span, error)
+    return wrapper
+
+
+def instrument_async_methods(cls, metric: str) -> None:
+    """cls ning public async metodlarini sinf darajasida (bir marta) vaqt o'lchagich bilan o'raydi."""
+    for name, fn in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.iscoroutinefunction(fn):
+            setattr(cls, name, _timed(fn, metric, name))
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: data["handler"] bor, shuning uchun label — handler funksiyasi nomi."""
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        ctx = _log_context.get()
+        if ctx is not None:
+            ctx["handler"] = name
+        t0 = time.perf_counter()
+        span = span_start("handler", name)
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = e
+            metrics.inc("bot_handler_errors_total", "handler", name)
+            raise
+        finally:
+            metrics.observe("bot_handler_seconds", "handler", name, time.perf_counter() - t0)
+            span_end(span, error)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        t0 = time.perf_counter()
+        span = span_start("api", name)
+        error = None
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            error = e
+            metrics.inc("bot_api_errors_total", "method", name)
+            raise
+        finally:
+            metrics.observe("bot_api_seconds", "method", name, time.perf_counter() - t0)
+            span_end(span, error)
+
+
+for _observer in (router.message, router.callback_query, router.inline_query,
+                  router.chosen_inline_result, router.chat_join_request):
+    _observer.middleware(HandlerMetricsMiddleware())
+
+
+async def loop_lag_monitor():
+    # uxlash kechikib qaytsa — event loop shuncha vaqt band bo'lgan
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = time.perf_counter() - t0 - LOOP_LAG_INTERVAL
+        metrics.observe("bot_event_loop_lag_seconds", "", "", max(0.0, lag))
+
+
+async def start_metrics_server() -> "web.AppRunner":
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(
+            body=metrics.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    logger.info(f"Metrikalar: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
+
+
+# ===================== BOT API SESSION =====================
+# Barcha Bot API chaqiruvlari uchun yagona qayta urinish siyosati:
+# - 429: retry_after ni kutib qayta (API_RETRY_AFTER_MAX dan uzun bo'lsa xato chaqiruvchiga qaytadi)
+# - 5xx / tarmoq xatosi: eksponensial backoff (full jitter)
+# - ketma-ket API_BREAKER_THRESHOLD ta 5xx/tarmoq xatosi — API_BREAKER_COOLDOWN sekund davomida
+#   chaqiruvlar tarmoqqa chiqmasdan ApiCircuitOpen bilan tugaydi, keyin bitta sinov so'rovi o'tkaziladi
+# 4xx (400/403) qayta urinilmaydi. Timeout bo'lgan send* so'rovi Telegramga yetgan bo'lishi mumkin —
+# qayta urinish kamdan-kam hollarda xabarni ikki marta yuborishi mumkin.
+API_RETRIES = 3
+API_BACKOFF_BASE = 0.5
+API_BACKOFF_MAX = 10.0
+API_RETRY_AFTER_MAX = 30
+API_BREAKER_THRESHOLD = 10
+API_BREAKER_COOLDOWN = 30.0
+
+
+class ApiCircuitOpen(TelegramNetworkError):
+    """Circuit ochiq: so'rov yuborilmadi. TelegramNetworkError — mavjud except lar uni ham ushlaydi."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        # half-open: cooldown tugagach faqat bitta so'rov o'tadi
+        if self.probing or self.retry_in() > 0:
+            return False
+        self.probing = True
+        return True
+
+    def success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Bot API circuit yopildi")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+            if self.opened_at is None:
+                logger.warning(f"Bot API circuit ochildi: ketma-ket {self.failures} ta xato")
+                metrics.inc("bot_api_circuit_opened_total", "", "")
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+
+api_breaker = CircuitBreaker(API_BREAKER_THRESHOLD, API_BREAKER_COOLDOWN)
+
+
+class ApiRetryMiddleware(BaseRequestMiddleware):
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+
+    async def __call__(self, make_request, bot, method):
+        # polling ning o'z backoff i bor; long-poll xatolari circuit ga ta'sir qilmasin
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+
+        name = type(method).__name__
+        attempt = 0
+        while True:
+            probe = self.breaker.is_open  # allow() o'tkazsa — bu half-open probe
+            if not self.breaker.allow():
+                metrics.inc("bot_api_short_circuited_total", "method", name)
+                raise ApiCircuitOpen(method, f"Bot API circuit ochiq ({self.breaker.retry_in():.0f}s)")
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.breaker.success()  # server javob beryapti, faqat tezlik cheklovi
+                if attempt >= API_RETRIES or e.retry_after > API_RETRY_AFTER_MAX:
+                    raise
+                reason, delay = "flood", e.retry_after
+            except (TelegramServerError, TelegramNetworkError) as e:
+                self.breaker.failure()
+                if attempt >= API_RETRIES:
+                    raise
+                reason = "server" if isinstance(e, TelegramServerError) else "network"
+                delay = random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))
+            except TelegramAPIError:
+                self.breaker.success()
+                raise
+            else:
+                self.breaker.success()
+                return result
+            finally:
+                # probe natijasiz tugadi (CancelledError, ClientDecodeError ...) — circuit yana ochiq,
+                # keyingi probe cooldown dan keyin; aks holda probing abadiy True qolardi
+                if probe and self.breaker.probing:
+                    self.breaker.failure()
+            attempt += 1
+            metrics.inc("bot_api_retries_total", "reason", reason)
+            await asyncio.sleep(delay)
+
+
+# Telegram tezlik cheklovi token bo'yicha: mirror botlar bitta session ni bo'lishadi, navbat esa
+# har bir bot uchun alohida
+RATE_LIMITED_METHODS = {"SendMessage", "SendVideo", "SendPhoto", "SendDocument", "CopyMessage", "ForwardMessage"}
+
+
+class SendRateMiddleware(BaseRequestMiddleware):
+    """
+    Har bir bot uchun token bucket. So'rov o'z navbatini oldindan band qiladi (tokens manfiyga
+    tushishi mumkin), shuning uchun kutayotganlar kelgan tartibida o'tadi.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[int, List[float]] = {}  # bot.id -> [tokens, oxirgi yangilanish]
+
+    def reserve(self, bot_id: int) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(bot_id)
+        if bucket is None:
+            bucket = self._buckets[bot_id] = [float(self.burst), now]
+        bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate) - 1
+        bucket[1] = now
+        return 0.0 if bucket[0] >= 0 else -bucket[0] / self.rate
+
+    async def __call__(self, make_request, bot, method):
+        if type(method).__name__ in RATE_LIMITED_METHODS:
+            delay = self.reserve(bot.id)
+            if delay:
+                metrics.inc("bot_api_rate_wait_seconds_total", "bot", str(bot.id), delay)
+                await asyncio.sleep(delay)
+        return await make_request(bot, method)
+
+
+def configure_api_session(session: AiohttpSession) -> AiohttpSession:
+    """
+    Middleware lar: retry tashqarida, tezlik navbati va metrika ichkarida (har bir urinish alohida
+    navbatga turadi va o'lchanadi). Ulanish hovuzi PooledAiohttpSession da sozlanadi.
+    """
+    session.middleware(ApiRetryMiddleware(api_breaker))
+    if API_SEND_RATE > 0:
+        session.middleware(SendRateMiddleware(API_SEND_RATE, API_SEND_BURST))
+    session.middleware(ApiMetricsMiddleware())
+    return session
+
+
+def _api_breaker_metrics() -> List[str]:
+    return [
+        "# TYPE bot_api_circuit_open gauge",
+        f"bot_api_circuit_open {int(api_breaker.is_open)}",
+    ]
+
+
+configure_api_session(bot.session)
+metrics.collectors.append(_api_breaker_metrics)
+
+
+# ===================== TRACING =====================
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUPS = 3
+TRACE_QUEUE_SIZE = 1000
+TRACE_WRITE_BATCH = 100
+
+# joriy span; aiogram har bir update ni alohida task da ishlaydi, context o'sha task ga ko'chadi
+_current_span: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+trace_queue: asyncio.Queue = asyncio.Queue(maxsize=TRACE_QUEUE_SIZE)
+
+
+class Trace:
+    __slots__ = ("id", "spans")
+
+    def __init__(self):
+        self.id = os.urandom(8).hex()
+        self.spans: List["Span"] = []
+
+
+class Span:
+    __slots__ = ("trace", "id", "parent", "kind", "name", "start", "end", "error")
+
+    def __init__(self, trace: Trace, parent: Optional[int], kind: str, name: str):
+        self.trace = trace
+        self.id = len(trace.spans)
+        self.parent = parent
+        self.kind = kind
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = 0.0
+        self.error = None
+        trace.spans.append(self)
+
+
+def span_start(kind: str, name: str):
+    """Faol trace bo'lmasa None (bitta ContextVar.get — issiq yo'lda arzon)."""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    span = Span(parent.trace, parent.id, kind, name)
+    return span, _current_span.set(span)
+
+
+def span_end(handle, error: Optional[BaseException] = None) -> None:
+    if handle is None:
+        return
+    span, token = handle
+    span.end = time.perf_counter()
+    if error is not None:
+        span.error = type(error).__name__
+    _current_span.reset(token)
+
+
+def finish_trace(trace: Trace, update_id: int, user_id: Optional[int]) -> None:
+    """
+    Tail sampling: qaror update tugagach qilinadi, shuning uchun sekin/xatoli trace lar
+    doim saqlanadi. Yozish trace_writer da (fon thread) — bu yerda faqat navbatga qo'yish.
+    """
+    root = trace.spans[0]
+    duration_ms = (root.end - root.start) * 1000
+    has_error = any(sp.error for sp in trace.spans)
+    if duration_ms < TRACE_SLOW_MS and not has_error and random.random() >= TRACE_SAMPLE_RATE:
+        return
+    record = {
+        "trace_id": trace.id,
+        "ts": now_ts(),
+        "update_id": update_id,
+        "type": root.name,
+        "user_id": user_id,
+        "ms": round(duration_ms, 3),
+        "error": has_error,
+        "spans": [{
+            "id": sp.id,
+            "parent": sp.parent,
+            "kind": sp.kind,
+            "name": sp.name,
+            "start_ms": round((sp.start - root.start) * 1000, 3),
+            "ms": round(((sp.end or root.end) - sp.start) * 1000, 3),
+            **({"error": sp.error} if sp.error else {}),
+        } for sp in trace.spans],
+    }
+    try:
+        trace_queue.put_nowait(record)
+    except asyncio.QueueFull:
+        metrics.inc("bot_traces_dropped_total", "", "")
+
+
+class TraceMiddleware(BaseMiddleware):
+    """Dispatcher darajasidagi outer middleware: root span ("update") va trace id."""
+
+    async def __call__(self, handler, event, data):
+        if not TRACE_FILE:
+            return await handler(event, data)
+        trace = Trace()
+        root = Span(trace, None, "update", event.event_type)
+        token = _current_span.set(root)
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            root.end = time.perf_counter()
+            _current_span.reset(token)
+            user = data.get("event_from_user")
+            finish_trace(trace, event.update_id, user.id if user else None)
+
+
+dp.update.outer_middleware(TraceMiddleware())
+
+
+def _write_traces(batch: List[Dict]) -> None:
+    lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch)
+    if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) + len(lines) > TRACE_MAX_BYTES:
+        for i in range(TRACE_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{TRACE_FILE}.{i}"):
+                os.replace(f"{TRACE_FILE}.{i}", f"{TRACE_FILE}.{i + 1}")
+        os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+async def trace_writer():
+    while True:
+        batch = [await trace_queue.get()]
+        while len(batch) < TRACE_WRITE_BATCH and not trace_queue.empty():
+            batch.append(trace_queue.get_nowait())
+        write = asyncio.ensure_future(asyncio.to_thread(_write_traces, batch))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # shutdown: boshlangan yozuv tugasin — flush_traces bilan faylda to'qnashmasin
+            await asyncio.wait([write])
+            raise
+        except Exception as e:
+            logger.error(f"trace write error: {e}")
+
+
+async def flush_traces() -> None:
+    """Shutdown: trace_writer to'xtatilgandan keyin navbatda qolgan trace lar diskka."""
+    batch = []
+    while not trace_queue.empty():
+        batch.append(trace_queue.get_nowait())
+    if batch:
+        try:
+            await asyncio.to_thread(_write_traces, batch)
+        except Exception as e:
+            logger.error(f"trace write error: {e}")
+
+
+def _percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] if values else 0.0
+
+
+def trace_summary(argv: List[str]) -> None:
+    """
+    python bot.py --trace-summary [--top N] [fayl]
+    Bosqichlar (kind:name) bo'yicha o'z vaqti (bolalar spanlarisiz) va eng sekin trace lar.
+    """
+    import argparse
+    ap = argparse.ArgumentParser(prog="bot.py --trace-summary")
+    ap.add_argument("file", nargs="?", default=TRACE_FILE)
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    files = [f"{args.file}.{i}" for i in range(TRACE_BACKUPS, 0, -1)] + [args.file]
+    traces = []
+    for path in files:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                traces += [json.loads(line) for line in f if line.strip()]
+    if not traces:
+        print(f"{args.file}: trace yo'q")
+        return
+
+    stages: Dict[str, Dict] = {}
+    total_ms = 0.0
+    for t in traces:
+        total_ms += t["ms"]
+        child_ms: Dict[int, float] = {}
+        for sp in t["spans"]:
+            if sp["parent"] is not None:
+                child_ms[sp["parent"]] = child_ms.get(sp["parent"], 0.0) + sp["ms"]
+        t["self"] = {}
+        for sp in t["spans"]:
+            key = f"{sp['kind']}:{sp['name']}"
+            own = max(0.0, sp["ms"] - child_ms.get(sp["id"], 0.0))
+            t["self"][key] = t["self"].get(key, 0.0) + own
+            st = stages.setdefault(key, {"self": 0.0, "durations": [], "errors": 0})
+            st["self"] += own
+            st["durations"].append(sp["ms"])
+            st["errors"] += 1 if sp.get("error") else 0
+
+    print(f"{len(traces)} trace, jami {total_ms / 1000:.1f}s\n")
+    print(f"{'bosqich':45s} {'soni':>7s} {'o`z ms':>10s} {'ulush':>6s} {'p50':>8s} {'p95':>8s} {'max':>8s} {'xato':>5s}")
+    for key, st in sorted(stages.items(), key=lambda kv: -kv[1]["self"])[:40]:
+        d = st["durations"]
+        print(
+            f"{key[:45]:45s} {len(d):7d} {st['self']:10.1f} {st['self'] / total_ms * 100:5.1f}% "
+            f"{_percentile(d, 50):8.1f} {_percentile(d, 95):8.1f} {max(d):8.1f} {st['errors']:5d}"
+        )
+
+    print(f"\nEng sekin {args.top} ta trace:")
+    for t in sorted(traces, key=lambda t: -t["ms"])[:args.top]:
+        handler = next((sp["name"] for sp in t["spans"] if sp["kind"] == "handler"), "-")
+        top = sorted(t["self"].items(), key=lambda kv: -kv[1])[:3]
+        breakdown = ", ".join(f"{k} {v:.0f}ms" for k, v in top)
+        ts = datetime.fromtimestamp(t["ts"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"  {t['ms']:8.1f}ms  {ts}  {t['trace_id']}  {handler}  user={t['user_id']}  [{breakdown}]")
+
+
 # ===================== STATES =====================
 class AdminStates(StatesGroup):
     add_admin = State()
@@ -95,343 +1188,1230 @@ class AdminStates(StatesGroup):
     add_serial = State()
     add_serial_description = State()
 
+    bulk_serial_id = State()
+    bulk_collect = State()
+    bulk_manifest = State()
+
+
+# ===================== ROW TYPES =====================
+# Keshlanadigan katalog qatorlari: o'zgarmas (immutable) tuple lar — dict dan 3-4 barobar
+# ixcham va keshdan nusxa olmasdan to'g'ridan-to'g'ri qaytarish mumkin.
+class Content(NamedTuple):
+    id: int
+    file_id: Optional[str]
+    title: str
+    description: str
+    content_type: str
+    downloads_count: int = 0
+    added_at: Optional[str] = None
+
+
+class SerialPart(NamedTuple):
+    part_number: int
+    file_id: str
+    title: str
+
+
+class Channel(NamedTuple):
+    chat_id: int
+    title: str
+    username: str
+    invite_link: str
+
+
+class InstagramLink(NamedTuple):
+    id: int
+    title: str
+    url: str
+
+
+class Admin(NamedTuple):
+    user_id: int
+    added_at: str
+
+
+class VideoItem(NamedTuple):
+    """Inline natija: kino -> o'z videosi, serial -> 1-qism (part_title, parts_count bilan)."""
+    id: int
+    title: str
+    description: str
+    content_type: str
+    file_id: str
+    part_title: Optional[str]
+    parts_count: int
+
+
+def row_factory(row_type) -> Callable:
+    """sqlite3 cursor.row_factory: qator aiosqlite worker thread ida row_type ga aylanadi."""
+    return lambda _cursor, row: row_type(*row)
+
 
 # ===================== DATABASE =====================
-class DatabaseManager:
-    def __init__(self, db_path: str):
-        self.db_path = db_path
+# (jadval, ((eski ISO matn ustuni, yangi epoch ustuni), ...))
+EPOCH_COLUMNS = (
+    ("users", (("joined_at", "joined_ts"), ("last_active", "last_active_ts"))),
+    ("user_activity", (("action_at", "action_ts"),)),
+    ("channel_join_requests", (("requested_at", "requested_ts"),)),
+    ("content_downloads", (("downloaded_at", "downloaded_ts"),)),
+)
+EPOCH_MIGRATION_BATCH = 2000
+EPOCH_MIGRATION_PAUSE = 0.05
+
+
+def _iso_to_epoch_sql(col: str) -> str:
+    # "2024-05-01T12:30:00.123456+00:00" -> 1714566600 (barcha yozuvlar UTC da saqlangan)
+    return f"CAST(strftime('%s', substr({col}, 1, 19)) AS INTEGER)"
+
+
+TREND_BUCKET_SECONDS = 3600
+TREND_RETENTION_DAYS = 8
+TOP_N = 10
+
+# Kohortlar (kun = epoch // 86400, UTC), foydalanuvchining kundagi birinchi faolligida yangilanadi:
+# cohort_activity — (qo'shilgan kun, faol kun) -> o'sha kuni faol bo'lgan alohida userlar soni;
+# last_active_days — kun -> oxirgi faolligi shu kunda bo'lgan userlar (DAU/WAU/MAU shundan yig'iladi)
+COHORT_RETENTION_DAYS = 180
+
+
+DB_BUSY_TIMEOUT = 10.0
+DOWNLOAD_FLUSH_SECONDS = 2.0
+
+# PRAGMA user_version: init_db dagi DDL (jadval/ustun/indeks) o'zgarsa oshiring,
+# aks holda mavjud bazalarda yangi DDL ishga tushmaydi
+SCHEMA_VERSION = 3
+
+# get_content / get_serial_parts keshi; kalitda catalog_version bor.
+# TTL — downloads_count (write-behind) juda eskirib qolmasligi uchun
+CONTENT_CACHE_SIZE = 5000
+CONTENT_CACHE_TTL = 60
+KNOWN_USERS_LOAD_CHUNK = 50_000
+
+# qidiruv: bm25 bilan faqat eng yangi shuncha moslik baholanadi ("ba"* kabi keng prefiks
+# butun katalogni saralamasin); sahifalash ham shu oraliq ichida
+SEARCH_RANK_CANDIDATES = 500
+
+# admin tahliliy/ro'yxat so'rovlari uchun faqat o'qiladigan hovuz
+READ_POOL_SIZE = 2            # har bir fayl uchun
+READ_PROGRESS_STEPS = 10_000  # progress handler shuncha VM qadamda bir deadline ni tekshiradi
+STATS_QUERY_TIMEOUT = 10.0
+LIST_QUERY_TIMEOUT = 60.0
+SLOW_QUERY_SECONDS = 1.0
+EXPORT_QUERY_TIMEOUT = 600.0
+EXPORT_FETCH_ROWS = 1000  # bitta thread round-trip da o'qiladigan qatorlar
+
+# /export ustunlari (DatabaseManager.iter_export_batches shu tartibda qaytaradi)
+EXPORT_COLUMNS = {
+    "users": ("user_id", "username", "first_name", "last_name", "joined_at", "last_active"),
+    "content": ("id", "content_type", "title", "description", "added_at", "downloads_count", "parts_count"),
+    "downloads": ("content_id", "unique_users", "first_download", "last_download"),
+}
+
+# bo'lingan rejimda qaysi jadval qaysi faylda turadi
+CATALOG_TABLES = (
+    "content", "serial_parts", "channels", "admins", "instagram_links",
+    "content_fts", "search_terms",
+)
+HOT_TABLES = (
+    "users", "user_activity", "user_activity_daily", "content_downloads", "channel_join_requests",
+    "download_buckets", "leaderboards", "meta", "cohort_activity", "last_active_days",
+)
 
-    async def init_db(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            # Users
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    joined_at TEXT,
-                    last_active TEXT
-                )
-            """)
 
-            # Channels
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS channels (
-                    chat_id INTEGER PRIMARY KEY,
-                    title TEXT,
-                    username TEXT,
-                    added_at TEXT
-                )
-            """)
+class ReadPool:
+    """
+    Bitta SQLite fayl uchun faqat o'qiladigan (mode=ro URI) ulanishlar hovuzi.
+    Og'ir admin so'rovlari shu yerda ishlaydi: foydalanuvchi so'rovlari bilan ulanish
+    va writer navbatini bo'lishmaydi, WAL tufayli yozuvchini ham to'smaydi.
+    """
 
-            # Admins
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS admins (
-                    user_id INTEGER PRIMARY KEY,
-                    added_at TEXT
-                )
-            """)
+    def __init__(self, path: str, size: int = READ_POOL_SIZE):
+        self.path = path
+        self._sem = asyncio.Semaphore(size)
+        self._idle: List[Tuple[aiosqlite.Connection, List[float]]] = []
+
+    async def _open(self) -> Tuple[aiosqlite.Connection, List[float]]:
+        uri = pathlib.Path(self.path).absolute().as_uri() + "?mode=ro"
+        conn = aiosqlite.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT)
+        conn.daemon = True  # close() chaqirilmay qolsa ham jarayon chiqishini to'smasin
+        await conn
+        # deadline o'tsa progress handler so'rovni to'xtatadi ("interrupted")
+        deadline = [float("inf")]
+        await conn.set_progress_handler(lambda: time.monotonic() > deadline[0], READ_PROGRESS_STEPS)
+        return conn, deadline
+
+    @asynccontextmanager
+    async def connection(self, timeout: float):
+        async with self._sem:
+            item = self._idle.pop() if self._idle else await self._open()
+            conn, deadline = item
+            deadline[0] = time.monotonic() + timeout
+            try:
+                yield conn
+            finally:
+                deadline[0] = float("inf")
+                self._idle.append(item)
 
-            # Content
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS content (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    file_id TEXT,
-                    title TEXT,
-                    description TEXT,
-                    content_type TEXT DEFAULT 'movie',
-                    added_by INTEGER,
-                    added_at TEXT
-                )
-            """)
+    async def close(self) -> None:
+        while self._idle:
+            conn, _ = self._idle.pop()
+            await conn.close()
 
-            # Serial parts
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS serial_parts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    serial_id INTEGER,
-                    part_number INTEGER,
-                    file_id TEXT NOT NULL,
-                    title TEXT,
-                    added_by INTEGER,
-                    added_at TEXT,
-                    FOREIGN KEY (serial_id) REFERENCES content (id)
-                )
-            """)
 
-            # Activity (for statistics)
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS user_activity (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    action TEXT,
-                    action_at TEXT
-                )
-            """)
+class CatalogState:
+    """
+    Katalog fayliga bog'liq xotiradagi holat. Mirror botlarning DatabaseManager lari shu obyektni
+    bo'lishadi: bitta yozuvchi navbati, bitta catalog_version va bitta nusxa keshlar.
+    """
 
-            # Join request tracking
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS channel_join_requests (
-                    chat_id INTEGER,
-                    user_id INTEGER,
-                    requested_at TEXT,
-                    PRIMARY KEY (chat_id, user_id)
-                )
-            """)
+    def __init__(self):
+        # har bir fayl uchun bitta yozuvchi navbati: SQLite baribir bitta writer,
+        # jarayon ichida navbatda turish busy-retry dan arzon
+        self.lock = asyncio.Lock()
+        # katalog (content / serial_parts) har o'zgarganda oshadi; keshlar kalitida ishlatiladi
+        self.version = 0
+        # bo'lingan rejimda content.downloads_count oshirishlari shu yerda yig'ilib, to'plab yoziladi
+        self.pending_downloads: Dict[int, int] = {}
+        # fayl -> ReadPool; label -> {"count", "seconds", "timeouts"}
+        self.read_pools: Dict[str, ReadPool] = {}
+        self.read_stats: Dict[str, Dict[str, float]] = {}
+        # admins / instagram_links: kichik va kam o'zgaradi — xotirada, shu obyekt orqali
+        # yozilganda tozalanadi (bazani boshqa jarayon o'zgartirsa qayta ishga tushirish kerak)
+        self.config: Dict[str, Any] = {}
+        self.content_cache = LRUCache(maxsize=CONTENT_CACHE_SIZE, ttl=CONTENT_CACHE_TTL)
+        self.parts_cache = LRUCache(maxsize=CONTENT_CACHE_SIZE, ttl=CONTENT_CACHE_TTL)
 
-            # Unique downloads per content
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS content_downloads (
-                    content_id INTEGER,
-                    user_id INTEGER,
-                    downloaded_at TEXT,
-                    PRIMARY KEY (content_id, user_id)
-                )
-            """)
 
-            # Instagram links (multiple)
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS instagram_links (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT,
-                    url TEXT NOT NULL,
-                    added_at TEXT
+class DatabaseManager:
+    def __init__(self, db_path: str, hot_db_path: Optional[str] = None,
+                 catalog: Optional[CatalogState] = None, own_channels: bool = False):
+        """
+        db_path — katalog/sozlamalar fayli; hot_db_path — yuqori yozuvli jadvallar fayli.
+        catalog — boshqa DatabaseManager ning holati (mirror bot: katalog umumiy, hot bazasi o'ziniki).
+        own_channels — majburiy kanallar ro'yxati hot bazada (har bir bot o'z kanallari bilan).
+        """
+        self.db_path = db_path
+        self.hot_db_path = hot_db_path or db_path
+        self.split = os.path.abspath(self.hot_db_path) != os.path.abspath(self.db_path)
+        self.shared = catalog or CatalogState()
+        # katalog fayliga texnik xizmat (maintenance / backup) faqat uning egasi qiladi
+        self.owns_catalog = catalog is None
+        self.channels_path = self.hot_db_path if own_channels else self.db_path
+        self._catalog_lock = self.shared.lock
+        self._hot_lock = asyncio.Lock() if self.split else self._catalog_lock
+        # ISO matn -> epoch ko'chirish tugaganmi (init_db meta dan o'qiydi)
+        self.epoch_migrated = False
+        self._read_pools = self.shared.read_pools
+        self.read_stats = self.shared.read_stats
+        self._config = self.shared.config
+        self._channels: Optional[List[Channel]] = None
+        self.content_cache = self.shared.content_cache
+        self.parts_cache = self.shared.parts_cache
+        # users jadvali botga xos — indeks ham
+        self.known_users = KnownUsers()
+
+    @property
+    def catalog_version(self) -> int:
+        return self.shared.version
+
+    @catalog_version.setter
+    def catalog_version(self, value: int) -> None:
+        self.shared.version = value
+
+    @property
+    def _pending_downloads(self) -> Dict[int, int]:
+        return self.shared.pending_downloads
+
+    @_pending_downloads.setter
+    def _pending_downloads(self, value: Dict[int, int]) -> None:
+        self.shared.pending_downloads = value
+
+    # ---------- CONNECTIONS ----------
+    def _catalog(self):
+        return aiosqlite.connect(self.db_path, timeout=DB_BUSY_TIMEOUT)
+
+    def _hot(self):
+        return aiosqlite.connect(self.hot_db_path, timeout=DB_BUSY_TIMEOUT)
+
+    @asynccontextmanager
+    async def _writer(self, path: str, lock: asyncio.Lock):
+        async with lock:
+            async with aiosqlite.connect(path, timeout=DB_BUSY_TIMEOUT) as db:
+                await db.execute("PRAGMA synchronous = NORMAL")
+                yield db
+
+    def _catalog_writer(self):
+        return self._writer(self.db_path, self._catalog_lock)
+
+    def _hot_writer(self):
+        return self._writer(self.hot_db_path, self._hot_lock)
+
+    def _writer_for(self, path: str):
+        return self._writer(path, self._hot_lock if path == self.hot_db_path else self._catalog_lock)
+
+    @asynccontextmanager
+    async def _reader(self, path: str, label: str, timeout: float):
+        """
+        Admin tahliliy so'rovlari uchun faqat o'qiladigan ulanish.
+        label — so'rov sinfi (log va read_stats uchun); timeout oshsa asyncio.TimeoutError.
+        """
+        pool = self._read_pools.get(path)
+        if pool is None:
+            pool = self._read_pools[path] = ReadPool(path)
+        stat = self.read_stats.setdefault(label, {"count": 0, "seconds": 0.0, "timeouts": 0})
+        t0 = time.perf_counter()
+        try:
+            async with pool.connection(timeout) as conn:
+                yield conn
+        except sqlite3.OperationalError as e:
+            if "interrupted" not in str(e):
+                raise
+            stat["timeouts"] += 1
+            logger.warning(f"[{label}] so'rov {timeout:g}s dan oshdi, to'xtatildi")
+            raise asyncio.TimeoutError(label) from e
+        finally:
+            elapsed = time.perf_counter() - t0
+            stat["count"] += 1
+            stat["seconds"] += elapsed
+            if elapsed > SLOW_QUERY_SECONDS:
+                logger.info(f"[{label}] sekin so'rov: {elapsed:.2f}s")
+
+    async def close(self) -> None:
+        for pool in self._read_pools.values():
+            await pool.close()
+        self._read_pools.clear()
+
+    @property
+    def files(self) -> List[str]:
+        return [self.db_path, self.hot_db_path] if self.split else [self.db_path]
+
+    @property
+    def own_files(self) -> List[str]:
+        """Maintenance va backup qilinadigan fayllar: mirror uchun faqat o'z hot bazasi."""
+        return self.files if self.owns_catalog else [self.hot_db_path]
+
+    def _ts(self, ts_col: str, text_col: str) -> str:
+        """
+        Vaqt ustuni uchun SQL ifoda. Migratsiya tugagach — toza *_ts ustun (indeks ishlaydi),
+        ungacha hali ko'chirilmagan qatorlar uchun eski ISO matndan hisoblanadi.
+        """
+        if self.epoch_migrated:
+            return ts_col
+        return f"COALESCE({ts_col}, {_iso_to_epoch_sql(text_col)})"
+
+    async def _schema_version(self, path: str) -> int:
+        async with aiosqlite.connect(path, timeout=DB_BUSY_TIMEOUT) as db:
+            cur = await db.execute("PRAGMA user_version")
+            return (await cur.fetchone())[0]
+
+    async def init_db(self) -> bool:
+        """
+        Fayl(lar)ning user_version i SCHEMA_VERSION ga teng bo'lsa DDL o'tkazib yuboriladi
+        (tezkor yo'l, True) — arzon izchillik tekshiruvlari (FTS, backfill) baribir ishlaydi.
+        Aks holda to'liq DDL va keyin versiya yoziladi.
+        """
+        versions = [await self._schema_version(path) for path in self.files]
+        if all(v >= SCHEMA_VERSION for v in versions):
+            if any(v > SCHEMA_VERSION for v in versions):
+                logger.warning(f"Baza sxemasi kodnikidan yangi: {versions} > {SCHEMA_VERSION}")
+            await self._init_fast()
+            return True
+
+        # Bitta fayl rejimida ikkala qism ham bir xil faylga yoziladi.
+        async with self._catalog_writer() as db:
+            await self._init_catalog(db)
+        async with self._hot_writer() as db:
+            await self._init_hot(db)
+        for path in self.files:
+            async with self._writer_for(path) as db:
+                await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                await db.commit()
+        return False
+
+    async def _init_fast(self) -> None:
+        async with self._catalog() as db:
+            cur = await db.execute("SELECT 1 FROM admins WHERE user_id = ?", (ADMIN_ID,))
+            has_main_admin = await cur.fetchone() is not None
+        if not has_main_admin:  # ADMIN_ID .env da o'zgargan
+            async with self._catalog_writer() as db:
+                await db.execute(
+                    "INSERT OR IGNORE INTO admins (user_id, added_at) VALUES (?, ?)",
+                    (ADMIN_ID, get_utc_now().isoformat())
                 )
-            """)
+                await db.commit()
+        # DDL siz ham: tashqaridan (xom SQL / eski nusxa) o'zgargan baza uchun FTS va backfill
+        async with self._catalog_writer() as db:
+            await self._check_catalog(db)
+        async with self._hot_writer() as db:
+            await self._check_hot(db)
 
+    async def prewarm(self, top_n: int) -> Dict[str, int]:
+        """
+        Polling dan oldin: admin/kanal/instagram ro'yxatlari va eng ko'p yuklangan top_n kontent
+        (seriallar qismlari bilan) keshga — birinchi foydalanuvchilar sovuq bazaga urilmasin.
+        """
+        admins = await self.get_admins()
+        channels = await self.get_channels()
+        links = await self.get_instagram_links()
+        async with self._catalog() as db:
+            cur = await db.execute(
+                "SELECT id, file_id, title, description, content_type, COALESCE(downloads_count,0) "
+                "FROM content ORDER BY downloads_count DESC LIMIT ?",
+                (top_n,)
+            )
+            cur.row_factory = row_factory(Content)
+            rows = await cur.fetchall()
+            serial_ids = [r.id for r in rows if r.content_type == "serial"]
+            parts: Dict[int, List[SerialPart]] = {sid: [] for sid in serial_ids}
+            if serial_ids:
+                cur = await db.execute(
+                    f"SELECT serial_id, part_number, file_id, title FROM serial_parts "
+                    f"WHERE serial_id IN ({','.join('?' * len(serial_ids))}) ORDER BY serial_id, part_number",
+                    serial_ids
+                )
+                for sid, pno, fid, title in await cur.fetchall():
+                    parts[sid].append(SerialPart(pno, fid, title))
+        for row in rows:
+            self.content_cache.set((self.catalog_version, row.id), row)
+        for sid, items in parts.items():
+            self.parts_cache.set((self.catalog_version, sid), items)
+        return {
+            "admins": len(admins), "channels": len(channels), "instagram": len(links),
+            "content": len(rows), "serial_parts": sum(len(v) for v in parts.values()),
+        }
+
+    @staticmethod
+    async def _init_file(db) -> None:
+        # yangi baza bo'lsa: bo'shagan sahifalarni keyin bo'laklab qaytarish uchun
+        # (faqat jadval yaratilishidan oldin ta'sir qiladi)
+        await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL: o'quvchilar yozuvchi va checkpoint paytida bloklanmaydi
+        await db.execute("PRAGMA journal_mode = WAL")
+
+    @staticmethod
+    async def _init_channels(db) -> None:
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS channels (
+                chat_id INTEGER PRIMARY KEY,
+                title TEXT,
+                username TEXT,
+                added_at TEXT
+            )
+        """)
+        await db.commit()
+        # channels.invite_link
+        try:
+            await db.execute("ALTER TABLE channels ADD COLUMN invite_link TEXT")
             await db.commit()
+        except:
+            pass
 
-            # ---- ALTER safe adds ----
-            # users.started_once
-            try:
-                await db.execute("ALTER TABLE users ADD COLUMN started_once INTEGER DEFAULT 0")
-                await db.commit()
-            except:
-                pass
+    async def _init_catalog(self, db) -> None:
+        """Katalog va sozlamalar: content, serial_parts, channels, admins, instagram_links."""
+        await self._init_file(db)
 
-            # channels.invite_link
-            try:
-                await db.execute("ALTER TABLE channels ADD COLUMN invite_link TEXT")
-                await db.commit()
-            except:
-                pass
+        await self._init_channels(db)
 
-            # content.downloads_count
-            try:
-                await db.execute("ALTER TABLE content ADD COLUMN downloads_count INTEGER DEFAULT 0")
-                await db.commit()
-            except:
-                pass
+        # Admins
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS admins (
+                user_id INTEGER PRIMARY KEY,
+                added_at TEXT
+            )
+        """)
+
+        # Content
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS content (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_id TEXT,
+                title TEXT,
+                description TEXT,
+                content_type TEXT DEFAULT 'movie',
+                added_by INTEGER,
+                added_at TEXT
+            )
+        """)
+
+        # Serial parts
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS serial_parts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                serial_id INTEGER,
+                part_number INTEGER,
+                file_id TEXT NOT NULL,
+                title TEXT,
+                added_by INTEGER,
+                added_at TEXT,
+                FOREIGN KEY (serial_id) REFERENCES content (id)
+            )
+        """)
+
+        # Instagram links (multiple)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS instagram_links (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT,
+                url TEXT NOT NULL,
+                added_at TEXT
+            )
+        """)
 
-            # Main admin ensure
-            await db.execute(
-                "INSERT OR IGNORE INTO admins (user_id, added_at) VALUES (?, ?)",
-                (ADMIN_ID, get_utc_now().isoformat())
+        await db.commit()
+
+        # ---- ALTER safe adds ----
+        # content.downloads_count
+        try:
+            await db.execute("ALTER TABLE content ADD COLUMN downloads_count INTEGER DEFAULT 0")
+            await db.commit()
+        except:
+            pass
+
+        # ---- Indexes ----
+        # eski qatorlarda downloads_count NULL bo'lishi mumkin: keyset sort indeksdan foydalanishi uchun 0 qilamiz
+        await db.execute("UPDATE content SET downloads_count = 0 WHERE downloads_count IS NULL")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_content_type ON content (content_type)")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_content_type_downloads ON content (content_type, downloads_count)"
+        )
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_content_downloads_count ON content (downloads_count)")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_serial_parts_serial ON serial_parts (serial_id, part_number)"
+        )
+        await db.commit()
+
+        # ---- Full-text search (FTS5) ----
+        # rowid = content.id; title/description normalize_search_text() dan o'tgan holda saqlanadi.
+        # prefix indekslari: 2-4 harfli prefiks bitta doclist dan o'qiladi (inline rejimda
+        # har harfdan keyin qidiriladi); eski '2 3' jadval qayta yaratiladi va pastda to'ldiriladi
+        cur = await db.execute("SELECT sql FROM sqlite_master WHERE name = 'content_fts'")
+        row = await cur.fetchone()
+        if row and "prefix = '2 3 4'" not in row[0]:
+            await db.execute("DROP TABLE content_fts")
+        await db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
+                title, description,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3 4'
+            )
+        """)
+        # typo qidiruvi uchun lug'at (term -> nechta kontentda uchraydi)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS search_terms (
+                term TEXT PRIMARY KEY,
+                docs INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        await db.commit()
+
+        await self._check_catalog(db)
+
+        # Main admin ensure
+        await db.execute(
+            "INSERT OR IGNORE INTO admins (user_id, added_at) VALUES (?, ?)",
+            (ADMIN_ID, get_utc_now().isoformat())
+        )
+        await db.commit()
+
+    async def _check_catalog(self, db) -> None:
+        """Arzon izchillik tekshiruvi (tezkor yo'lda ham): FTS indeksi content bilan mos bo'lsin."""
+        cur = await db.execute("SELECT (SELECT COUNT(*) FROM content), (SELECT COUNT(*) FROM content_fts)")
+        content_rows, fts_rows = await cur.fetchone()
+        if content_rows != fts_rows:
+            await self._rebuild_search_index(db)
+
+    async def _init_hot(self, db) -> None:
+        """Tez-tez yoziladigan jadvallar: users, user_activity, content_downloads, channel_join_requests."""
+        await self._init_file(db)
+        if self.channels_path == self.hot_db_path and self.split:
+            await self._init_channels(db)
+
+        # Users
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                joined_at TEXT,
+                last_active TEXT,
+                joined_ts INTEGER,
+                last_active_ts INTEGER
             )
+        """)
+
+        # Activity (for statistics)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS user_activity (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                action TEXT,
+                action_at TEXT,
+                action_ts INTEGER
+            )
+        """)
+
+        # Join request tracking
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS channel_join_requests (
+                chat_id INTEGER,
+                user_id INTEGER,
+                requested_at TEXT,
+                requested_ts INTEGER,
+                PRIMARY KEY (chat_id, user_id)
+            )
+        """)
+
+        # Unique downloads per content
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS content_downloads (
+                content_id INTEGER,
+                user_id INTEGER,
+                downloaded_at TEXT,
+                downloaded_ts INTEGER,
+                PRIMARY KEY (content_id, user_id)
+            )
+        """)
+
+        await db.commit()
+
+        # ---- ALTER safe adds ----
+        # users.started_once
+        try:
+            await db.execute("ALTER TABLE users ADD COLUMN started_once INTEGER DEFAULT 0")
+            await db.commit()
+        except:
+            pass
+
+        # epoch (INTEGER) vaqt ustunlari; eski ISO matnlar migrate_timestamps() da ko'chiriladi
+        for table, cols in EPOCH_COLUMNS:
+            for _, ts_col in cols:
+                try:
+                    await db.execute(f"ALTER TABLE {table} ADD COLUMN {ts_col} INTEGER")
+                    await db.commit()
+                except:
+                    pass
+
+        await db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        # ---- Download time series + leaderboards ----
+        # bucket = epoch // TREND_BUCKET_SECONDS (soatlik)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS download_buckets (
+                bucket INTEGER NOT NULL,
+                content_id INTEGER NOT NULL,
+                downloads INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, content_id)
+            ) WITHOUT ROWID
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS leaderboards (
+                board TEXT NOT NULL,
+                rank INTEGER NOT NULL,
+                content_id INTEGER NOT NULL,
+                title TEXT,
+                content_type TEXT,
+                downloads INTEGER NOT NULL,
+                refreshed_at TEXT,
+                PRIMARY KEY (board, rank)
+            ) WITHOUT ROWID
+        """)
+        await db.commit()
+
+        # ---- Retention ----
+        # eski user_activity qatorlari shu jadvalga kunlik yig'indi sifatida o'tkaziladi
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS user_activity_daily (
+                day TEXT NOT NULL,
+                action TEXT NOT NULL,
+                events INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, action)
+            ) WITHOUT ROWID
+        """)
+        await db.execute("DROP INDEX IF EXISTS idx_join_requests_requested_at")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_join_requests_requested_ts ON channel_join_requests (requested_ts)"
+        )
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_joined_ts ON users (joined_ts)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_last_active_ts ON users (last_active_ts)")
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS cohort_activity (
+                cohort_day INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                users INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (cohort_day, day)
+            ) WITHOUT ROWID
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS last_active_days (
+                day INTEGER PRIMARY KEY,
+                users INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        await db.commit()
+
+        await self._check_hot(db)
+
+    async def _check_hot(self, db) -> None:
+        """
+        Arzon izchillik tekshiruvi (tezkor yo'lda ham): epoch_migrated bayrog'i va bo'sh
+        last_active_days / download_buckets uchun bir martalik backfill.
+        """
+        cur = await db.execute("SELECT value FROM meta WHERE key = 'epoch_migrated'")
+        row = await cur.fetchone()
+        self.epoch_migrated = bool(row and row[0] == "1")
+
+        cur = await db.execute("SELECT EXISTS (SELECT 1 FROM last_active_days)")
+        if not (await cur.fetchone())[0]:
+            # bir martalik backfill: gistogramma users.last_active dan aniq tiklanadi, keyin faqat
+            # inkremental. cohort_activity ni tiklab bo'lmaydi — u shu versiyadan boshlab to'planadi.
+            active = self._ts("last_active_ts", "last_active")
+            await db.execute(f"""
+                INSERT INTO last_active_days (day, users)
+                SELECT {active} / 86400, COUNT(*) FROM users WHERE {active} IS NOT NULL GROUP BY 1
+            """)
+            await db.commit()
+
+        cur = await db.execute("SELECT EXISTS (SELECT 1 FROM download_buckets)")
+        if not (await cur.fetchone())[0]:
+            # bir martalik backfill: mavjud content_downloads dan oxirgi TREND_RETENTION_DAYS kun
+            since = now_ts() - TREND_RETENTION_DAYS * 86400
+            ts = self._ts("downloaded_ts", "downloaded_at")
+            await db.execute(f"""
+                INSERT INTO download_buckets (bucket, content_id, downloads)
+                SELECT {ts} / {TREND_BUCKET_SECONDS}, content_id, COUNT(*)
+                FROM content_downloads
+                WHERE {ts} >= ?
+                GROUP BY 1, 2
+            """, (since,))
             await db.commit()
 
     # ---------- USERS ----------
     async def add_user(self, user) -> None:
         """
         TALAB: /start statistikaga faqat 1 marta yozilsin.
+        known_users dagi foydalanuvchi uchun SELECT yo'q — bitta upsert, u ham qatorni faqat
+        ism/username o'zgarganda yoki kunning birinchi faolligida yozadi.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT started_once FROM users WHERE user_id=?", (user.id,))
+        joined = self._ts("joined_ts", "joined_at")
+        active = self._ts("last_active_ts", "last_active")
+        async with self._hot_writer() as db:
+            now = now_ts()
+            today = now // 86400
+            # writer navbati ichida: bir userning parallel /start lari kunni ikki marta sanamasin
+            prev_day = self.known_users.get(user.id) if self.known_users.ready else None
+            if prev_day is not None:
+                cur = await db.execute(f"""
+                    INSERT INTO users (user_id, username, first_name, last_name, joined_ts, last_active_ts, started_once)
+                    VALUES (?, ?, ?, ?, ?, ?, 1)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        username = excluded.username, first_name = excluded.first_name,
+                        last_name = excluded.last_name, last_active_ts = excluded.last_active_ts
+                    WHERE ? OR username IS NOT excluded.username OR first_name IS NOT excluded.first_name
+                        OR last_name IS NOT excluded.last_name
+                    RETURNING {joined}
+                """, (
+                    user.id, user.username, user.first_name or "",
+                    user.last_name or "", now, now, prev_day < today
+                ))
+                rows = await cur.fetchall()
+                if rows and prev_day < today:
+                    await self._track_active_day(db, rows[0][0], prev_day * 86400, now)
+                await db.commit()
+                self.known_users.set(user.id, today)
+                return
+
+            cur = await db.execute(f"SELECT started_once, {joined}, {active} FROM users WHERE user_id=?", (user.id,))
             row = await cur.fetchone()
-            now = get_utc_now().isoformat()
 
             if row is None:
                 await db.execute("""
-                    INSERT INTO users (user_id, username, first_name, last_name, joined_at, last_active, started_once)
+                    INSERT INTO users (user_id, username, first_name, last_name, joined_ts, last_active_ts, started_once)
                     VALUES (?, ?, ?, ?, ?, ?, 1)
                 """, (
                     user.id, user.username, user.first_name or "",
                     user.last_name or "", now, now
                 ))
                 await db.execute(
-                    "INSERT INTO user_activity (user_id, action, action_at) VALUES (?, ?, ?)",
+                    "INSERT INTO user_activity (user_id, action, action_ts) VALUES (?, ?, ?)",
                     (user.id, "start", now)
                 )
+                await self._track_active_day(db, now, None, now)
             else:
                 await db.execute(
-                    "UPDATE users SET username=?, first_name=?, last_name=?, last_active=? WHERE user_id=?",
+                    "UPDATE users SET username=?, first_name=?, last_name=?, last_active_ts=? WHERE user_id=?",
                     (user.username, user.first_name or "", user.last_name or "", now, user.id)
                 )
+                await self._track_active_day(db, row[1], row[2], now)
 
             await db.commit()
+        self.known_users.set(user.id, today)
 
     async def update_user_activity(self, user_id: int) -> None:
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "UPDATE users SET last_active = ? WHERE user_id = ?",
-                (get_utc_now().isoformat(), user_id)
-            )
+        joined = self._ts("joined_ts", "joined_at")
+        active = self._ts("last_active_ts", "last_active")
+        async with self._hot_writer() as db:
+            now = now_ts()
+            today = now // 86400
+            if self.known_users.ready:
+                prev_day = self.known_users.get(user_id)
+                if prev_day is None:
+                    return  # bunday user yo'q — UPDATE hech narsa o'zgartirmasdi
+                cur = await db.execute(
+                    f"UPDATE users SET last_active_ts = ? WHERE user_id = ? RETURNING {joined}",
+                    (now, user_id)
+                )
+                rows = await cur.fetchall()
+                if rows and prev_day < today:
+                    await self._track_active_day(db, rows[0][0], prev_day * 86400, now)
+            else:
+                cur = await db.execute(f"SELECT {joined}, {active} FROM users WHERE user_id = ?", (user_id,))
+                row = await cur.fetchone()
+                await db.execute(
+                    "UPDATE users SET last_active_ts = ? WHERE user_id = ?",
+                    (now, user_id)
+                )
+                if row is None:
+                    await db.commit()
+                    return
+                await self._track_active_day(db, row[0], row[1], now)
             await db.commit()
+        self.known_users.set(user_id, today)
+
+    async def load_known_users(self, chunk: int = KNOWN_USERS_LOAD_CHUNK) -> int:
+        """
+        known_users ni users dan user_id tartibida bo'laklab yuklaydi (fon vazifasi: millionlab
+        qatorda bir necha soniya). Tugaguncha add_user / update_user_activity SELECT yo'lida ishlaydi.
+        """
+        known = self.known_users
+        if known.ready:
+            return len(known)
+        active = self._ts("last_active_ts", "last_active")
+        last = -2 ** 63
+        while True:
+            # har bo'lak alohida qisqa o'qish — WAL checkpoint ni uzoq to'smasin
+            async with self._reader(self.hot_db_path, "load:known_users", LIST_QUERY_TIMEOUT) as db:
+                cur = await db.execute(
+                    f"SELECT user_id, COALESCE({active}, 0) / 86400 FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (last, chunk)
+                )
+                rows = await cur.fetchall()
+            if not rows:
+                break
+            known.extend(rows)
+            last = rows[-1][0]
+        known.finish_loading()
+        return len(known)
+
+    @staticmethod
+    async def _track_active_day(db, joined_ts: Optional[int], prev_active_ts: Optional[int], now: int) -> None:
+        """
+        Kundagi birinchi faollik bo'lsa (oldingi last_active boshqa kunda) kohort katagi va
+        last_active_days gistogrammasini yangilaydi. Chaqiruvchining tranzaksiyasi ichida.
+        """
+        today = now // 86400
+        prev_day = prev_active_ts // 86400 if prev_active_ts is not None else None
+        if prev_day is not None and prev_day >= today:
+            return
+        await db.execute(
+            "INSERT INTO cohort_activity (cohort_day, day, users) VALUES (?, ?, 1) "
+            "ON CONFLICT(cohort_day, day) DO UPDATE SET users = users + 1",
+            ((joined_ts if joined_ts is not None else now) // 86400, today)
+        )
+        if prev_day is not None:
+            await db.execute("UPDATE last_active_days SET users = users - 1 WHERE day = ?", (prev_day,))
+        await db.execute(
+            "INSERT INTO last_active_days (day, users) VALUES (?, 1) "
+            "ON CONFLICT(day) DO UPDATE SET users = users + 1",
+            (today,)
+        )
 
     async def get_all_users(self) -> List[int]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._reader(self.hot_db_path, "list:users", LIST_QUERY_TIMEOUT) as db:
             cur = await db.execute("SELECT user_id FROM users")
             rows = await cur.fetchall()
             return [r[0] for r in rows]
 
     # ---------- ADMINS ----------
     async def is_admin(self, user_id: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
-            return await cur.fetchone() is not None
-
-    async def get_admins(self) -> List[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT user_id, added_at FROM admins")
-            rows = await cur.fetchall()
-            return [{"user_id": r[0], "added_at": r[1]} for r in rows]
+        if "admin_ids" not in self._config:
+            await self.get_admins()
+        return user_id in self._config["admin_ids"]
+
+    async def get_admins(self) -> List[Admin]:
+        admins = self._config.get("admins")
+        if admins is None:
+            async with self._catalog() as db:
+                cur = await db.execute("SELECT user_id, added_at FROM admins")
+                cur.row_factory = row_factory(Admin)
+                admins = self._config["admins"] = await cur.fetchall()
+            self._config["admin_ids"] = {a.user_id for a in admins}
+        return list(admins)
 
     async def add_admin(self, user_id: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._catalog_writer() as db:
             try:
                 await db.execute(
                     "INSERT INTO admins (user_id, added_at) VALUES (?, ?)",
                     (user_id, get_utc_now().isoformat())
                 )
                 await db.commit()
+                self._invalidate("admins", "admin_ids")
                 return True
             except Exception as e:
                 logger.error(f"Error adding admin: {e}")
                 return False
 
     async def remove_admin(self, user_id: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._catalog_writer() as db:
             cur = await db.execute("DELETE FROM admins WHERE user_id = ?", (user_id,))
             await db.commit()
-            return cur.rowcount > 0
+        self._invalidate("admins", "admin_ids")
+        return cur.rowcount > 0
+
+    def _invalidate(self, *keys: str) -> None:
+        for key in keys:
+            self._config.pop(key, None)
 
     # ---------- CHANNELS ----------
-    async def get_channels(self) -> List[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT chat_id, title, username, COALESCE(invite_link,'') FROM channels")
-            rows = await cur.fetchall()
-            return [{"chat_id": r[0], "title": r[1], "username": r[2], "invite_link": r[3]} for r in rows]
+    # kanallar botga xos (mirror botda hot bazada) — shuning uchun _config da emas, shu obyektda
+    async def get_channels(self) -> List[Channel]:
+        channels = self._channels
+        if channels is None:
+            async with aiosqlite.connect(self.channels_path, timeout=DB_BUSY_TIMEOUT) as db:
+                cur = await db.execute("SELECT chat_id, title, username, COALESCE(invite_link,'') FROM channels")
+                cur.row_factory = row_factory(Channel)
+                channels = self._channels = await cur.fetchall()
+        return list(channels)
 
     async def add_channel(self, chat_id: int, title: str, username: str = "", invite_link: str = "") -> None:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._writer_for(self.channels_path) as db:
             await db.execute(
                 "INSERT OR REPLACE INTO channels (chat_id, title, username, invite_link, added_at) VALUES (?, ?, ?, ?, ?)",
                 (chat_id, title, username, invite_link, get_utc_now().isoformat())
             )
             await db.commit()
+        self._channels = None
 
     async def remove_channel(self, chat_id: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._writer_for(self.channels_path) as db:
             cur = await db.execute("DELETE FROM channels WHERE chat_id = ?", (chat_id,))
             await db.commit()
-            return cur.rowcount > 0
+        self._channels = None
+        return cur.rowcount > 0
 
     # Join request tracking
     async def save_join_request(self, chat_id: int, user_id: int) -> None:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._hot_writer() as db:
+            # REPLACE = DELETE + INSERT; upsert esa mavjud qatorni joyida yangilaydi
             await db.execute(
-                "INSERT OR REPLACE INTO channel_join_requests (chat_id, user_id, requested_at) VALUES (?, ?, ?)",
-                (chat_id, user_id, get_utc_now().isoformat())
+                "INSERT INTO channel_join_requests (chat_id, user_id, requested_ts) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id, user_id) DO UPDATE SET requested_ts = excluded.requested_ts, requested_at = NULL",
+                (chat_id, user_id, now_ts())
             )
             await db.commit()
 
     async def has_join_request(self, chat_id: int, user_id: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
+        """
+        TTL dan eski so'rovlar hisobga olinmaydi (maintenance ularni keyin o'chiradi).
+        """
+        since = now_ts() - JOIN_REQUEST_TTL_DAYS * 86400
+        ts = self._ts("requested_ts", "requested_at")
+        async with self._hot() as db:
             cur = await db.execute(
-                "SELECT 1 FROM channel_join_requests WHERE chat_id=? AND user_id=?",
-                (chat_id, user_id)
+                f"SELECT 1 FROM channel_join_requests WHERE chat_id=? AND user_id=? AND {ts} >= ?",
+                (chat_id, user_id, since)
             )
             return await cur.fetchone() is not None
 
     # ---------- INSTAGRAM LINKS ----------
     async def add_instagram_link(self, title: str, url: str) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._catalog_writer() as db:
             cur = await db.execute(
                 "INSERT INTO instagram_links (title, url, added_at) VALUES (?, ?, ?)",
                 (title.strip() or "Instagram", url.strip(), get_utc_now().isoformat())
             )
             await db.commit()
-            return cur.lastrowid
+        self._invalidate("instagram_links")
+        return cur.lastrowid
 
     async def remove_instagram_link(self, link_id: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._catalog_writer() as db:
             cur = await db.execute("DELETE FROM instagram_links WHERE id=?", (link_id,))
             await db.commit()
-            return cur.rowcount > 0
+        self._invalidate("instagram_links")
+        return cur.rowcount > 0
+
+    async def get_instagram_links(self) -> List[InstagramLink]:
+        links = self._config.get("instagram_links")
+        if links is None:
+            async with self._catalog() as db:
+                cur = await db.execute("SELECT id, title, url FROM instagram_links ORDER BY id")
+                cur.row_factory = row_factory(InstagramLink)
+                links = self._config["instagram_links"] = await cur.fetchall()
+        return list(links)
+
+    # ---------- SEARCH ----------
+    @staticmethod
+    def _content_terms(title: str, description: str) -> set:
+        return set(search_tokens(title)) | set(search_tokens(description))
+
+    @staticmethod
+    async def _index_content(db, content_id: int, title: str, description: str) -> None:
+        await db.execute(
+            "INSERT OR REPLACE INTO content_fts (rowid, title, description) VALUES (?, ?, ?)",
+            (content_id, normalize_search_text(title), normalize_search_text(description))
+        )
+        await db.executemany(
+            "INSERT INTO search_terms (term, docs) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET docs = docs + 1",
+            [(t,) for t in DatabaseManager._content_terms(title, description)]
+        )
 
-    async def get_instagram_links(self) -> List[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT id, title, url FROM instagram_links ORDER BY id")
+    @staticmethod
+    async def _unindex_content(db, content_id: int) -> None:
+        cur = await db.execute("SELECT title, description FROM content WHERE id = ?", (content_id,))
+        row = await cur.fetchone()
+        await db.execute("DELETE FROM content_fts WHERE rowid = ?", (content_id,))
+        if not row:
+            return
+        terms = [(t,) for t in DatabaseManager._content_terms(row[0], row[1])]
+        await db.executemany("UPDATE search_terms SET docs = docs - 1 WHERE term = ?", terms)
+        await db.executemany("DELETE FROM search_terms WHERE term = ? AND docs <= 0", terms)
+
+    async def _rebuild_search_index(self, db) -> None:
+        await db.execute("DELETE FROM content_fts")
+        await db.execute("DELETE FROM search_terms")
+        terms: Dict[str, int] = {}
+        cur = await db.execute("SELECT id, title, description FROM content")
+        while True:
+            rows = await cur.fetchmany(1000)
+            if not rows:
+                break
+            await db.executemany(
+                "INSERT INTO content_fts (rowid, title, description) VALUES (?, ?, ?)",
+                [(r[0], normalize_search_text(r[1]), normalize_search_text(r[2])) for r in rows]
+            )
+            for r in rows:
+                for t in self._content_terms(r[1], r[2]):
+                    terms[t] = terms.get(t, 0) + 1
+        await db.executemany("INSERT INTO search_terms (term, docs) VALUES (?, ?)", terms.items())
+        await db.commit()
+        logger.info("content_fts qayta qurildi")
+
+    async def rebuild_search_index(self) -> None:
+        async with self._catalog_writer() as db:
+            await self._rebuild_search_index(db)
+
+    async def _typo_candidates(self, db, token: str, limit: int = 8) -> List[str]:
+        """
+        Xato yozilgan token uchun lug'atdan yaqin termlar (Levenshtein <= 1..2).
+        Birinchi 2 harf to'g'ri deb olinadi, shunda lug'atdan faqat kichik oraliq o'qiladi.
+        """
+        if len(token) < 4:
+            return []
+        k = 1 if len(token) <= 7 else 2
+        head = token[:2]
+        cur = await db.execute(
+            "SELECT term, docs FROM search_terms "
+            "WHERE term >= ? AND term < ? AND length(term) BETWEEN ? AND ?",
+            (head, head + "\uffff", len(token) - k, len(token) + k)
+        )
+        # arzon filtr: har bir tahrir harflar to'plamini ko'pi bilan 2 taga o'zgartiradi
+        chars = set(token)
+        distance = _edit_distance_matcher(token)
+        found = []
+        for term, docs in await cur.fetchall():
+            if len(chars.symmetric_difference(term)) > 2 * k:
+                continue
+            d = distance(term)
+            if d <= k:
+                found.append((d, -docs, term))
+        found.sort()
+        return [t for _, _, t in found[:limit]]
+
+    async def search_content(self, query: str, limit: int = 10, offset: int = 0) -> Tuple[List[Dict], bool]:
+        """
+        Sarlavha/tavsif bo'yicha qidiruv:
+        - har bir token prefix sifatida qidiriladi ("inter" -> "interstellar")
+        - hech narsa topilmasa, tokenlar lug'atdagi yaqin termlar bilan almashtiriladi (typo)
+        - sarlavhadagi moslik tavsifdagidan kuchliroq baholanadi (bm25); faqat eng yangi
+          SEARCH_RANK_CANDIDATES ta moslik baholanadi
+        Qaytaradi: (rows, keyingi sahifa bormi)
+        """
+        tokens = search_tokens(query)
+        if not tokens:
+            return [], False
+
+        # MATCH dan avval rowid bo'yicha (eng yangilari) SEARCH_RANK_CANDIDATES ta nomzod olinadi,
+        # bm25 va saralash faqat ular ustida — keng prefiksda ham kechikish chegaralangan
+        sql = (
+            "SELECT c.id, c.title, c.content_type, COALESCE(c.downloads_count,0) "
+            "FROM (SELECT rowid AS id, bm25(content_fts, 10.0, 1.0) AS score FROM content_fts "
+            "      WHERE content_fts MATCH ? ORDER BY rowid DESC LIMIT ?) f "
+            "JOIN content c ON c.id = f.id "
+            "ORDER BY f.score, c.downloads_count DESC "
+            "LIMIT ? OFFSET ?"
+        )
+        async with self._catalog() as db:
+            match = " AND ".join(f'"{t}"*' for t in tokens)
+            cur = await db.execute(sql, (match, SEARCH_RANK_CANDIDATES, limit + 1, offset))
             rows = await cur.fetchall()
-            return [{"id": r[0], "title": r[1], "url": r[2]} for r in rows]
+
+            if not rows:
+                groups = []
+                for t in tokens:
+                    alts = [f'"{t}"*'] + [f'"{c}"' for c in await self._typo_candidates(db, t)]
+                    groups.append("(" + " OR ".join(alts) + ")")
+                cur = await db.execute(sql, (" AND ".join(groups), SEARCH_RANK_CANDIDATES, limit + 1, offset))
+                rows = await cur.fetchall()
+
+        has_more = len(rows) > limit
+        return [{
+            "id": r[0],
+            "title": r[1],
+            "content_type": r[2],
+            "downloads_count": r[3],
+        } for r in rows[:limit]], has_more
 
     # ---------- CONTENT ----------
     async def add_content(self, file_id: Optional[str], title: str, description: str, content_type: str, added_by: int) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._catalog_writer() as db:
             try:
                 cur = await db.execute(
                     """INSERT INTO content (file_id, title, description, content_type, added_by, added_at, downloads_count)
                        VALUES (?, ?, ?, ?, ?, ?, COALESCE(?,0))""",
                     (file_id, title, description, content_type, added_by, get_utc_now().isoformat(), 0)
                 )
+                await self._index_content(db, cur.lastrowid, title, description)
                 await db.commit()
+                self.catalog_version += 1
                 return cur.lastrowid
             except Exception as e:
                 logger.error(f"Error adding content: {e}")
                 return 0
 
-    async def get_content(self, content_id: int) -> Optional[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+    async def get_content(self, content_id: int) -> Optional[Content]:
+        key = (self.catalog_version, content_id)
+        content = self.content_cache.get(key)
+        if content is not None:
+            return content
+        async with self._catalog() as db:
             cur = await db.execute(
                 "SELECT id, file_id, title, description, content_type, COALESCE(downloads_count,0) FROM content WHERE id=?",
                 (content_id,)
             )
-            row = await cur.fetchone()
-            if not row:
-                return None
-            return {
-                "id": row[0],
-                "file_id": row[1],
-                "title": row[2],
-                "description": row[3],
-                "content_type": row[4],
-                "downloads_count": row[5],
-            }
+            cur.row_factory = row_factory(Content)
+            content = await cur.fetchone()
+        if content is None:
+            return None
+        self.content_cache.set(key, content)
+        return content
 
     async def delete_content(self, content_id: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._catalog_writer() as db:
             await db.execute("DELETE FROM serial_parts WHERE serial_id = ?", (content_id,))
-            await db.execute("DELETE FROM content_downloads WHERE content_id = ?", (content_id,))
+            await self._unindex_content(db, content_id)
             cur = await db.execute("DELETE FROM content WHERE id = ?", (content_id,))
             await db.commit()
-            return cur.rowcount > 0
+            deleted = cur.rowcount > 0
+        self.catalog_version += 1
+        self._pending_downloads.pop(content_id, None)
+        await self.purge_content_stats(content_id)
+        return deleted
+
+    async def purge_content_stats(self, content_id: int) -> None:
+        """O'chirilgan kontentning shu hot bazadagi yuklanish/reyting qatorlari."""
+        async with self._hot_writer() as db:
+            await db.execute("DELETE FROM content_downloads WHERE content_id = ?", (content_id,))
+            await db.execute("DELETE FROM download_buckets WHERE content_id = ?", (content_id,))
+            await db.execute("DELETE FROM leaderboards WHERE content_id = ?", (content_id,))
+            await db.commit()
 
-    async def get_all_content(self, content_type: str = None) -> List[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+    async def get_all_content(self, content_type: str = None) -> List[Content]:
+        async with self._reader(self.db_path, "list:content", LIST_QUERY_TIMEOUT) as db:
             if content_type:
                 cur = await db.execute(
-                    "SELECT id, title, description, content_type, added_at, COALESCE(downloads_count,0) "
+                    "SELECT id, file_id, title, description, content_type, COALESCE(downloads_count,0), added_at "
                     "FROM content WHERE content_type=? ORDER BY id",
                     (content_type,)
                 )
             else:
                 cur = await db.execute(
-                    "SELECT id, title, description, content_type, added_at, COALESCE(downloads_count,0) "
+                    "SELECT id, file_id, title, description, content_type, COALESCE(downloads_count,0), added_at "
                     "FROM content ORDER BY id"
                 )
+            cur.row_factory = row_factory(Content)
+            return await cur.fetchall()
+
+    async def get_content_page(
+        self,
+        content_type: str,
+        sort: str = "id",
+        cursor: Optional[Tuple[int, ...]] = None,
+        backward: bool = False,
+        limit: int = 10,
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Keyset pagination (OFFSET yo'q):
+        - sort="id": id bo'yicha o'sish tartibida, cursor = (id,)
+        - sort="downloads": downloads_count bo'yicha kamayish tartibida, cursor = (downloads_count, id)
+        - backward=True bo'lsa cursor dan oldingi sahifa olinadi
+        Serial qismlari soni sahifa uchun bitta GROUP BY join bilan olinadi.
+        Qaytaradi: (rows, shu yo'nalishda yana sahifa bormi)
+        """
+        if sort == "downloads":
+            key = "(c.downloads_count, c.id)"
+            order = "c.downloads_count DESC, c.id DESC"
+            reverse = "c.downloads_count ASC, c.id ASC"
+            cmp = ">" if backward else "<"
+        else:
+            key = "c.id"
+            order = "c.id ASC"
+            reverse = "c.id DESC"
+            cmp = "<" if backward else ">"
+
+        where = "c.content_type = ?"
+        params: list = [content_type]
+        if cursor:
+            if sort == "downloads":
+                where += f" AND {key} {cmp} (?, ?)"
+                params.extend(cursor[:2])
+            else:
+                where += f" AND {key} {cmp} ?"
+                params.append(cursor[-1])
+        params.append(limit + 1)
+
+        page_sql = (
+            "SELECT c.id, c.title, c.description, c.downloads_count FROM content c "
+            f"WHERE {where} ORDER BY {reverse if backward else order} LIMIT ?"
+        )
+        if content_type == "serial":
+            sql = (
+                f"WITH page AS ({page_sql}) "
+                "SELECT c.id, c.title, c.description, c.downloads_count, COUNT(sp.id) "
+                "FROM page c LEFT JOIN serial_parts sp ON sp.serial_id = c.id "
+                f"GROUP BY c.id ORDER BY {reverse if backward else order}"
+            )
+        else:
+            sql = page_sql
+
+        async with self._catalog() as db:
+            cur = await db.execute(sql, params)
             rows = await cur.fetchall()
-            return [{
-                "id": r[0],
-                "title": r[1],
-                "description": r[2],
-                "content_type": r[3],
-                "added_at": r[4],
-                "downloads_count": r[5],
-            } for r in rows]
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+        return [{
+            "id": r[0],
+            "title": r[1],
+            "description": r[2],
+            "downloads_count": r[3] or 0,
+            "parts_count": r[4] if len(r) > 4 else 0,
+        } for r in rows], has_more
 
     async def get_content_count(self, content_type: str = None) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._catalog() as db:
             if content_type:
                 cur = await db.execute("SELECT COUNT(*) FROM content WHERE content_type=?", (content_type,))
             else:
@@ -439,96 +2419,689 @@ class DatabaseManager:
             res = await cur.fetchone()
             return res[0] if res else 0
 
-    async def register_download(self, content_id: int, user_id: int) -> bool:
+    async def register_download(self, content_id: int, user_id: int) -> bool:
+        """
+        Unique download:
+        - 1 user -> 1 count
+        """
+        async with self._hot_writer() as db:
+            now = now_ts()
+            cur = await db.execute(
+                "INSERT OR IGNORE INTO content_downloads (content_id, user_id, downloaded_ts) VALUES (?, ?, ?)",
+                (content_id, user_id, now)
+            )
+            if cur.rowcount > 0:
+                if not self.split:
+                    await db.execute(
+                        "UPDATE content SET downloads_count = COALESCE(downloads_count,0) + 1 WHERE id=?",
+                        (content_id,)
+                    )
+                await db.execute(
+                    "INSERT INTO download_buckets (bucket, content_id, downloads) VALUES (?, ?, 1) "
+                    "ON CONFLICT(bucket, content_id) DO UPDATE SET downloads = downloads + 1",
+                    (now // TREND_BUCKET_SECONDS, content_id)
+                )
+                await db.commit()
+                if self.split:
+                    # katalog fayli yozuvchisini har bir yuklanishda band qilmaslik uchun
+                    self._pending_downloads[content_id] = self._pending_downloads.get(content_id, 0) + 1
+                return True
+            await db.commit()
+            return False
+
+    async def flush_download_counts(self) -> int:
+        """
+        Bo'lingan rejim: yig'ilgan downloads_count oshirishlarini katalogga bitta tranzaksiyada yozadi.
+        """
+        if not self._pending_downloads:
+            return 0
+        pending, self._pending_downloads = self._pending_downloads, {}
+        try:
+            async with self._catalog_writer() as db:
+                await db.executemany(
+                    "UPDATE content SET downloads_count = downloads_count + ? WHERE id = ?",
+                    [(n, cid) for cid, n in pending.items()]
+                )
+                await db.commit()
+        except Exception:
+            # yo'qolmasin: keyingi flush da qayta urinamiz
+            for cid, n in pending.items():
+                self._pending_downloads[cid] = self._pending_downloads.get(cid, 0) + n
+            raise
+        return len(pending)
+
+    # ---------- LEADERBOARDS ----------
+    async def refresh_leaderboards(self, top_n: int = TOP_N) -> None:
+        """
+        today / week / all reytinglarini qayta hisoblaydi (fon vazifasi chaqiradi).
+        today/week -> download_buckets, all -> content.downloads_count.
+        content_downloads umuman o'qilmaydi.
+        """
+        now = get_utc_now()
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        windows = {
+            "today": int(today_start.timestamp()) // TREND_BUCKET_SECONDS,
+            "week": int((now - timedelta(days=7)).timestamp()) // TREND_BUCKET_SECONDS,
+        }
+        refreshed_at = now.isoformat()
+        await self.flush_download_counts()
+
+        # bucketlar va content alohida fayllarda bo'lishi mumkin: join o'rniga ikki qadam
+        sums: Dict[str, list] = {}
+        async with self._hot() as db:
+            for board, since in windows.items():
+                cur = await db.execute("""
+                    SELECT content_id, SUM(downloads) AS d
+                    FROM download_buckets WHERE bucket >= ?
+                    GROUP BY content_id ORDER BY d DESC, content_id LIMIT ?
+                """, (since, top_n * 2))
+                sums[board] = await cur.fetchall()
+
+        boards: Dict[str, list] = {}
+        async with self._catalog() as db:
+            ids = sorted({cid for rows in sums.values() for cid, _ in rows})
+            titles = {}
+            if ids:
+                cur = await db.execute(
+                    f"SELECT id, title, content_type FROM content WHERE id IN ({','.join('?' * len(ids))})", ids
+                )
+                titles = {r[0]: (r[1], r[2]) for r in await cur.fetchall()}
+            for board, rows in sums.items():
+                boards[board] = [
+                    (cid, titles[cid][0], titles[cid][1], d) for cid, d in rows if cid in titles
+                ][:top_n]
+
+            cur = await db.execute(
+                "SELECT id, title, content_type, downloads_count FROM content "
+                "WHERE downloads_count > 0 ORDER BY downloads_count DESC LIMIT ?",
+                (top_n,)
+            )
+            boards["all"] = await cur.fetchall()
+
+        async with self._hot_writer() as db:
+            for board, rows in boards.items():
+                await db.execute("DELETE FROM leaderboards WHERE board = ?", (board,))
+                await db.executemany(
+                    "INSERT INTO leaderboards (board, rank, content_id, title, content_type, downloads, refreshed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(board, i, r[0], r[1], r[2], r[3], refreshed_at) for i, r in enumerate(rows, 1)]
+                )
+
+            # reytinglarga kerak bo'lmaydigan eski bucketlar
+            oldest = int((now - timedelta(days=TREND_RETENTION_DAYS)).timestamp()) // TREND_BUCKET_SECONDS
+            await db.execute("DELETE FROM download_buckets WHERE bucket < ?", (oldest,))
+            await db.commit()
+
+    async def get_leaderboard(self, board: str) -> List[Dict]:
+        async with self._hot() as db:
+            cur = await db.execute(
+                "SELECT rank, content_id, title, content_type, downloads FROM leaderboards "
+                "WHERE board = ? ORDER BY rank",
+                (board,)
+            )
+            rows = await cur.fetchall()
+            return [{
+                "rank": r[0],
+                "id": r[1],
+                "title": r[2],
+                "content_type": r[3],
+                "downloads": r[4],
+            } for r in rows]
+
+    # ---------- SERIAL PARTS ----------
+    async def add_serial_part(self, serial_id: int, part_number: int, file_id: str, title: str, added_by: int) -> bool:
+        async with self._catalog_writer() as db:
+            try:
+                await db.execute(
+                    """INSERT INTO serial_parts (serial_id, part_number, file_id, title, added_by, added_at)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (serial_id, part_number, file_id, title, added_by, get_utc_now().isoformat())
+                )
+                await db.commit()
+                self.catalog_version += 1
+                return True
+            except Exception as e:
+                logger.error(f"Error adding serial part: {e}")
+                return False
+
+    async def bulk_ingest(self, contents: List[Dict], parts: List[Tuple[int, int, str, str]], added_by: int) -> Optional[List[int]]:
+        """
+        Ko'p kontent va qismlarni bitta tranzaksiyada yozadi (album / JSONL import).
+        contents: {"id" (ixtiyoriy kod), "file_id", "title", "description", "content_type"};
+        parts: (serial_id, part_number, file_id, title).
+        Yangi content id lari qaytadi; xato bo'lsa hech narsa yozilmaydi va None.
+        """
+        # aniq kodlilar oldin: AUTOINCREMENT keyingi qatorlarga shu kodlarni bermasin
+        contents = sorted(contents, key=lambda c: c.get("id") is None)
+        now = get_utc_now().isoformat()
+        async with self._catalog_writer() as db:
+            try:
+                ids = []
+                for c in contents:
+                    cur = await db.execute(
+                        """INSERT INTO content (id, file_id, title, description, content_type, added_by, added_at, downloads_count)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, 0)""",
+                        (c.get("id"), c["file_id"], c["title"], c["description"], c["content_type"], added_by, now)
+                    )
+                    await self._index_content(db, cur.lastrowid, c["title"], c["description"])
+                    ids.append(cur.lastrowid)
+                await db.executemany(
+                    """INSERT INTO serial_parts (serial_id, part_number, file_id, title, added_by, added_at)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    [(sid, pno, fid, title, added_by, now) for sid, pno, fid, title in parts]
+                )
+                await db.commit()
+                self.catalog_version += 1
+                return ids
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error in bulk ingest: {e}")
+                return None
+
+    async def get_content_types(self, content_ids: List[int]) -> Dict[int, str]:
+        result = {}
+        ids = list(set(content_ids))
+        async with self._catalog() as db:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                cur = await db.execute(
+                    f"SELECT id, content_type FROM content WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                )
+                result.update(dict(await cur.fetchall()))
+        return result
+
+    async def get_serial_parts(self, serial_id: int) -> List[SerialPart]:
+        """Keshdagi ro'yxat o'zi qaytariladi (qatorlar o'zgarmas) — chaqiruvchi uni o'zgartirmasin."""
+        key = (self.catalog_version, serial_id)
+        parts = self.parts_cache.get(key)
+        if parts is None:
+            async with self._catalog() as db:
+                cur = await db.execute(
+                    "SELECT part_number, file_id, title FROM serial_parts WHERE serial_id=? ORDER BY part_number",
+                    (serial_id,)
+                )
+                cur.row_factory = row_factory(SerialPart)
+                parts = await cur.fetchall()
+            self.parts_cache.set(key, parts)
+        return parts
+
+    async def get_serial_parts_count(self, serial_id: int) -> int:
+        async with self._catalog() as db:
+            cur = await db.execute("SELECT COUNT(*) FROM serial_parts WHERE serial_id=?", (serial_id,))
+            res = await cur.fetchone()
+            return res[0] if res else 0
+
+    async def get_video_items(self, content_ids: List[int]) -> List[VideoItem]:
+        """
+        Inline natijalar uchun: har bir kontentning yuboriladigan videosi.
+        Kino -> o'z file_id si, serial -> 1-qism file_id si (qismlar soni bilan).
+        Tartib content_ids tartibida saqlanadi.
+        """
+        if not content_ids:
+            return []
+        marks = ",".join("?" * len(content_ids))
+        async with self._catalog() as db:
+            cur = await db.execute(
+                "SELECT c.id, c.title, c.description, c.content_type, c.file_id, sp.file_id, sp.title, "
+                "(SELECT COUNT(*) FROM serial_parts s2 WHERE s2.serial_id = c.id) "
+                "FROM content c LEFT JOIN serial_parts sp ON sp.serial_id = c.id AND sp.part_number = 1 "
+                f"WHERE c.id IN ({marks})",
+                content_ids
+            )
+            rows = await cur.fetchall()
+
+        by_id = {}
+        for r in rows:
+            is_serial = r[3] == "serial"
+            file_id = r[5] if is_serial else r[4]
+            if not file_id:
+                continue
+            by_id[r[0]] = VideoItem(r[0], r[1], r[2], r[3], file_id, r[6], r[7])
+        return [by_id[cid] for cid in content_ids if cid in by_id]
+
+    # ---------- MAINTENANCE ----------
+    async def rollup_activity(self, before: int, batch: int = 5000) -> int:
+        """
+        before dan eski user_activity qatorlarining bir bo'lagini user_activity_daily ga
+        qo'shib, xom qatorlarni o'chiradi. Bitta qisqa tranzaksiya. Qaytaradi: o'chirilganlar soni.
+        """
+        async with self._hot_writer() as db:
+            # eski qatorlar id bo'yicha boshida turadi, shuning uchun skan erta to'xtaydi
+            ts = self._ts("action_ts", "action_at")
+            cur = await db.execute(
+                f"SELECT MAX(id) FROM (SELECT id FROM user_activity WHERE {ts} < ? ORDER BY id LIMIT ?)",
+                (before, batch)
+            )
+            max_id = (await cur.fetchone())[0]
+            if max_id is None:
+                return 0
+
+            await db.execute(f"""
+                INSERT INTO user_activity_daily (day, action, events)
+                SELECT date({ts}, 'unixepoch'), action, COUNT(*)
+                FROM user_activity
+                WHERE id <= ? AND {ts} < ?
+                GROUP BY 1, 2
+                ON CONFLICT(day, action) DO UPDATE SET events = events + excluded.events
+            """, (max_id, before))
+            cur = await db.execute(f"DELETE FROM user_activity WHERE id <= ? AND {ts} < ?", (max_id, before))
+            await db.commit()
+            return cur.rowcount
+
+    async def prune_cohorts(self, before_day: int) -> int:
+        """COHORT_RETENTION_DAYS dan eski kohortlar (jadval kichik — bitta DELETE)."""
+        async with self._hot_writer() as db:
+            cur = await db.execute("DELETE FROM cohort_activity WHERE cohort_day < ?", (before_day,))
+            await db.commit()
+            return cur.rowcount
+
+    async def expire_join_requests(self, before: int, batch: int = 5000) -> int:
+        ts = self._ts("requested_ts", "requested_at")
+        async with self._hot_writer() as db:
+            cur = await db.execute(
+                "DELETE FROM channel_join_requests WHERE rowid IN "
+                f"(SELECT rowid FROM channel_join_requests WHERE {ts} < ? LIMIT ?)",
+                (before, batch)
+            )
+            await db.commit()
+            return cur.rowcount
+
+    async def get_auto_vacuum_mode(self, path: str) -> int:
+        async with aiosqlite.connect(path, timeout=DB_BUSY_TIMEOUT) as db:
+            cur = await db.execute("PRAGMA auto_vacuum")
+            return (await cur.fetchone())[0]
+
+    async def convert_to_incremental_vacuum(self, path: str) -> None:
+        """Bir martalik: butun faylni qayta yozadi (katta bazada yozuvchilarni to'xtatadi)."""
+        async with self._writer_for(path) as db:
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await db.execute("VACUUM")
+
+    async def incremental_vacuum(self, path: str, pages: int = 256) -> Tuple[int, int]:
         """
-        Unique download:
-        - 1 user -> 1 count
+        pages tagacha bo'sh sahifani fayldan qaytaradi. Qaytaradi: (bo'shatildi, qoldi).
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute(
-                "INSERT OR IGNORE INTO content_downloads (content_id, user_id, downloaded_at) VALUES (?, ?, ?)",
-                (content_id, user_id, get_utc_now().isoformat())
+        async with self._writer_for(path) as db:
+            cur = await db.execute("PRAGMA freelist_count")
+            before = (await cur.fetchone())[0]
+            if before:
+                # incremental_vacuum(0) hammasini bo'shatadi, shuning uchun faqat musbat son
+                cur = await db.execute(f"PRAGMA incremental_vacuum({max(1, int(pages))})")
+                await cur.fetchall()
+            cur = await db.execute("PRAGMA freelist_count")
+            after = (await cur.fetchone())[0]
+            return before - after, after
+
+    async def optimize(self, path: str) -> None:
+        """
+        ANALYZE ning arzon varianti: faqat kerak bo'lgan jadvallar, cheklangan namuna bilan.
+        """
+        async with self._writer_for(path) as db:
+            await db.execute("PRAGMA analysis_limit = 1000")
+            await db.execute("PRAGMA optimize")
+
+    # ---------- EXPORT ----------
+    async def iter_export_batches(self, kind: str):
+        """
+        EXPORT_COLUMNS[kind] tartibidagi qatorlar, EXPORT_FETCH_ROWS lik ro'yxatlar bo'lib —
+        million qatorli users ham xotirada to'liq yig'ilmaydi. Hammasi PK tartibida: SQLite
+        vaqtinchalik saralash qilmaydi. Reader ulanishini ushlab turadi — chaqiruvchi
+        generatorni aclosing() bilan yopsin.
+        """
+        iso = "strftime('%Y-%m-%d %H:%M:%S', {}, 'unixepoch')"
+        if kind == "users":
+            path = self.hot_db_path
+            sql = (
+                "SELECT user_id, username, first_name, last_name, "
+                f"{iso.format(self._ts('joined_ts', 'joined_at'))}, "
+                f"{iso.format(self._ts('last_active_ts', 'last_active'))} "
+                "FROM users ORDER BY user_id"
             )
-            await db.commit()
-            if cur.rowcount > 0:
-                await db.execute(
-                    "UPDATE content SET downloads_count = COALESCE(downloads_count,0) + 1 WHERE id=?",
-                    (content_id,)
-                )
-                await db.commit()
-                return True
-            return False
+        elif kind == "content":
+            path = self.db_path
+            sql = (
+                "SELECT c.id, c.content_type, c.title, c.description, c.added_at, "
+                "COALESCE(c.downloads_count, 0), COALESCE(p.parts, 0) "
+                "FROM content c LEFT JOIN ("
+                "  SELECT serial_id, COUNT(*) AS parts FROM serial_parts GROUP BY serial_id"
+                ") p ON p.serial_id = c.id ORDER BY c.id"
+            )
+        elif kind == "downloads":
+            path = self.hot_db_path
+            ts = self._ts("downloaded_ts", "downloaded_at")
+            sql = (
+                f"SELECT content_id, COUNT(*), {iso.format(f'MIN({ts})')}, {iso.format(f'MAX({ts})')} "
+                "FROM content_downloads GROUP BY content_id ORDER BY content_id"
+            )
+        else:
+            raise ValueError(kind)
 
-    # ---------- SERIAL PARTS ----------
-    async def add_serial_part(self, serial_id: int, part_number: int, file_id: str, title: str, added_by: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._reader(path, f"export:{kind}", EXPORT_QUERY_TIMEOUT) as db:
+            async with db.execute(sql) as cur:
+                while True:
+                    rows = await cur.fetchmany(EXPORT_FETCH_ROWS)
+                    if not rows:
+                        break
+                    yield rows
+
+    async def backup_file(self, path: str, dest: str, pages: int, pause: float) -> bool:
+        """
+        SQLite online backup API: `pages` sahifalik qadamlar, orasida `pause` soniya.
+        Alohida thread da ishlaydi (event loop to'silmaydi). Natija integrity_check
+        dan o'tgandagina dest ga qo'yiladi; True — snapshot yaroqli.
+        """
+        def run() -> bool:
+            tmp = dest + ".tmp"
+            src = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT)
+            dst = sqlite3.connect(tmp)
             try:
-                await db.execute(
-                    """INSERT INTO serial_parts (serial_id, part_number, file_id, title, added_by, added_at)
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (serial_id, part_number, file_id, title, added_by, get_utc_now().isoformat())
-                )
-                await db.commit()
-                return True
-            except Exception as e:
-                logger.error(f"Error adding serial part: {e}")
-                return False
+                # butun nusxa bitta o'qish tranzaksiyasida: WAL da yozuvchilar to'silmaydi,
+                # qadamlar orasidagi yozuvlar esa backup ni qaytadan boshlatmaydi (point-in-time)
+                src.execute("BEGIN")
+                src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                src.backup(dst, pages=pages, sleep=pause)
+                src.rollback()
+                ok = dst.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+            finally:
+                dst.close()
+                src.close()
+            if ok:
+                os.replace(tmp, dest)
+            else:
+                os.remove(tmp)
+            return ok
+
+        return await asyncio.to_thread(run)
+
+    # ---------- TIMESTAMP MIGRATION ----------
+    async def _migrate_timestamps_batch(self, table: str, cols: tuple, batch: int) -> int:
+        """
+        rowid bo'yicha keyingi bo'lakni ko'chiradi: *_ts = epoch(ISO matn), matn = NULL.
+        Qayerda to'xtagani meta jadvalida saqlanadi (restartdan keyin davom etadi).
+        Qaytaradi: ko'rilgan qatorlar soni (0 = jadval tugadi).
+        """
+        key = f"epoch_progress:{table}"
+        async with self._hot_writer() as db:
+            cur = await db.execute("SELECT value FROM meta WHERE key = ?", (key,))
+            row = await cur.fetchone()
+            last = int(row[0]) if row else 0
 
-    async def get_serial_parts(self, serial_id: int) -> List[Dict]:
-        async with aiosqlite.connect(self.db_path) as db:
             cur = await db.execute(
-                "SELECT part_number, file_id, title FROM serial_parts WHERE serial_id=? ORDER BY part_number",
-                (serial_id,)
+                f"SELECT MAX(rowid), COUNT(*) FROM (SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+                (last, batch)
             )
-            rows = await cur.fetchall()
-            return [{"part_number": r[0], "file_id": r[1], "title": r[2]} for r in rows]
+            upto, seen = await cur.fetchone()
+            if not seen:
+                return 0
 
-    async def get_serial_parts_count(self, serial_id: int) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT COUNT(*) FROM serial_parts WHERE serial_id=?", (serial_id,))
-            res = await cur.fetchone()
-            return res[0] if res else 0
+            sets = ", ".join(
+                f"{ts_col} = COALESCE({ts_col}, {_iso_to_epoch_sql(text_col)}), {text_col} = NULL"
+                for text_col, ts_col in cols
+            )
+            await db.execute(f"UPDATE {table} SET {sets} WHERE rowid > ? AND rowid <= ?", (last, upto))
+            await db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(upto)))
+            await db.commit()
+            return seen
+
+    async def migrate_timestamps(
+        self, batch: int = EPOCH_MIGRATION_BATCH, pause: float = EPOCH_MIGRATION_PAUSE
+    ) -> None:
+        """
+        Online migratsiya: eski ISO-8601 matn vaqtlarini INTEGER epoch ustunlarga ko'chiradi.
+        Kichik tranzaksiyalar + pauza, bot ishlashda davom etadi. Tugagach so'rovlar
+        COALESCE siz toza *_ts ustunlarga o'tadi.
+        """
+        if self.epoch_migrated:
+            return
+        for table, cols in EPOCH_COLUMNS:
+            moved = 0
+            while True:
+                n = await self._migrate_timestamps_batch(table, cols, batch)
+                if n == 0:
+                    break
+                moved += n
+                await asyncio.sleep(pause)
+            if moved:
+                logger.info(f"epoch migratsiya: {table} — {moved} qator")
+
+        async with self._hot_writer() as db:
+            await db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('epoch_migrated', '1')")
+            await db.commit()
+        self.epoch_migrated = True
+        logger.info("epoch migratsiya tugadi")
 
     # ---------- STATISTICS (old types kept, correct) ----------
     async def get_statistics(self) -> Dict:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._reader(self.hot_db_path, "stats:users", STATS_QUERY_TIMEOUT) as db:
             cur = await db.execute("SELECT COUNT(*) FROM users")
             total_users = (await cur.fetchone())[0]
 
-            monthly_date = (get_utc_now() - timedelta(days=30)).isoformat()
-            cur = await db.execute("SELECT COUNT(*) FROM users WHERE joined_at >= ?", (monthly_date,))
+            # migratsiyadan keyin har biri idx_users_*_ts bo'yicha range seek
+            joined = self._ts("joined_ts", "joined_at")
+            active = self._ts("last_active_ts", "last_active")
+            now = now_ts()
+
+            monthly_date = now - 30 * 86400
+            cur = await db.execute(f"SELECT COUNT(*) FROM users WHERE {joined} >= ?", (monthly_date,))
             monthly_users = (await cur.fetchone())[0]
 
-            weekly_date = (get_utc_now() - timedelta(days=7)).isoformat()
-            cur = await db.execute("SELECT COUNT(*) FROM users WHERE joined_at >= ?", (weekly_date,))
+            weekly_date = now - 7 * 86400
+            cur = await db.execute(f"SELECT COUNT(*) FROM users WHERE {joined} >= ?", (weekly_date,))
             weekly_users = (await cur.fetchone())[0]
 
-            today = get_utc_now().date().isoformat()
-            cur = await db.execute("SELECT COUNT(*) FROM users WHERE substr(joined_at,1,10) = ?", (today,))
+            today = now - now % 86400
+            cur = await db.execute(f"SELECT COUNT(*) FROM users WHERE {joined} >= ?", (today,))
             daily_users = (await cur.fetchone())[0]
 
-            cur = await db.execute("SELECT COUNT(*) FROM users WHERE last_active >= ?", (weekly_date,))
+            cur = await db.execute(f"SELECT COUNT(*) FROM users WHERE {active} >= ?", (weekly_date,))
             active_users = (await cur.fetchone())[0]
 
-            movies_count = await self.get_content_count('movie')
-            serials_count = await self.get_content_count('serial')
+        # bitta fayl rejimida ikkala hovuz bitta — ulanishlarni ichma-ich olmaymiz
+        async with self._reader(self.db_path, "stats:content", STATS_QUERY_TIMEOUT) as db:
+            cur = await db.execute("SELECT content_type, COUNT(*) FROM content GROUP BY content_type")
+            counts = dict(await cur.fetchall())
+
+        return {
+            "total_users": total_users,
+            "monthly_users": monthly_users,
+            "weekly_users": weekly_users,
+            "daily_users": daily_users,
+            "active_users": active_users,
+            "movies_count": counts.get("movie", 0),
+            "serials_count": counts.get("serial", 0)
+        }
+
+    async def get_retention(self, days: int = 7) -> Dict:
+        """
+        Oxirgi `days` kunlik kohortlar matritsasi, DAU/WAU/MAU va o'tgan hafta qo'shilganlarning
+        shu haftadagi faolligi. O'qiladigan hajm kohort jadvallari (kunlar soniga bog'liq) va
+        idx_users_joined_ts dagi bir haftalik diapazon — users jadvali hajmiga bog'liq emas.
+        """
+        today = now_ts() // 86400
+        first = today - days
+        joined = self._ts("joined_ts", "joined_at")
+        active = self._ts("last_active_ts", "last_active")
+        async with self._reader(self.hot_db_path, "stats:retention", STATS_QUERY_TIMEOUT) as db:
+            cur = await db.execute(
+                f"SELECT {joined} / 86400, COUNT(*) FROM users WHERE {joined} >= ? GROUP BY 1",
+                (first * 86400,)
+            )
+            sizes = dict(await cur.fetchall())
+            cur = await db.execute(
+                "SELECT cohort_day, day, users FROM cohort_activity WHERE cohort_day >= ?", (first,)
+            )
+            cells = {(c, d): n for c, d, n in await cur.fetchall()}
+            cur = await db.execute("SELECT day, users FROM last_active_days WHERE day > ?", (today - 30,))
+            last_active = dict(await cur.fetchall())
+            week_start = (today - 6) * 86400
+            cur = await db.execute(
+                f"SELECT COUNT(*), COALESCE(SUM({active} >= ?), 0) FROM users WHERE {joined} >= ? AND {joined} < ?",
+                (week_start, week_start - 7 * 86400, week_start)
+            )
+            last_week, still_active = await cur.fetchone()
+
+        cohorts = []
+        for day in range(first, today + 1):
+            cohorts.append({
+                "day": day,
+                "size": sizes.get(day, 0),
+                "active": [cells.get((day, d), 0) for d in range(day, today + 1)],
+            })
+        return {
+            "cohorts": cohorts,
+            "dau": last_active.get(today, 0),
+            "wau": sum(n for d, n in last_active.items() if d > today - 7),
+            "mau": sum(last_active.values()),
+            "last_week_joined": last_week,
+            "last_week_active": still_active,
+        }
+
+
+instrument_async_methods(DatabaseManager, "bot_db")
+
+# ===================== MULTI-BOT =====================
+# Bitta jarayon bir nechta tokenga xizmat qiladi. dp / handlerlar, Bot API session (ulanish hovuzi,
+# retry / tezlik middleware lari), katalog fayli va uning keshlari umumiy. Botga xos: hot baza
+# (users, faollik, yuklanishlar, kanallar, reytinglar), obuna keshi va FSM holati (StorageKey.bot_id).
+# Handlerlar global `db` va current_bot() orqali update kelgan botning ma'lumotlari bilan ishlaydi.
+_bot_scope: contextvars.ContextVar[Optional[Tuple[Bot, Optional[DatabaseManager]]]] = contextvars.ContextVar(
+    "bot_scope", default=None
+)
+mirror_dbs: Dict[int, DatabaseManager] = {}   # bot.id -> DatabaseManager (asosiy bot bu yerda yo'q)
+mirror_bots: List[Bot] = []
+
+
+class ScopedDatabase:
+    """
+    Global `db`: joriy kontekstdagi mirror botning DatabaseManager i, aks holda (asosiy bot,
+    fon vazifalari, CLI) — primary. Atributlar har safar joriy kontekstdan olinadi.
+    """
+
+    def __init__(self, primary: DatabaseManager):
+        self.primary = primary
+
+    def __getattr__(self, name: str):
+        scope = _bot_scope.get()
+        target = scope[1] if scope is not None and scope[1] is not None else self.primary
+        return getattr(target, name)
+
+    async def delete_content(self, content_id: int) -> bool:
+        """Katalog umumiy — bir marta; yuklanish/reyting qatorlari esa har bir botning hot bazasidan."""
+        deleted = await self.primary.delete_content(content_id)
+        for mirror_db in mirror_dbs.values():
+            await mirror_db.purge_content_stats(content_id)
+        return deleted
+
+
+db = ScopedDatabase(DatabaseManager(DB_PATH, HOT_DB_PATH or None))
+metrics.register_cache("content", db.content_cache)
+metrics.register_cache("serial_parts", db.parts_cache)
+
+
+def current_bot() -> Bot:
+    """Joriy update kelgan bot (handler dan tashqaridagi yordamchilar uchun); kontekst bo'lmasa — asosiy."""
+    scope = _bot_scope.get()
+    return scope[0] if scope is not None else bot
+
+
+def bot_user_key(user_id: int) -> Tuple[int, int]:
+    """Foydalanuvchiga bog'liq xotiradagi holat kaliti (FSM kabi — har bir bot uchun alohida)."""
+    return current_bot().id, user_id
 
-            return {
-                "total_users": total_users,
-                "monthly_users": monthly_users,
-                "weekly_users": weekly_users,
-                "daily_users": daily_users,
-                "active_users": active_users,
-                "movies_count": movies_count,
-                "serials_count": serials_count
-            }
 
+class BotScopeMiddleware(BaseMiddleware):
+    """Outer (dp.update): update qaysi bot orqali kelgan bo'lsa, db va current_bot() o'sha botga."""
 
-db = DatabaseManager(DB_PATH)
+    async def __call__(self, handler, event, data):
+        b = data["bot"]
+        if mirror_dbs:
+            ctx = _log_context.get()
+            if ctx is not None:
+                ctx["bot_id"] = b.id
+        token = _bot_scope.set((b, mirror_dbs.get(b.id)))
+        try:
+            return await handler(event, data)
+        finally:
+            _bot_scope.reset(token)
+
+
+dp.update.outer_middleware(BotScopeMiddleware())
+
+
+def scoped_task(b: Bot, coro_fn: Callable[[], Any]) -> asyncio.Task:
+    """Fon vazifasi b botning kontekstida: ichidagi `db` o'sha botning bazasi."""
+    ctx = contextvars.copy_context()
+    ctx.run(_bot_scope.set, (b, mirror_dbs.get(b.id)))
+    return asyncio.create_task(ctx.run(coro_fn), context=ctx)
+
+
+def load_mirror_config() -> List[Tuple[str, str]]:
+    """MIRROR_BOT_TOKENS va BOTS_FILE dan (token, hot_db) juftliklari."""
+    entries = []
+    for item in MIRROR_BOT_TOKENS.split(","):
+        token, _, hot_db = item.strip().partition("=")
+        if token:
+            entries.append({"token": token, "hot_db": hot_db.strip()})
+    if BOTS_FILE:
+        with open(BOTS_FILE, encoding="utf-8") as f:
+            entries += json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(DB_PATH))
+    stem = os.path.splitext(os.path.basename(DB_PATH))[0]
+    result = []
+    for e in entries:
+        token = e["token"].strip()
+        hot_db = e.get("hot_db") or os.path.join(base_dir, f"{stem}_bot{token.split(':', 1)[0]}.db")
+        result.append((token, hot_db))
+    return result
+
+
+def setup_mirror_bots() -> List[Bot]:
+    """
+    Mirror botlarni yaratadi: session asosiy botniki (bitta ulanish hovuzi), DatabaseManager
+    katalog holatini asosiy bilan bo'lishadi, kanallar esa har bir botning hot bazasida.
+    """
+    used = {os.path.abspath(p) for p in db.primary.files}
+    for token, hot_db in load_mirror_config():
+        mirror = Bot(token=token, session=bot.session)
+        if mirror.id == bot.id or mirror.id in mirror_dbs:
+            raise SystemExit(f"Bot {mirror.id} ikki marta berilgan")
+        if os.path.abspath(hot_db) in used:
+            raise SystemExit(f"Bot {mirror.id}: hot baza {hot_db} boshqa bot bilan bir xil")
+        used.add(os.path.abspath(hot_db))
+        mirror_dbs[mirror.id] = DatabaseManager(DB_PATH, hot_db, catalog=db.primary.shared, own_channels=True)
+        mirror_bots.append(mirror)
+    return mirror_bots
+
+
+def _read_pool_metrics() -> List[str]:
+    lines = ["# TYPE bot_read_queries_total counter"]
+    lines += [f'bot_read_queries_total{{query="{k}"}} {v["count"]}' for k, v in db.read_stats.items()]
+    lines.append("# TYPE bot_read_query_seconds_total counter")
+    lines += [f'bot_read_query_seconds_total{{query="{k}"}} {v["seconds"]:.6f}' for k, v in db.read_stats.items()]
+    lines.append("# TYPE bot_read_query_timeouts_total counter")
+    lines += [f'bot_read_query_timeouts_total{{query="{k}"}} {v["timeouts"]}' for k, v in db.read_stats.items()]
+    return lines
+
+
+metrics.collectors.append(_read_pool_metrics)
+
+
+def _known_users_metrics() -> List[str]:
+    known = db.known_users
+    return [
+        "# TYPE bot_known_users gauge",
+        f"bot_known_users {len(known)}",
+        "# TYPE bot_known_users_bytes gauge",
+        f"bot_known_users_bytes {known.nbytes}",
+    ]
+
+
+metrics.collectors.append(_known_users_metrics)
 
 
 # ===================== SUBSCRIPTION CHECK =====================
-async def check_subscription(user_id: int) -> List[Dict]:
+async def check_subscription(user_id: int) -> List[Channel]:
     """
     TALAB:
     - kanal obuna bo'lganini ham tekshiradi
@@ -538,35 +3111,90 @@ async def check_subscription(user_id: int) -> List[Dict]:
     not_subscribed = []
 
     for ch in channels:
-        chat_id = ch["chat_id"]
+        chat_id = ch.chat_id
         try:
-            member = await bot.get_chat_member(chat_id, user_id)
+            member = await current_bot().get_chat_member(chat_id, user_id)
             if member.status in ("left", "kicked"):
                 if not await db.has_join_request(chat_id, user_id):
                     not_subscribed.append(ch)
-        except Exception:
+        except TelegramAPIError as e:
+            # bot kanaldan chiqarilgan / API ishlamayapti — obuna deb hisoblamaymiz
+            logger.warning(f"get_chat_member {chat_id}: {type(e).__name__}: {e}")
             if not await db.has_join_request(chat_id, user_id):
                 not_subscribed.append(ch)
 
     return not_subscribed
 
 
-def build_subscribe_keyboard(channels: List[Dict], instagram_links: List[Dict]) -> InlineKeyboardMarkup:
+# Obuna natijasi keshi: inline rejimda har bir harf uchun get_chat_member chaqirmaslik uchun.
+# Muvaffaqiyatli natija uzoqroq, muvaffaqiyatsiz qisqa saqlanadi (obuna bo'lgach tez ochilsin).
+GATE_OK_TTL = 600
+GATE_FAIL_TTL = 30
+gate_cache = LRUCache(maxsize=100_000, ttl=GATE_OK_TTL)
+metrics.register_cache("gate", gate_cache)
+
+
+def invalidate_gate() -> None:
+    """Majburiy kanallar o'zgardi: shu botning "o'tdi" natijalari endi noto'g'ri (boshqa botlarniki emas)."""
+    bot_id = current_bot().id
+    gate_cache.drop(lambda key: key[0] == bot_id)
+
+
+async def is_gate_passed(user_id: int) -> bool:
+    cached = gate_cache.get(bot_user_key(user_id))
+    if cached is not None:
+        return cached
+
+    if await db.is_admin(user_id):
+        ok = True
+    else:
+        channels = await db.get_channels()
+        ok = not channels or not await check_subscription(user_id)
+
+    gate_cache.set(bot_user_key(user_id), ok, None if ok else GATE_FAIL_TTL)
+    return ok
+
+
+async def gate_missing_channels(user_id: int) -> List[Channel]:
+    """
+    Obuna bo'linmagan kanallar ro'yxati ([] — gate dan o'tdi). Klaviatura kerak bo'lgan
+    joylar uchun is_gate_passed varianti; natija gate_cache ga yoziladi.
+    """
+    if gate_cache.get(bot_user_key(user_id)):
+        return []
+    missing = [] if await db.is_admin(user_id) else await check_subscription(user_id)
+    gate_cache.set(bot_user_key(user_id), not missing, None if not missing else GATE_FAIL_TTL)
+    return missing
+
+
+def parse_content_code(text: Optional[str]) -> Optional[int]:
+    text = (text or "").strip()
+    return int(text) if text.isdigit() else None
+
+
+async def content_deep_link(content_id: int) -> str:
+    me = await current_bot().me()
+    return f"https://t.me/{me.username}?start={content_id}"
+
+
+def build_subscribe_keyboard(channels: List[Channel], instagram_links: List[InstagramLink], pending: Optional[int] = None) -> InlineKeyboardMarkup:
     keyboard = []
 
     for ch in channels:
-        if ch.get("invite_link"):
-            url = ch["invite_link"]
-        elif ch.get("username"):
-            url = f"https://t.me/{ch['username']}"
+        if ch.invite_link:
+            url = ch.invite_link
+        elif ch.username:
+            url = f"https://t.me/{ch.username}"
         else:
-            url = f"https://t.me/c/{str(ch['chat_id']).replace('-100','')}"
-        keyboard.append([InlineKeyboardButton(text=f"📢 {ch['title']}", url=url)])
+            url = f"https://t.me/c/{str(ch.chat_id).replace('-100','')}"
+        keyboard.append([InlineKeyboardButton(text=f"📢 {ch.title}", url=url)])
 
     for ig in instagram_links:
-        keyboard.append([InlineKeyboardButton(text=f"📷 {ig['title']}", url=ig["url"])])
+        keyboard.append([InlineKeyboardButton(text=f"📷 {ig.title}", url=ig.url)])
 
-    keyboard.append([InlineKeyboardButton(text="✅ Tekshirish", callback_data="check_subscription")])
+    # pending — tekshiruvdan keyin darhol yuboriladigan kontent kodi (deep link / yuborilgan kod)
+    check_data = f"check_subscription:{pending}" if pending else "check_subscription"
+    keyboard.append([InlineKeyboardButton(text="✅ Tekshirish", callback_data=check_data)])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
@@ -592,48 +3220,70 @@ async def send_admin_notification(user, action: str = "start"):
     )
     for a in admins:
         try:
-            await bot.send_message(a["user_id"], msg)
-        except:
-            pass
+            await current_bot().send_message(a.user_id, msg)
+        except TelegramForbiddenError:
+            pass  # admin botni bloklagan
+        except TelegramAPIError as e:
+            logger.warning(f"admin notification {a.user_id}: {type(e).__name__}: {e}")
 
 
 # ===================== START / ADMIN =====================
 @router.message(CommandStart())
-async def start_handler(message: Message):
+async def start_handler(message: Message, command: CommandObject):
+    """
+    /start va /start <kod> (deep link: t.me/<bot>?start=<kod>).
+    Ro'yxatdan o'tkazish, obuna tekshiruvi va kontent yuborish bitta update da.
+    """
     user = message.from_user
     await db.add_user(user)
 
-    await send_admin_notification(user, "start")
+    # adminlarga xabar foydalanuvchi javobini kutdirmasin
+    spawn(send_admin_notification(user, "start"))
 
-    instagram_links = await db.get_instagram_links()
-    channels = await db.get_channels()
+    code = parse_content_code(command.args)
+    not_subscribed = await gate_missing_channels(user.id)
+    if not_subscribed:
+        instagram_links = await db.get_instagram_links()
+        kb = build_subscribe_keyboard(not_subscribed, instagram_links, pending=code)
+        await message.answer(
+            "📺 Botdan foydalanish uchun quyidagi kanallarga obuna bo'ling.\n",
+            reply_markup=kb
+        )
+        return
 
-    if channels and not await db.is_admin(user.id):
-        not_subscribed = await check_subscription(user.id)
-        if not_subscribed:
-            kb = build_subscribe_keyboard(not_subscribed, instagram_links)
-            await message.answer(
-                "📺 Botdan foydalanish uchun quyidagi kanallarga obuna bo'ling.\n",
-                reply_markup=kb
-            )
-            return
+    if code:
+        await send_content(message, user.id, code)
+        return
 
-    await message.answer("🎬 Xush kelibsiz!\nKinoni ko'rish uchun kodini yuboring.")
+    await message.answer(
+        "🎬 Xush kelibsiz!\nKinoni ko'rish uchun kodini yuboring.",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[[TOP_BUTTON]])
+    )
 
 
-@router.callback_query(F.data == "check_subscription")
+@router.callback_query(F.data.startswith("check_subscription"))
 async def check_subscription_callback(callback: CallbackQuery):
     user = callback.from_user
-    instagram_links = await db.get_instagram_links()
+    _, _, raw = callback.data.partition(":")
+    pending = parse_content_code(raw)
 
     not_subscribed = await check_subscription(user.id)
     if not_subscribed:
-        kb = build_subscribe_keyboard(not_subscribed, instagram_links)
+        gate_cache.set(bot_user_key(user.id), False, GATE_FAIL_TTL)
+        instagram_links = await db.get_instagram_links()
+        kb = build_subscribe_keyboard(not_subscribed, instagram_links, pending=pending)
         await callback.message.edit_text("❌ Hali barcha kanallarga obuna bo'lmagansiz:", reply_markup=kb)
         await callback.answer()
         return
+    gate_cache.set(bot_user_key(user.id), True)
+
+    if pending:
+        # tekshiruv hozirgina o'tdi — kontent qayta tekshirilmasdan yuboriladi
+        await callback.message.edit_text("✅ Tabriklaymiz! Barcha kanallarga obuna bo'ldingiz.")
+        await callback.answer()
+        await send_content(callback.message, user.id, pending)
+        return
 
-    stats = await db.get_statistics()
     text = (
         "✅ Tabriklaymiz! Barcha kanallarga obuna bo'ldingiz.\n\n"
         "Endi kod yuboring."
@@ -641,10 +3291,23 @@ async def check_subscription_callback(callback: CallbackQuery):
     if await db.is_admin(user.id):
         text += "\n\n💠 Admin panel: /admin"
 
-    await callback.message.edit_text(text)
+    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=[[TOP_BUTTON]]))
     await callback.answer()
 
 
+@router.message(Command("link"))
+async def link_command(message: Message, command: CommandObject):
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Sizda admin huquqi yo'q.")
+        return
+    code = parse_content_code(command.args)
+    content = await db.get_content(code) if code else None
+    if not content:
+        await message.answer("Foydalanish: /link <kod>")
+        return
+    await message.answer(f"🔗 {content.title}:\n{await content_deep_link(code)}")
+
+
 @router.message(Command("admin"))
 async def admin_command_handler(message: Message):
     if not await db.is_admin(message.from_user.id):
@@ -655,7 +3318,8 @@ async def admin_command_handler(message: Message):
 
 # ===================== ADMIN PANEL UI =====================
 async def show_admin_panel(message: Union[Message, CallbackQuery]):
-    stats = await db.get_statistics()
+    # panelga faqat kontent soni kerak — to'liq statistika "📊 Statistika" tugmasida
+    content_total = await db.get_content_count()
     channels = await db.get_channels()
     ig = await db.get_instagram_links()
 
@@ -664,7 +3328,8 @@ async def show_admin_panel(message: Union[Message, CallbackQuery]):
         [InlineKeyboardButton(text=f"📺 Kanallar ({len(channels)})", callback_data="channel_manage")],
         [InlineKeyboardButton(text=f"📷 Instagram ({len(ig)})", callback_data="instagram_manage")],
         [InlineKeyboardButton(text="📊 Statistika", callback_data="stats")],
-        [InlineKeyboardButton(text=f"🎬 Kontent ({stats['movies_count'] + stats['serials_count']})", callback_data="content_manage")],
+        [TOP_BUTTON],
+        [InlineKeyboardButton(text=f"🎬 Kontent ({content_total})", callback_data="content_manage")],
         [InlineKeyboardButton(text="📢 Xabar yuborish", callback_data="broadcast")]
     ]
 
@@ -683,6 +3348,7 @@ async def back_to_main(callback: CallbackQuery):
 @router.callback_query(F.data == "cancel_action")
 async def cancel_action(callback: CallbackQuery, state: FSMContext):
     await state.clear()
+    bulk_sessions.pop(bot_user_key(callback.from_user.id), None)
     await show_admin_panel(callback)
 
 
@@ -690,7 +3356,7 @@ async def cancel_action(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "admin_manage")
 async def admin_manage(callback: CallbackQuery):
     admins = await db.get_admins()
-    admin_list = "\n".join([f"• {a['user_id']}" for a in admins]) or "yo'q"
+    admin_list = "\n".join([f"• {a.user_id}" for a in admins]) or "yo'q"
 
     keyboard = [
         [InlineKeyboardButton(text="➕ Admin qo'shish", callback_data="add_admin")],
@@ -750,7 +3416,7 @@ async def instagram_manage(callback: CallbackQuery):
         text += "Hali link yo'q."
     else:
         for ig in links:
-            text += f"• {ig['id']}) {ig['title']} — {ig['url']}\n"
+            text += f"• {ig.id}) {ig.title} — {ig.url}\n"
 
     kb = [
         [InlineKeyboardButton(text="➕ Link qo'shish", callback_data="ig_add")],
@@ -821,11 +3487,11 @@ async def channel_manage(callback: CallbackQuery):
     if channels:
         channel_list = ""
         for c in channels:
-            channel_list += f"• {c['title']} (ID: {c['chat_id']})"
-            if c.get("username"):
-                channel_list += f"  @{c['username']}"
-            if c.get("invite_link"):
-                channel_list += f"\n   link: {c['invite_link']}"
+            channel_list += f"• {c.title} (ID: {c.chat_id})"
+            if c.username:
+                channel_list += f"  @{c.username}"
+            if c.invite_link:
+                channel_list += f"\n   link: {c.invite_link}"
             channel_list += "\n"
     else:
         channel_list = "Hech qanday kanal qo'shilmagan"
@@ -865,7 +3531,7 @@ async def add_channel_process(message: Message, state: FSMContext):
             await message.answer("❌ Private invite linkni bu bosqichda qabul qilmaymiz.\nChat ID yoki @username yuboring.")
             return
 
-        chat = await bot.get_chat(ident)
+        chat = await current_bot().get_chat(ident)
 
         await state.update_data(chat_id=chat.id, title=chat.title, username=chat.username or "")
         await message.answer(
@@ -888,6 +3554,7 @@ async def add_channel_invite_process(message: Message, state: FSMContext):
     data = await state.get_data()
 
     await db.add_channel(data["chat_id"], data["title"], data["username"], invite)
+    invalidate_gate()
     await message.answer(f"✅ Kanal qo'shildi: {data['title']}")
     await state.clear()
     await show_admin_panel(message)
@@ -903,6 +3570,8 @@ async def remove_channel_process(message: Message, state: FSMContext):
     try:
         chat_id = int((message.text or "").strip())
         ok = await db.remove_channel(chat_id)
+        if ok:
+            invalidate_gate()
         await message.answer("✅ Kanal o'chirildi." if ok else "❌ Kanal topilmadi.")
     except:
         await message.answer("❌ Faqat raqam yuboring.")
@@ -913,7 +3582,11 @@ async def remove_channel_process(message: Message, state: FSMContext):
 # ===================== STATISTICS (ADMIN PANEL) =====================
 @router.callback_query(F.data == "stats")
 async def show_stats(callback: CallbackQuery):
-    stats = await db.get_statistics()
+    try:
+        stats = await db.get_statistics()
+    except asyncio.TimeoutError:
+        await callback.answer("⏳ Statistika hozir tayyor emas, birozdan keyin urinib ko'ring.", show_alert=True)
+        return
     msg = (
         "📊 Bot Statistikasi:\n\n"
         f"👥 Jami obunachilar: {stats['total_users']}\n"
@@ -924,10 +3597,52 @@ async def show_stats(callback: CallbackQuery):
         f"🎬 Jami kinolar: {stats['movies_count']}\n"
         f"📺 Jami seriallar: {stats['serials_count']}"
     )
-    kb = [[InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_main")]]
+    kb = [
+        [InlineKeyboardButton(text="📈 Retention", callback_data="retention")],
+        [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_main")],
+    ]
     await callback.message.edit_text(msg, reply_markup=InlineKeyboardMarkup(inline_keyboard=kb))
 
 
+RETENTION_MATRIX_DAYS = 7
+
+
+def format_retention(r: Dict) -> str:
+    def pct(n: int, total: int) -> str:
+        return f"{n * 100 // total}%" if total else "-"
+
+    lines = [
+        "📈 Retention\n",
+        f"👤 DAU: {r['dau']}",
+        f"🗓 WAU: {r['wau']}",
+        f"📆 MAU: {r['mau']}",
+        f"🔁 O'tgan hafta qo'shilganlar: {r['last_week_joined']}, shu hafta faol: "
+        f"{r['last_week_active']} ({pct(r['last_week_active'], r['last_week_joined'])})",
+        "",
+        "Kunlik kohortlar (sana, yangi: D0 D1 ... faol %):",
+    ]
+    for c in r["cohorts"]:
+        day = datetime.fromtimestamp(c["day"] * 86400, timezone.utc).strftime("%m-%d")
+        cells = " ".join(pct(n, c["size"]) for n in c["active"])
+        lines.append(f"{day}, {c['size']}: {cells}")
+    return "\n".join(lines)
+
+
+@router.callback_query(F.data == "retention")
+async def show_retention(callback: CallbackQuery):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Sizda admin huquqi yo'q.")
+        return
+    try:
+        retention = await db.get_retention(RETENTION_MATRIX_DAYS)
+    except asyncio.TimeoutError:
+        await callback.answer("⏳ Statistika hozir tayyor emas, birozdan keyin urinib ko'ring.", show_alert=True)
+        return
+    kb = [[InlineKeyboardButton(text="🔙 Orqaga", callback_data="stats")]]
+    await callback.message.edit_text(format_retention(retention), reply_markup=InlineKeyboardMarkup(inline_keyboard=kb))
+    await callback.answer()
+
+
 # ===================== CONTENT MANAGEMENT =====================
 @router.callback_query(F.data == "content_manage")
 async def content_manage(callback: CallbackQuery):
@@ -938,6 +3653,9 @@ async def content_manage(callback: CallbackQuery):
         [InlineKeyboardButton(text="➕ Kino qo'shish", callback_data="add_movie")],
         [InlineKeyboardButton(text="➕ Serial qo'shish", callback_data="add_serial")],
         [InlineKeyboardButton(text="➕ Serialga qism qo'shish", callback_data="add_serial_part")],
+        [InlineKeyboardButton(text="📦 Ommaviy kino yuklash", callback_data="bulk_movies")],
+        [InlineKeyboardButton(text="📦 Ommaviy qism yuklash", callback_data="bulk_parts")],
+        [InlineKeyboardButton(text="📄 JSONL import", callback_data="bulk_manifest")],
         [InlineKeyboardButton(text="📋 Kinolar ro'yxati", callback_data="movie_list")],
         [InlineKeyboardButton(text="📋 Seriallar ro'yxati", callback_data="serial_list")],
         [InlineKeyboardButton(text="➖ Kontent o'chirish", callback_data="remove_content")],
@@ -982,7 +3700,7 @@ async def handle_movie_upload(message: Message, state: FSMContext):
         await message.answer(
             f"✅ Kino qo'shildi!\n\nID: {content_id}\nNomi: {title}\n"
             f"{('Tavsif: ' + description) if description else ''}\n\n"
-            f"Userlar {content_id} yuborib ko'radi."
+            f"Userlar {content_id} yuborib ko'radi.\n🔗 {await content_deep_link(content_id)}"
         )
     else:
         await message.answer("❌ Xatolik: saqlanmadi.")
@@ -1021,7 +3739,8 @@ async def process_serial_description(message: Message, state: FSMContext):
     if serial_id:
         await message.answer(
             f"✅ Serial qo'shildi!\n\nID: {serial_id}\nNomi: {title}\nTavsif: {description}\n\n"
-            "Endi 'Serialga qism qo'shish' orqali qismlar qo'shasiz."
+            "Endi 'Serialga qism qo'shish' orqali qismlar qo'shasiz.\n"
+            f"🔗 {await content_deep_link(serial_id)}"
         )
     else:
         await message.answer("❌ Xatolik: saqlanmadi.")
@@ -1041,7 +3760,7 @@ async def process_serial_id(message: Message, state: FSMContext):
     try:
         serial_id = int((message.text or "").strip())
         serial = await db.get_content(serial_id)
-        if not serial or serial["content_type"] != "serial":
+        if not serial or serial.content_type != "serial":
             await message.answer("❌ Bunday serial topilmadi.")
             return
 
@@ -1051,7 +3770,7 @@ async def process_serial_id(message: Message, state: FSMContext):
 
         kb = [[InlineKeyboardButton(text="❌ Bekor qilish", callback_data="cancel_action")]]
         await message.answer(
-            f"📺 Serial: {serial['title']}\n"
+            f"📺 Serial: {serial.title}\n"
             f"🔢 Keyingi qism: {next_part}\n\n"
             "Endi video yuboring.\nCaption ixtiyoriy: qism nomi",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=kb)
@@ -1067,52 +3786,433 @@ async def process_part_video(message: Message, state: FSMContext):
     part_number = data["next_part"]
     title = (message.caption or f"{part_number}-qism").strip()
 
-    ok = await db.add_serial_part(serial_id, part_number, message.video.file_id, title, message.from_user.id)
-    await message.answer("✅ Qism qo'shildi!" if ok else "❌ Qism saqlanmadi.")
-    await state.clear()
-    await show_admin_panel(message)
+    ok = await db.add_serial_part(serial_id, part_number, message.video.file_id, title, message.from_user.id)
+    await message.answer("✅ Qism qo'shildi!" if ok else "❌ Qism saqlanmadi.")
+    await state.clear()
+    await show_admin_panel(message)
+
+# ---- Bulk ingest (album / ko'p video / JSONL manifest) ----
+PART_NUMBER_RE = re.compile(
+    r"(\d{1,4})\s*[-.]?\s*(?:qism|qisim|seriya|серия|part)|\b(?:qism|part|ep|episode|seriya|серия)\s*[-.#:]?\s*(\d{1,4})",
+    re.IGNORECASE,
+)
+BULK_STATUS_EDIT_INTERVAL = 1.0
+MANIFEST_MAX_ERRORS = 10
+
+# (bot_id, admin_id) -> {"serial_id", "title", "items": [(message_id, caption, file_id)], "status", "edited"}
+# FSM data emas: album videolari parallel keladi, get_data/update_data orasida yo'qolib qolmasin
+bulk_sessions: Dict[Tuple[int, int], Dict] = {}
+
+
+def parse_part_number(caption: str) -> Optional[int]:
+    text = (caption or "").strip()
+    if text.isdigit():
+        return int(text)
+    m = PART_NUMBER_RE.search(text)
+    return int(m.group(1) or m.group(2)) if m else None
+
+
+def assign_part_numbers(items: List[Tuple[str, str]], existing: set) -> Tuple[List[Tuple[int, str, str]], int]:
+    """
+    items — (caption, file_id) kelish tartibida. Captionda qism raqami bo'lsa o'sha,
+    bo'lmasa mavjud oxirgi qismdan keyingi bo'sh raqam. Band raqamlilar o'tkazib yuboriladi.
+    Natija: ([(part_number, file_id, title)], o'tkazilganlar soni).
+    """
+    taken = set(existing)
+    numbered, rest, skipped = [], [], 0
+    for caption, file_id in items:
+        n = parse_part_number(caption)
+        if n is None:
+            rest.append((caption, file_id))
+        elif n < 1 or n in taken:
+            skipped += 1
+        else:
+            taken.add(n)
+            numbered.append((n, file_id, caption))
+
+    n = max(existing, default=0)
+    for caption, file_id in rest:
+        n += 1
+        while n in taken:
+            n += 1
+        taken.add(n)
+        numbered.append((n, file_id, caption))
+
+    parts = []
+    for n, file_id, caption in sorted(numbered):
+        title = (caption or "").strip()
+        parts.append((n, file_id, title if title and not title.isdigit() else f"{n}-qism"))
+    return parts, skipped
+
+
+def _bulk_keyboard(count: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"✅ Saqlash ({count})", callback_data="bulk_save")],
+        [InlineKeyboardButton(text="❌ Bekor qilish", callback_data="cancel_action")],
+    ])
+
+
+async def start_bulk_session(message: Message, admin_id: int, state: FSMContext, serial_id: Optional[int] = None, title: str = ""):
+    head = f"📺 Serial: {title}\n" if serial_id else "🎬 Kinolar\n"
+    hint = (
+        "Qism raqami captiondan olinadi (\"5-qism\", \"Part 5\", \"5\"), bo'lmasa kelish tartibida."
+        if serial_id else
+        "Caption: Kino nomi - tavsif"
+    )
+    status = await message.answer(
+        f"{head}\nVideolarni yuboring yoki albomni forward qiling.\n{hint}\n\n📥 Qabul qilindi: 0",
+        reply_markup=_bulk_keyboard(0)
+    )
+    bulk_sessions[bot_user_key(admin_id)] = {
+        "serial_id": serial_id, "title": title, "items": [],
+        "status": (status.chat.id, status.message_id, head), "edited": 0.0,
+    }
+    await state.set_state(AdminStates.bulk_collect)
+
+
+@router.callback_query(F.data == "bulk_movies")
+async def bulk_movies_handler(callback: CallbackQuery, state: FSMContext):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Sizda admin huquqi yo'q.")
+        return
+    await callback.message.delete()
+    await start_bulk_session(callback.message, callback.from_user.id, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data == "bulk_parts")
+async def bulk_parts_handler(callback: CallbackQuery, state: FSMContext):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Sizda admin huquqi yo'q.")
+        return
+    kb = [[InlineKeyboardButton(text="❌ Bekor qilish", callback_data="cancel_action")]]
+    await callback.message.edit_text("Qismlar qo'shiladigan serial kodini yuboring:", reply_markup=InlineKeyboardMarkup(inline_keyboard=kb))
+    await state.set_state(AdminStates.bulk_serial_id)
+    await callback.answer()
+
+
+@router.message(AdminStates.bulk_serial_id)
+async def process_bulk_serial_id(message: Message, state: FSMContext):
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Faqat adminlar qo'shadi.")
+        return
+    try:
+        serial_id = int((message.text or "").strip())
+    except ValueError:
+        await message.answer("❌ Faqat raqam yuboring.")
+        return
+    serial = await db.get_content(serial_id)
+    if not serial or serial.content_type != "serial":
+        await message.answer("❌ Bunday serial topilmadi.")
+        return
+    await start_bulk_session(message, message.from_user.id, state, serial_id, serial.title)
+
+
+@router.message(AdminStates.bulk_collect, F.video)
+async def collect_bulk_video(message: Message):
+    if not await db.is_admin(message.from_user.id):
+        return
+    session = bulk_sessions.get(bot_user_key(message.from_user.id))
+    if session is None:
+        return
+    session["items"].append((message.message_id, message.caption or "", message.video.file_id))
+
+    # har bir video uchun javob yozmaymiz — holat xabarini ko'pi bilan sekundiga bir marta yangilaymiz
+    now = time.monotonic()
+    if now - session["edited"] < BULK_STATUS_EDIT_INTERVAL:
+        return
+    session["edited"] = now
+    chat_id, status_id, head = session["status"]
+    count = len(session["items"])
+    try:
+        await current_bot().edit_message_text(
+            f"{head}\n📥 Qabul qilindi: {count}", chat_id=chat_id, message_id=status_id,
+            reply_markup=_bulk_keyboard(count)
+        )
+    except TelegramAPIError:
+        pass  # holat xabari — keyingi yangilanishda tuzaladi
+
+
+# bulk_collect da video bo'lmagan xabar (matn, fayl) qidiruvga tushib ketmasin; buyruqlar o'tadi
+@router.message(AdminStates.bulk_collect, ~F.text.startswith("/"))
+async def collect_bulk_other(message: Message):
+    if not await db.is_admin(message.from_user.id):
+        return
+    await message.answer("📹 Videolarni yuboring yoki ✅ Saqlash tugmasini bosing.")
+
+
+@router.callback_query(F.data == "bulk_save")
+async def bulk_save(callback: CallbackQuery, state: FSMContext):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Sizda admin huquqi yo'q.")
+        return
+    session = bulk_sessions.get(bot_user_key(callback.from_user.id))
+    if not session or not session["items"]:
+        await callback.answer("❌ Hali video yuborilmadi.", show_alert=True)
+        return
+    del bulk_sessions[bot_user_key(callback.from_user.id)]
+
+    # message_id — kelish (forward) tartibi; album qismlari parallel ishlansa ham to'g'ri
+    items = [(caption, file_id) for _, caption, file_id in sorted(session["items"])]
+    serial_id = session["serial_id"]
+    skipped = 0
+    if serial_id:
+        existing = {p.part_number for p in await db.get_serial_parts(serial_id)}
+        numbered, skipped = assign_part_numbers(items, existing)
+        parts = [(serial_id, n, file_id, title) for n, file_id, title in numbered]
+        ok = await db.bulk_ingest([], parts, callback.from_user.id) is not None
+        text = (
+            f"✅ {session['title']}: {len(parts)} ta qism qo'shildi"
+            f" ({parts[0][1]}–{parts[-1][1]})." if ok and parts else "❌ Qismlar saqlanmadi."
+        )
+    else:
+        base = await db.get_content_count('movie')
+        contents = []
+        for caption, file_id in items:
+            title, _, description = caption.partition(" - ")
+            title = title.strip() or f"Kino #{base + len(contents) + 1}"
+            contents.append({
+                "file_id": file_id, "title": title,
+                "description": description.strip(), "content_type": "movie",
+            })
+        ids = await db.bulk_ingest(contents, [], callback.from_user.id)
+        ok = ids is not None
+        text = f"✅ {len(ids)} ta kino qo'shildi. Kodlar: {ids[0]}–{ids[-1]}" if ids else "❌ Kinolar saqlanmadi."
+    if ok and skipped:
+        text += f"\n⚠️ Raqami band bo'lgan {skipped} ta video o'tkazib yuborildi."
+
+    await state.clear()
+    await callback.message.edit_text(text)
+    await callback.answer()
+    await show_admin_panel(callback.message)
+
+
+@router.callback_query(F.data == "bulk_manifest")
+async def bulk_manifest_handler(callback: CallbackQuery, state: FSMContext):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Sizda admin huquqi yo'q.")
+        return
+    kb = [[InlineKeyboardButton(text="❌ Bekor qilish", callback_data="cancel_action")]]
+    await callback.message.edit_text(
+        "📄 JSONL manifest yuboring (.jsonl yoki .jsonl.gz), har qatorda bitta obyekt:\n\n"
+        '{"code": 501, "title": "Interstellar", "file_id": "...", "description": "..."}\n'
+        '{"code": 502, "title": "Sherlock", "part": 1, "file_id": "..."}\n\n'
+        "code ixtiyoriy (kinolar uchun), part bo'lsa — serial qismi (serial yo'q bo'lsa yaratiladi).\n"
+        "Biror qatorda xato bo'lsa hech narsa yozilmaydi.",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=kb)
+    )
+    await state.set_state(AdminStates.bulk_manifest)
+
+
+async def plan_manifest(lines: List[str]) -> Tuple[List[Dict], List[Tuple[int, int, str, str]], List[str]]:
+    """
+    Manifest qatorlarini tekshiradi va bulk_ingest uchun (contents, parts, errors) qaytaradi.
+    Kodlar bazadagi va manifestdagi boshqa qatorlar bilan to'qnashmasligi tekshiriladi.
+    """
+    records, errors = [], []
+    for no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            r = json.loads(line)
+            code = int(r["code"]) if r.get("code") not in (None, "") else None
+            part = int(r["part"]) if r.get("part") not in (None, "") else None
+            file_id = str(r.get("file_id") or "").strip()
+            title = str(r.get("title") or "").strip()
+            if not file_id:
+                raise ValueError("file_id yo'q")
+            if part is not None and (code is None or part < 1):
+                raise ValueError("qism uchun code va musbat part kerak")
+            if part is None and not title:
+                raise ValueError("title yo'q")
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append(f"{no}-qator: {e}")
+            continue
+        records.append((no, code, part, title, str(r.get("description") or "").strip(), file_id, str(r.get("part_title") or "").strip()))
+
+    existing = await db.get_content_types([r[1] for r in records if r[1] is not None])
+    new_codes: Dict[int, str] = {}
+    taken_parts: Dict[int, set] = {}
+    contents, parts = [], []
+    for no, code, part, title, description, file_id, part_title in records:
+        if part is None:
+            if code is not None and (code in existing or code in new_codes):
+                errors.append(f"{no}-qator: kod {code} band")
+                continue
+            contents.append({"id": code, "file_id": file_id, "title": title, "description": description, "content_type": "movie"})
+            if code is not None:
+                new_codes[code] = "movie"
+            continue
+
+        kind = existing.get(code) or new_codes.get(code)
+        if kind is None:
+            if not title:
+                errors.append(f"{no}-qator: yangi serial {code} uchun title yo'q")
+                continue
+            contents.append({"id": code, "file_id": None, "title": title, "description": description, "content_type": "serial"})
+            new_codes[code] = kind = "serial"
+            taken_parts[code] = set()
+        if kind != "serial":
+            errors.append(f"{no}-qator: kod {code} serial emas")
+            continue
+        if code not in taken_parts:
+            taken_parts[code] = {p.part_number for p in await db.get_serial_parts(code)}
+        if part in taken_parts[code]:
+            errors.append(f"{no}-qator: {code}-serialda {part}-qism bor")
+            continue
+        taken_parts[code].add(part)
+        parts.append((code, part, file_id, part_title or f"{part}-qism"))
+    return contents, parts, errors
+
+
+@router.message(AdminStates.bulk_manifest, F.document)
+async def process_bulk_manifest(message: Message, state: FSMContext):
+    if not await db.is_admin(message.from_user.id):
+        return
+    try:
+        data = (await current_bot().download(message.document)).read()
+        if (message.document.file_name or "").endswith(".gz"):
+            import gzip
+            data = gzip.decompress(data)
+        lines = data.decode("utf-8-sig").splitlines()
+    except Exception as e:
+        await message.answer(f"❌ Faylni o'qib bo'lmadi: {e}")
+        return
+
+    contents, parts, errors = await plan_manifest(lines)
+    if errors:
+        shown = "\n".join(errors[:MANIFEST_MAX_ERRORS])
+        more = f"\n... yana {len(errors) - MANIFEST_MAX_ERRORS} ta" if len(errors) > MANIFEST_MAX_ERRORS else ""
+        await message.answer(f"❌ Manifestda {len(errors)} ta xato, hech narsa yozilmadi:\n\n{shown}{more}")
+        return
+    if not contents and not parts:
+        await message.answer("❌ Manifest bo'sh.")
+        return
+
+    ids = await db.bulk_ingest(contents, parts, message.from_user.id)
+    if ids is None:
+        await message.answer("❌ Import saqlanmadi.")
+        return
+    await message.answer(f"✅ Import: {len(ids)} ta kontent, {len(parts)} ta qism.")
+    await state.clear()
+    await show_admin_panel(message)
+
+
+# ---- Lists (keyset pagination) ----
+CATALOG_PAGE_SIZE = 10
+CATALOG_DESC_LIMIT = 120
+
+
+def _catalog_cursor(row: Dict, sort: str) -> str:
+    if sort == "downloads":
+        return f"{row['downloads_count']}.{row['id']}"
+    return str(row["id"])
+
+
+def _parse_catalog_cursor(raw: str) -> Optional[Tuple[int, ...]]:
+    if not raw:
+        return None
+    return tuple(int(x) for x in raw.split("."))
+
+
+async def show_catalog_page(
+    callback: CallbackQuery,
+    content_type: str,
+    sort: str = "id",
+    cursor: str = "",
+    backward: bool = False,
+):
+    """
+    callback_data formati: clist:<m|s>:<id|dl>:<n|p>:<cursor>
+    """
+    rows, has_more = await db.get_content_page(
+        content_type, sort, _parse_catalog_cursor(cursor), backward, CATALOG_PAGE_SIZE
+    )
+    # backward: "yana bor" oldingi sahifaga tegishli, keyingi sahifa esa albatta bor
+    if backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = bool(cursor), has_more
+
+    t = "m" if content_type == "movie" else "s"
+    s = "dl" if sort == "downloads" else "id"
+    back_kb = [InlineKeyboardButton(text="🔙 Orqaga", callback_data="content_manage")]
 
-# ---- Lists ----
-@router.callback_query(F.data == "movie_list")
-async def movie_list(callback: CallbackQuery):
-    movies = await db.get_all_content("movie")
-    if not movies:
-        await callback.message.edit_text("📭 Kino yo'q.", reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[[InlineKeyboardButton(text="🔙 Orqaga", callback_data="content_manage")]]
-        ))
+    if not rows:
+        if cursor:
+            # sahifa chegarasida kontent o'chirilgan bo'lsa, boshidan ko'rsatamiz
+            await show_catalog_page(callback, content_type, sort)
+            return
+        empty = "📭 Kino yo'q." if content_type == "movie" else "📭 Serial yo'q."
+        await callback.message.edit_text(empty, reply_markup=InlineKeyboardMarkup(inline_keyboard=[back_kb]))
+        await callback.answer()
         return
 
-    text = "📋 Kinolar:\n\n"
-    for m in movies:
-        text += f"🎬 {m['id']}. {m['title']}  (⬇️ {m['downloads_count']})\n"
-        if m["description"]:
-            text += f"   📝 {m['description']}\n"
+    if content_type == "movie":
+        text = "📋 Kinolar:\n\n"
+    else:
+        text = "📋 Seriallar:\n\n"
+    for r in rows:
+        if content_type == "movie":
+            text += f"🎬 {r['id']}. {r['title']}  (⬇️ {r['downloads_count']})\n"
+        else:
+            text += f"📺 {r['id']}. {r['title']} ({r['parts_count']} qism) (⬇️ {r['downloads_count']})\n"
+        desc = r["description"] or ""
+        if desc:
+            if len(desc) > CATALOG_DESC_LIMIT:
+                desc = desc[:CATALOG_DESC_LIMIT].rstrip() + "…"
+            text += f"   📝 {desc}\n"
         text += "\n"
 
-    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(
-        inline_keyboard=[[InlineKeyboardButton(text="🔙 Orqaga", callback_data="content_manage")]]
-    ))
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(
+            text="⬅️ Oldingi", callback_data=f"clist:{t}:{s}:p:{_catalog_cursor(rows[0], sort)}"
+        ))
+    if has_next:
+        nav.append(InlineKeyboardButton(
+            text="➡️ Keyingi", callback_data=f"clist:{t}:{s}:n:{_catalog_cursor(rows[-1], sort)}"
+        ))
+
+    keyboard = []
+    if nav:
+        keyboard.append(nav)
+    if sort == "downloads":
+        keyboard.append([InlineKeyboardButton(text="🔢 ID bo'yicha", callback_data=f"clist:{t}:id:n:")])
+    else:
+        keyboard.append([InlineKeyboardButton(text="⬇️ Yuklanish bo'yicha", callback_data=f"clist:{t}:dl:n:")])
+    keyboard.append(back_kb)
+
+    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
+    await callback.answer()
+
+@router.callback_query(F.data == "movie_list")
+async def movie_list(callback: CallbackQuery):
+    await show_catalog_page(callback, "movie")
 
 @router.callback_query(F.data == "serial_list")
 async def serial_list(callback: CallbackQuery):
-    serials = await db.get_all_content("serial")
-    if not serials:
-        await callback.message.edit_text("📭 Serial yo'q.", reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[[InlineKeyboardButton(text="🔙 Orqaga", callback_data="content_manage")]]
-        ))
-        return
+    await show_catalog_page(callback, "serial")
 
-    text = "📋 Seriallar:\n\n"
-    for s in serials:
-        parts = await db.get_serial_parts_count(s["id"])
-        text += f"📺 {s['id']}. {s['title']} ({parts} qism) (⬇️ {s['downloads_count']})\n"
-        if s["description"]:
-            text += f"   📝 {s['description']}\n"
-        text += "\n"
-
-    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(
-        inline_keyboard=[[InlineKeyboardButton(text="🔙 Orqaga", callback_data="content_manage")]]
-    ))
+@router.callback_query(F.data.startswith("clist:"))
+async def catalog_page(callback: CallbackQuery):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Sizda admin huquqi yo'q.")
+        return
+    try:
+        _, t, s, d, cursor = callback.data.split(":", 4)
+        _parse_catalog_cursor(cursor)
+    except ValueError:
+        await callback.answer("❌ Xatolik.")
+        return
+    await show_catalog_page(
+        callback,
+        "movie" if t == "m" else "serial",
+        "downloads" if s == "dl" else "id",
+        cursor,
+        d == "p",
+    )
 
 # ---- Remove content ----
 @router.callback_query(F.data == "remove_content")
@@ -1152,18 +4252,106 @@ async def broadcast_process(message: Message, state: FSMContext):
     sent = 0
     failed = 0
     for uid in users:
-        try:
-            await bot.copy_message(chat_id=uid, from_chat_id=message.chat.id, message_id=message.message_id)
-            sent += 1
-            await asyncio.sleep(0.05)
-        except Exception:
-            failed += 1
+        while True:
+            try:
+                await current_bot().copy_message(chat_id=uid, from_chat_id=message.chat.id, message_id=message.message_id)
+                sent += 1
+                await asyncio.sleep(0.05)
+            except ApiCircuitOpen:
+                # API ishlamayapti — qolganlarni "xato" deb tashlab ketmasdan tiklanishini kutamiz
+                await asyncio.sleep(max(1.0, api_breaker.retry_in()))
+                continue
+            except (TelegramForbiddenError, TelegramBadRequest):
+                failed += 1  # botni bloklagan / chat topilmadi
+            except TelegramAPIError as e:
+                logger.warning(f"broadcast {uid}: {type(e).__name__}: {e}")
+                failed += 1
+            break
 
     await message.answer(f"✅ Yuborildi: {sent}\n❌ Xato: {failed}")
     await state.clear()
     await show_admin_panel(message)
 
 
+# ===================== CAPTIONS =====================
+def build_movie_caption(content: Union[Content, VideoItem]) -> str:
+    caption = f"🎬 {content.title}\n🔗 ID: {content.id}"
+    if content.description:
+        caption += f"\n📝 {content.description}"
+    return caption
+
+
+def build_serial_caption(content: Union[Content, VideoItem], part_title: str, part_number: int, total_parts: int) -> str:
+    caption = (
+        f"📺 {content.title} - {part_title}\n"
+        f"🔗 ID: {content.id}\n"
+        f"🔢 Qism: {part_number}/{total_parts}"
+    )
+    if content.description:
+        caption += f"\n📝 {content.description}"
+    return caption
+
+
+# Yuborishga tayyor (file_id, caption, reply_markup). Kalit: (bot_id, catalog_version, content_id, part_number, kind),
+# kind: "movie" (part_number=0), "first" (serialning 1-qismi kod bo'yicha), "nav" (oldingi/keyingi tugmalari).
+# file_id bot tokeniga xos — mirror botlar bir-birining yozuvini olmasin.
+# Katalogga har qanday yozuv catalog_version ni oshiradi — eski yozuvlar ishlatilmay, LRU dan chiqib ketadi.
+# Versiya ma'lumot o'qilishidan OLDIN olinadi: eski kontent yangi versiya kaliti ostiga tushmasin.
+RENDER_CACHE_SIZE = 10_000
+render_cache = LRUCache(maxsize=RENDER_CACHE_SIZE)
+metrics.register_cache("render", render_cache)
+
+
+def serial_nav_markup(serial_id: int, part_number: int, total_parts: int, first: bool = False) -> Optional[InlineKeyboardMarkup]:
+    if first:
+        if total_parts < 2:
+            return None
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="➡️ Keyingi qism", callback_data=f"serial_{serial_id}_2")]
+        ])
+    row = []
+    if part_number > 1:
+        row.append(InlineKeyboardButton(text="⬅️ Oldingi", callback_data=f"serial_{serial_id}_{part_number-1}"))
+    if part_number < total_parts:
+        row.append(InlineKeyboardButton(text="➡️ Keyingi", callback_data=f"serial_{serial_id}_{part_number+1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
+
+
+async def render_movie(content_id: int) -> Optional[Tuple[str, str, None]]:
+    key = (current_bot().id, db.catalog_version, content_id, 0, "movie")
+    rendered = render_cache.get(key)
+    if rendered is not None:
+        return rendered
+    content = await db.get_content(content_id)
+    if not content or content.content_type != "movie":
+        return None
+    rendered = (content.file_id, build_movie_caption(content), None)
+    render_cache.set(key, rendered)
+    return rendered
+
+
+async def render_serial_part(serial_id: int, part_number: int, first: bool = False) -> Optional[Tuple[str, str, Optional[InlineKeyboardMarkup]]]:
+    """Serial yoki qism yo'q bo'lsa None (u keshlanmaydi). Keshda bo'lsa bazaga umuman murojaat yo'q."""
+    key = (current_bot().id, db.catalog_version, serial_id, part_number, "first" if first else "nav")
+    rendered = render_cache.get(key)
+    if rendered is not None:
+        return rendered
+    content = await db.get_content(serial_id)
+    if not content or content.content_type != "serial":
+        return None
+    parts = await db.get_serial_parts(serial_id)
+    if part_number < 1 or part_number > len(parts):
+        return None
+    part = parts[part_number - 1]
+    rendered = (
+        part.file_id,
+        build_serial_caption(content, part.title, part_number, len(parts)),
+        serial_nav_markup(serial_id, part_number, len(parts), first),
+    )
+    render_cache.set(key, rendered)
+    return rendered
+
+
 # ===================== USER: CONTENT VIEW =====================
 @router.message(F.text & ~F.text.startswith('/'))
 async def handle_content_request(message: Message):
@@ -1171,75 +4359,651 @@ async def handle_content_request(message: Message):
     text = (message.text or "").strip()
     await db.update_user_activity(user.id)
 
-    if not await db.is_admin(user.id):
-        channels = await db.get_channels()
-        if channels:
-            not_subscribed = await check_subscription(user.id)
-            if not_subscribed:
-                instagram_links = await db.get_instagram_links()
-                kb = build_subscribe_keyboard(not_subscribed, instagram_links)
-                await message.answer("❌ Avval kanallarga obuna bo'ling:", reply_markup=kb)
-                return
+    not_subscribed = await gate_missing_channels(user.id)
+    if not_subscribed:
+        instagram_links = await db.get_instagram_links()
+        kb = build_subscribe_keyboard(not_subscribed, instagram_links, pending=parse_content_code(text))
+        await message.answer("❌ Avval kanallarga obuna bo'ling:", reply_markup=kb)
+        return
 
     try:
         content_id = int(text)
-    except:
-        await message.answer("❌ Iltimos, faqat kod yuboring (1,2,3...).")
+    except ValueError:
+        await send_search_results(message, text)
         return
 
+    await send_content(message, user.id, content_id)
+
+
+async def send_content(message: Message, user_id: int, content_id: int) -> None:
+    """
+    Kontentni shu chatga yuboradi (kino yoki serialning 1-qismi).
+    Obuna tekshiruvi chaqiruvchi tomonda qilinadi.
+    """
     content = await db.get_content(content_id)
     if not content:
         await message.answer(f"❌ {content_id} kodli kontent topilmadi.")
         return
 
     try:
-        await db.register_download(content_id, user.id)
+        await db.register_download(content_id, user_id)
     except Exception as e:
         logger.error(f"register_download error: {e}")
 
-    if content["content_type"] == "movie":
-        caption = f"🎬 {content['title']}\n🔗 ID: {content['id']}"
-        if content["description"]:
-            caption += f"\n📝 {content['description']}"
+    if content.content_type == "movie":
+        rendered = await render_movie(content_id)
+        if rendered is None:
+            await message.answer(f"❌ {content_id} kodli kontent topilmadi.")
+            return
+        file_id, caption, _ = rendered
 
         try:
             await message.answer_video(
-                video=content["file_id"],
+                video=file_id,
                 caption=caption,
                 protect_content=True
             )
-        except:
+        except TelegramAPIError as e:
+            logger.warning(f"send movie {content_id}: {type(e).__name__}: {e}")
             await message.answer("❌ Xatolik: Kino yuborilmadi.")
         return
 
-    parts = await db.get_serial_parts(content_id)
-    if not parts:
+    rendered = await render_serial_part(content_id, 1, first=True)
+    if rendered is None:
         await message.answer("❌ Bu serialda hali qismlar yo'q.")
         return
-
-    part_number = 1
-    current_part = parts[0]
-
-    caption = (
-        f"📺 {content['title']} - {current_part['title']}\n"
-        f"🔗 ID: {content_id}\n"
-        f"🔢 Qism: {part_number}/{len(parts)}"
-    )
-    if content["description"]:
-        caption += f"\n📝 {content['description']}"
-
-    keyboard = []
-    if len(parts) > 1:
-        keyboard.append([InlineKeyboardButton(text="➡️ Keyingi qism", callback_data=f"serial_{content_id}_2")])
+    file_id, caption, markup = rendered
 
     await message.answer_video(
-        video=current_part["file_id"],
+        video=file_id,
         caption=caption,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard) if keyboard else None,
+        reply_markup=markup,
         protect_content=True
     )
 
 
+# ===================== USER: SEARCH =====================
+SEARCH_PAGE_SIZE = 8
+SEARCH_MIN_LEN = 2
+# callback_data 64 bayt — so'rov matni serverda, tugmada faqat qisqa kalit va offset
+SEARCH_QUERY_CACHE_SIZE = 50_000
+SEARCH_QUERY_TTL = 24 * 3600
+search_queries = LRUCache(maxsize=SEARCH_QUERY_CACHE_SIZE, ttl=SEARCH_QUERY_TTL)
+metrics.register_cache("search_queries", search_queries)
+
+
+def _search_callback(offset: int, query: str) -> str:
+    # bir xil so'rov — bir xil kalit: sahifalar bitta yozuvni yangilab turadi
+    key = hashlib.blake2b(query.encode("utf-8"), digest_size=8).hexdigest()
+    search_queries.set(key, query)
+    return f"srch:{key}:{offset}"
+
+
+async def render_search_results(query: str, offset: int = 0) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    rows, has_more = await db.search_content(query, SEARCH_PAGE_SIZE, offset)
+    if not rows:
+        return None
+
+    keyboard = []
+    for r in rows:
+        icon = "🎬" if r["content_type"] == "movie" else "📺"
+        keyboard.append([InlineKeyboardButton(text=f"{icon} {r['title']} ({r['id']})", callback_data=f"get_{r['id']}")])
+
+    nav = []
+    if offset > 0:
+        nav.append(InlineKeyboardButton(
+            text="⬅️ Oldingi", callback_data=_search_callback(max(0, offset - SEARCH_PAGE_SIZE), query)
+        ))
+    if has_more:
+        nav.append(InlineKeyboardButton(
+            text="➡️ Keyingi", callback_data=_search_callback(offset + SEARCH_PAGE_SIZE, query)
+        ))
+    if nav:
+        keyboard.append(nav)
+
+    return f"🔎 \"{query}\" bo'yicha natijalar:", InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+async def send_search_results(message: Message, text: str):
+    query = " ".join(search_tokens(text))
+    if len(query) < SEARCH_MIN_LEN:
+        await message.answer("❌ Iltimos, kod (1,2,3...) yoki kino nomini yuboring.")
+        return
+
+    rendered = await render_search_results(query)
+    if not rendered:
+        await message.answer(f"❌ \"{text}\" bo'yicha hech narsa topilmadi.")
+        return
+    text, kb = rendered
+    await message.answer(text, reply_markup=kb)
+
+
+async def _callback_gate_ok(callback: CallbackQuery) -> bool:
+    if await is_gate_passed(callback.from_user.id):
+        return True
+    await callback.answer("❌ Avval obuna bo'ling.")
+    return False
+
+
+@router.callback_query(F.data.startswith("srch:"))
+async def search_page(callback: CallbackQuery):
+    try:
+        _, key, off = callback.data.split(":", 2)
+        offset = max(0, int(off))
+    except ValueError:
+        await callback.answer("❌ Xatolik.")
+        return
+    query = search_queries.get(key)
+    if query is None:
+        await callback.answer("⌛ Qidiruv eskirdi, so'rovni qaytadan yuboring.", show_alert=True)
+        return
+
+    rendered = await render_search_results(query, offset)
+    if not rendered:
+        await callback.answer("❌ Natija topilmadi.")
+        return
+    text, kb = rendered
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("get_"))
+async def search_pick(callback: CallbackQuery):
+    try:
+        content_id = int(callback.data.split("_", 1)[1])
+    except ValueError:
+        await callback.answer("❌ Xatolik.")
+        return
+
+    if not await _callback_gate_ok(callback):
+        return
+
+    await db.update_user_activity(callback.from_user.id)
+    await send_content(callback.message, callback.from_user.id, content_id)
+    await callback.answer()
+
+
+# ===================== TOP / TRENDING =====================
+LEADERBOARD_REFRESH_SECONDS = 300
+TOP_BOARDS = {"today": "📅 Bugun", "week": "🗓 Hafta", "all": "🏆 Barcha vaqt"}
+TOP_BUTTON = InlineKeyboardButton(text="🔥 Top", callback_data="top:today")
+
+
+async def render_top(board: str, with_back: bool) -> Tuple[str, InlineKeyboardMarkup]:
+    rows = await db.get_leaderboard(board)
+
+    text = f"🔥 Top {TOP_N} — {TOP_BOARDS[board]}\n\n"
+    if not rows:
+        text += "Hali ma'lumot yo'q."
+
+    keyboard = []
+    for r in rows:
+        icon = "🎬" if r["content_type"] == "movie" else "📺"
+        text += f"{r['rank']}. {icon} {r['title']} — ⬇️ {r['downloads']}\n"
+        keyboard.append([InlineKeyboardButton(text=f"{r['rank']}. {r['title']} ({r['id']})", callback_data=f"get_{r['id']}")])
+
+    keyboard.append([
+        InlineKeyboardButton(text=("• " if b == board else "") + label, callback_data=f"top:{b}")
+        for b, label in TOP_BOARDS.items()
+    ])
+    if with_back:
+        keyboard.append([InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_main")])
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+@router.message(Command("top"))
+async def top_command(message: Message):
+    text, kb = await render_top("today", False)
+    await message.answer(text, reply_markup=kb)
+
+
+@router.callback_query(F.data.startswith("top:"))
+async def top_callback(callback: CallbackQuery):
+    board = callback.data.split(":", 1)[1]
+    if board not in TOP_BOARDS:
+        await callback.answer("❌ Xatolik.")
+        return
+    text, kb = await render_top(board, await db.is_admin(callback.from_user.id))
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest:
+        # video xabari (caption) yoki o'zgarmagan matn bo'lsa — yangi xabar
+        await callback.message.answer(text, reply_markup=kb)
+    await callback.answer()
+
+
+async def leaderboard_refresher():
+    while True:
+        try:
+            await db.refresh_leaderboards()
+        except Exception as e:
+            logger.error(f"leaderboard refresh error: {e}")
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+
+
+# ===================== DB MAINTENANCE =====================
+MAINTENANCE_BATCH = 5000
+MAINTENANCE_VACUUM_PAGES = 256
+MAINTENANCE_SLICE_PAUSE = 0.2
+MAINTENANCE_TIME_BUDGET = 30.0
+
+
+async def run_maintenance() -> Dict:
+    """
+    Hammasi kichik bo'laklarda: har bir bo'lak o'z qisqa tranzaksiyasi, orasida pauza.
+    Shunda yozuvchilar (foydalanuvchi so'rovlari) uzoq kutib qolmaydi.
+    """
+    started = time.monotonic()
+    report = {"activity_rolled": 0, "join_requests_expired": 0, "pages_freed": 0}
+
+    def time_left() -> bool:
+        return time.monotonic() - started < MAINTENANCE_TIME_BUDGET
+
+    activity_before = now_ts() - ACTIVITY_RETENTION_DAYS * 86400
+    while time_left():
+        n = await db.rollup_activity(activity_before, MAINTENANCE_BATCH)
+        report["activity_rolled"] += n
+        if n < MAINTENANCE_BATCH:
+            break
+        await asyncio.sleep(MAINTENANCE_SLICE_PAUSE)
+
+    report["cohorts_pruned"] = await db.prune_cohorts(now_ts() // 86400 - COHORT_RETENTION_DAYS)
+
+    join_before = now_ts() - JOIN_REQUEST_TTL_DAYS * 86400
+    while time_left():
+        n = await db.expire_join_requests(join_before, MAINTENANCE_BATCH)
+        report["join_requests_expired"] += n
+        if n < MAINTENANCE_BATCH:
+            break
+        await asyncio.sleep(MAINTENANCE_SLICE_PAUSE)
+
+    for path in db.own_files:
+        mode = await db.get_auto_vacuum_mode(path)
+        if mode != 2 and DB_VACUUM_CONVERT:
+            logger.info(f"{path}: auto_vacuum=INCREMENTAL ga o'tkazilmoqda (VACUUM)...")
+            await db.convert_to_incremental_vacuum(path)
+            mode = 2
+        if mode == 2:
+            while time_left():
+                freed, remaining = await db.incremental_vacuum(path, MAINTENANCE_VACUUM_PAGES)
+                report["pages_freed"] += freed
+                if remaining == 0 or freed == 0:
+                    break
+                await asyncio.sleep(MAINTENANCE_SLICE_PAUSE)
+
+        if time_left():
+            await db.optimize(path)
+
+    report["seconds"] = round(time.monotonic() - started, 2)
+    return report
+
+
+async def maintenance_loop():
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+        try:
+            report = await run_maintenance()
+            logger.info(f"DB maintenance: {report}")
+        except Exception as e:
+            logger.error(f"DB maintenance error: {e}")
+
+
+# ===================== BACKUP =====================
+# 256 sahifa (~1 MB) / qadam + 10 ms pauza: bench_backup.py da backup vaqtida
+# xabar p99 kechikishi fondan BACKUP_LATENCY_BUDGET_MS dan ko'p oshmaydi
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE = 0.01
+BACKUP_LATENCY_BUDGET_MS = 5.0
+
+backup_lock = asyncio.Lock()
+
+
+def _prune_backups(stem: str) -> int:
+    # aniq moslik: "bot" stem i "bot-hot-....db" snapshotlarini o'chirmasin
+    pattern = re.compile(rf"^{re.escape(stem)}-\d{{8}}-\d{{6}}\.db$")
+    snapshots = sorted(f for f in os.listdir(BACKUP_DIR) if pattern.match(f))
+    old = snapshots[:-BACKUP_KEEP] if BACKUP_KEEP > 0 else []
+    for f in old:
+        os.remove(os.path.join(BACKUP_DIR, f))
+    return len(old)
+
+
+async def run_backup() -> Dict:
+    """
+    Har bir baza faylining snapshoti: BACKUP_DIR/<nom>-<YYYYmmdd-HHMMSS>.db.
+    Bo'lingan rejimda ikkala fayl bir xil vaqt belgisi bilan saqlanadi; mirror bot faqat o'z hot bazasini saqlaydi.
+    """
+    async with backup_lock:
+        started = time.monotonic()
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        report = {"files": [], "failed": [], "pruned": 0}
+        for path in db.own_files:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            dest = os.path.join(BACKUP_DIR, f"{stem}-{stamp}.db")
+            if await db.backup_file(path, dest, BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE):
+                report["files"].append(dest)
+                report["pruned"] += _prune_backups(stem)
+            else:
+                report["failed"].append(path)
+                logger.error(f"Backup integrity_check dan o'tmadi: {path}")
+        report["seconds"] = round(time.monotonic() - started, 2)
+        return report
+
+
+async def backup_loop():
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL)
+        try:
+            report = await run_backup()
+            logger.info(f"DB backup: {report}")
+        except Exception as e:
+            logger.error(f"DB backup error: {e}")
+
+
+@router.message(Command("backup"))
+async def backup_command(message: Message):
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Sizda admin huquqi yo'q.")
+        return
+    if backup_lock.locked():
+        await message.answer("⏳ Backup allaqachon ishlayapti.")
+        return
+
+    status = await message.answer("⏳ Backup olinmoqda...")
+    try:
+        report = await run_backup()
+    except Exception as e:
+        logger.error(f"DB backup error: {e}")
+        await status.edit_text(f"❌ Backup xatosi: {e}")
+        return
+
+    lines = [f"✅ {os.path.basename(f)} ({os.path.getsize(f) / 1048576:.1f} MB)" for f in report["files"]]
+    lines += [f"❌ {os.path.basename(f)}: integrity_check xato" for f in report["failed"]]
+    lines.append(f"\n⏱ {report['seconds']}s, o'chirilgan eski nusxalar: {report['pruned']}")
+    await status.edit_text("💾 Backup:\n\n" + "\n".join(lines))
+
+
+# ===================== EXPORT =====================
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_MAX_BYTES = 50 * 1024 * 1024  # Bot API hujjat yuborish chegarasi
+
+export_lock = asyncio.Lock()
+
+
+def _write_export_rows(f, fmt: str, columns: Tuple[str, ...], rows: List[tuple]) -> None:
+    if fmt == "csv":
+        csv.writer(f).writerows(rows)
+    else:
+        f.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+async def write_export(kind: str, fmt: str, dest: str) -> int:
+    """
+    db.iter_export_batches(kind) ni gzip faylga yozadi (doimiy xotira). Har bir bo'lakni
+    kodlash va siqish thread da — event loop to'silmaydi. Yozilgan qatorlar sonini qaytaradi.
+    """
+    import gzip
+
+    columns = EXPORT_COLUMNS[kind]
+    n = 0
+    with gzip.open(dest, "wt", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            csv.writer(f).writerow(columns)
+        # xato yoki bekor qilishda generator darhol yopiladi — reader ulanishi hovuzga qaytadi
+        async with aclosing(db.iter_export_batches(kind)) as batches:
+            async for rows in batches:
+                write = asyncio.ensure_future(asyncio.to_thread(_write_export_rows, f, fmt, columns, rows))
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # thread dagi yozuv tugasin — fayl yopilishi bilan to'qnashmasin
+                    await asyncio.wait([write])
+                    raise
+                n += len(rows)
+    return n
+
+
+@router.message(Command("export"))
+async def export_command(message: Message):
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Sizda admin huquqi yo'q.")
+        return
+
+    args = (message.text or "").split()[1:]
+    kind = args[0].lower() if args else ""
+    fmt = args[1].lower() if len(args) > 1 else "csv"
+    if kind not in EXPORT_COLUMNS or fmt not in EXPORT_FORMATS:
+        await message.answer(
+            "Foydalanish: /export <turi> [format]\n\n"
+            f"Turi: {', '.join(EXPORT_COLUMNS)}\n"
+            f"Format: {', '.join(EXPORT_FORMATS)} (standart: csv)"
+        )
+        return
+    if export_lock.locked():
+        await message.answer("⏳ Boshqa eksport ishlayapti, birozdan keyin urinib ko'ring.")
+        return
+
+    async with export_lock:
+        status = await message.answer("⏳ Eksport tayyorlanmoqda...")
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        filename = f"{kind}-{stamp}.{fmt}.gz"
+        path = os.path.join(tempfile.gettempdir(), filename)
+        try:
+            started = time.monotonic()
+            rows = await write_export(kind, fmt, path)
+            size = os.path.getsize(path)
+            if size > EXPORT_MAX_BYTES:
+                await status.edit_text(f"❌ Fayl juda katta ({size / 1048576:.1f} MB), Telegram 50 MB gacha qabul qiladi.")
+                return
+            await message.answer_document(
+                FSInputFile(path, filename=filename),
+                caption=f"📤 {kind}: {rows} qator, {size / 1048576:.1f} MB, {time.monotonic() - started:.1f}s",
+            )
+            await status.delete()
+        except asyncio.TimeoutError:
+            await status.edit_text("❌ Eksport vaqti tugadi.")
+        except Exception as e:
+            logger.error(f"Export error ({kind}): {e}")
+            await status.edit_text(f"❌ Eksport xatosi: {e}")
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# ===================== PROFILING =====================
+PROFILE_INTERVAL = 0.005      # 200 Hz
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 300
+PROFILE_SIGNAL_SECONDS = 30
+PROFILE_TOP = 20
+
+profile_lock = asyncio.Lock()
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler: har PROFILE_INTERVAL da SIGALRM (setitimer) keladi va handler
+    event loop (asosiy thread) stekini hamda sys._current_frames() orqali boshqa thread lar —
+    aiosqlite worker lar, to_thread executor — steklarini yozib oladi. cProfile dan farqli,
+    hamma thread ko'rinadi va profil qilinayotgan kodga hech narsa ulanmaydi.
+    Signal handler asosiy thread da bytecode lar orasida ishlaydi, shuning uchun event loop
+    namunasi GIL bo'shagan joyga (select) og'ib ketmaydi. Faqat asosiy thread dan boshqariladi.
+    """
+
+    # stek uchidagi shu funksiyalar — thread bo'sh kutyapti (select / queue / executor)
+    IDLE = {("selectors.py", "select"), ("threading.py", "wait"), ("thread.py", "_worker")}
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()   # (thread guruhi, (frame, ...)) -> namunalar
+        self.samples = 0
+        self.seconds = 0.0
+        self._started = 0.0
+        self._prev_handler = None
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(signal, "setitimer") and hasattr(signal, "SIGALRM")
+
+    @staticmethod
+    def _group(thread: Optional[threading.Thread]) -> str:
+        if thread is None:
+            return "other"
+        if isinstance(thread, aiosqlite.Connection):
+            return "aiosqlite"
+        if thread.name.startswith("asyncio_"):
+            return "executor"
+        return thread.name
+
+    @staticmethod
+    def _stack(frame) -> Tuple:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((os.path.basename(code.co_filename), code.co_name, code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _sample(self, signum, frame) -> None:
+        self.samples += 1
+        self.stacks[("event-loop", self._stack(frame))] += 1
+        main = threading.main_thread().ident
+        threads = {t.ident: t for t in threading.enumerate()}
+        for ident, other in sys._current_frames().items():
+            if ident != main:
+                self.stacks[(self._group(threads.get(ident)), self._stack(other))] += 1
+
+    def start(self) -> None:
+        self._prev_handler = signal.signal(signal.SIGALRM, self._sample)
+        self._started = time.perf_counter()
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+    def stop(self) -> None:
+        signal.setitimer(signal.ITIMER_REAL, 0, 0)
+        signal.signal(signal.SIGALRM, self._prev_handler or signal.SIG_DFL)
+        self.seconds = time.perf_counter() - self._started
+
+    def is_idle(self, stack: Tuple) -> bool:
+        return not stack or stack[-1][:2] in self.IDLE
+
+    def report(self) -> Tuple[str, str, str]:
+        """(qisqa top-N, to'liq saralangan statistika, flamegraph uchun collapsed stacks)."""
+        busy_by_group: Counter = Counter()
+        total_by_group: Counter = Counter()
+        self_samples: Counter = Counter()
+        incl_samples: Counter = Counter()
+        for (group, stack), n in self.stacks.items():
+            total_by_group[group] += n
+            if self.is_idle(stack):
+                continue
+            busy_by_group[group] += n
+            self_samples[(group, stack[-1])] += n
+            for frame in set(stack):
+                incl_samples[(group, frame)] += n
+
+        def fmt(frame):
+            filename, name, line = frame
+            return f"{name} ({filename}:{line})"
+
+        head = [f"{self.seconds:.1f}s, {self.samples} namuna ({self.interval * 1000:g} ms)"]
+        for group, total in total_by_group.most_common():
+            head.append(f"  {group:12s} band {busy_by_group[group] / total * 100:5.1f}%  ({busy_by_group[group]}/{total})")
+        busy = sum(busy_by_group.values()) or 1
+
+        short = head + ["", f"Top {PROFILE_TOP} (o'z vaqti):"]
+        short += [
+            f"{n / busy * 100:5.1f}%  [{group}] {fmt(frame)}"
+            for (group, frame), n in self_samples.most_common(PROFILE_TOP)
+        ]
+
+        full = head + ["", "O'z vaqti (self), band namunalardan %:"]
+        full += [f"{n:7d} {n / busy * 100:6.2f}%  [{g}] {fmt(f)}" for (g, f), n in self_samples.most_common()]
+        full += ["", "Umumiy vaqt (inclusive):"]
+        full += [f"{n:7d} {n / busy * 100:6.2f}%  [{g}] {fmt(f)}" for (g, f), n in incl_samples.most_common()]
+
+        collapsed = [
+            ";".join([group] + [f"{name} ({filename}:{line})" for filename, name, line in stack]) + f" {n}"
+            for (group, stack), n in self.stacks.most_common()
+        ]
+        return "\n".join(short), "\n".join(full) + "\n", "\n".join(collapsed) + "\n"
+
+
+async def run_profile(seconds: float) -> Tuple[str, List[str]]:
+    """Profil oladi, PROFILE_DIR ga yozadi; (qisqa xulosa, [stats fayl, collapsed fayl])."""
+    async with profile_lock:
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+        short, full, collapsed = profiler.report()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        paths = [os.path.join(PROFILE_DIR, f"profile-{stamp}.txt"), os.path.join(PROFILE_DIR, f"profile-{stamp}.collapsed")]
+        for path, text in zip(paths, (full, collapsed)):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return short, paths
+
+
+@router.message(Command("profile"))
+async def profile_command(message: Message, command: CommandObject):
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Sizda admin huquqi yo'q.")
+        return
+    try:
+        seconds = int(command.args) if command.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await message.answer(f"Foydalanish: /profile <sekund, 1-{PROFILE_MAX_SECONDS}>")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    if not SamplingProfiler.supported():
+        await message.answer("❌ Bu platformada profil olib bo'lmaydi (setitimer yo'q).")
+        return
+    if profile_lock.locked():
+        await message.answer("⏳ Profil allaqachon olinmoqda.")
+        return
+
+    status = await message.answer(f"⏳ {seconds}s profil olinmoqda...")
+    try:
+        short, paths = await run_profile(seconds)
+    except Exception as e:
+        logger.error(f"Profile error: {e}")
+        await message.answer(f"❌ Profil xatosi: {e}")
+        return
+    finally:
+        # xato yoki bekor qilinganda ham "olinmoqda" xabari chatda qolmasin
+        try:
+            await status.delete()
+        except TelegramAPIError:
+            pass
+    await message.answer_document(FSInputFile(paths[0]), caption="📈 Saralangan statistika")
+    await message.answer_document(FSInputFile(paths[1]), caption="🔥 flamegraph.pl / speedscope uchun")
+    await message.answer(short[:4000])
+
+
+def install_profile_signal() -> None:
+    """kill -USR1 <pid> — PROFILE_SIGNAL_SECONDS lik profil, natija logga va PROFILE_DIR ga."""
+    if not hasattr(signal, "SIGUSR1") or not SamplingProfiler.supported():
+        return
+
+    async def profile_from_signal():
+        if profile_lock.locked():
+            return
+        short, paths = await run_profile(PROFILE_SIGNAL_SECONDS)
+        logger.info(f"Profil tayyor: {', '.join(paths)}\n{short}")
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, lambda: spawn(profile_from_signal())
+        )
+    except NotImplementedError:
+        pass
+
+
 # ===================== SERIAL NAVIGATION (send new video for protect_content) =====================
 @router.callback_query(F.data.startswith("serial_"))
 async def handle_serial_navigation(callback: CallbackQuery):
@@ -1251,62 +5015,267 @@ async def handle_serial_navigation(callback: CallbackQuery):
         await callback.answer("❌ Xatolik.")
         return
 
-    if not await db.is_admin(callback.from_user.id):
-        channels = await db.get_channels()
-        if channels:
-            not_subscribed = await check_subscription(callback.from_user.id)
-            if not_subscribed:
-                await callback.answer("❌ Avval obuna bo'ling.")
-                return
+    if not await _callback_gate_ok(callback):
+        return
 
     content = await db.get_content(serial_id)
-    if not content or content["content_type"] != "serial":
+    if not content or content.content_type != "serial":
         await callback.answer("❌ Serial topilmadi.")
         return
 
-    parts = await db.get_serial_parts(serial_id)
-    if not parts or part_number < 1 or part_number > len(parts):
+    rendered = await render_serial_part(serial_id, part_number)
+    if rendered is None:
         await callback.answer("❌ Qism topilmadi.")
         return
-
-    current_part = parts[part_number - 1]
-
-    caption = (
-        f"📺 {content['title']} - {current_part['title']}\n"
-        f"🔗 ID: {serial_id}\n"
-        f"🔢 Qism: {part_number}/{len(parts)}"
-    )
-    if content["description"]:
-        caption += f"\n📝 {content['description']}"
-
-    keyboard = []
-    row = []
-    if part_number > 1:
-        row.append(InlineKeyboardButton(text="⬅️ Oldingi", callback_data=f"serial_{serial_id}_{part_number-1}"))
-    if part_number < len(parts):
-        row.append(InlineKeyboardButton(text="➡️ Keyingi", callback_data=f"serial_{serial_id}_{part_number+1}"))
-    if row:
-        keyboard.append(row)
+    file_id, caption, markup = rendered
 
     try:
         await callback.message.answer_video(
-            video=current_part["file_id"],
+            video=file_id,
             caption=caption,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard) if keyboard else None,
+            reply_markup=markup,
             protect_content=True
         )
         await callback.answer()
-    except:
+    except TelegramAPIError as e:
+        logger.warning(f"send serial {serial_id}/{part_number}: {type(e).__name__}: {e}")
         await callback.answer("❌ Video yuborilmadi.")
 
 
+# ===================== INLINE MODE =====================
+# BotFather da /setinline yoqilgan bo'lishi kerak (/setinlinefeedback — yuklanishlarni hisoblash uchun).
+INLINE_CACHE_TIME = 300
+INLINE_PAGE_SIZE = 20
+INLINE_MAX_PARTS = 50
+inline_cache = LRUCache(maxsize=2048, ttl=INLINE_CACHE_TIME)
+metrics.register_cache("inline", inline_cache)
+
+
+def _inline_video(result_id: str, file_id: str, title: str, caption: str, description: str = "") -> InlineQueryResultCachedVideo:
+    return InlineQueryResultCachedVideo(
+        id=result_id,
+        video_file_id=file_id,
+        title=title[:256] or "Video",
+        description=(description or "")[:256] or None,
+        caption=caption[:1024],
+    )
+
+
+async def build_inline_results(query: str, offset: int) -> Tuple[List[InlineQueryResultCachedVideo], str]:
+    """
+    Natijalar (va next_offset) prefix bo'yicha LRU keshda saqlanadi.
+    Kalitda catalog_version bor: katalog o'zgarsa eski yozuvlar o'z-o'zidan ishlatilmay qoladi;
+    bot_id — natijalardagi file_id lar bot tokeniga xos.
+    """
+    key = (current_bot().id, db.catalog_version, query, offset)
+    cached = inline_cache.get(key)
+    if cached is not None:
+        return cached
+
+    results: List[InlineQueryResultCachedVideo] = []
+    next_offset = ""
+
+    if query.isdigit():
+        content = await db.get_content(int(query))
+        if content and content.content_type == "movie" and content.file_id:
+            results.append(_inline_video(
+                f"c{content.id}", content.file_id, content.title,
+                build_movie_caption(content), content.description
+            ))
+        elif content and content.content_type == "serial":
+            parts = await db.get_serial_parts(content.id)
+            total = len(parts)
+            for p in parts[offset:offset + INLINE_MAX_PARTS]:
+                results.append(_inline_video(
+                    f"p{content.id}_{p.part_number}", p.file_id,
+                    f"{content.title} - {p.title}",
+                    build_serial_caption(content, p.title, p.part_number, total),
+                    f"{p.part_number}/{total}-qism"
+                ))
+            if offset + INLINE_MAX_PARTS < total:
+                next_offset = str(offset + INLINE_MAX_PARTS)
+    else:
+        rows, has_more = await db.search_content(query, INLINE_PAGE_SIZE, offset)
+        for item in await db.get_video_items([r["id"] for r in rows]):
+            if item.content_type == "movie":
+                caption = build_movie_caption(item)
+                result_id = f"c{item.id}"
+            else:
+                caption = build_serial_caption(item, item.part_title, 1, item.parts_count)
+                result_id = f"p{item.id}_1"
+            results.append(_inline_video(result_id, item.file_id, item.title, caption, item.description))
+        if has_more:
+            next_offset = str(offset + INLINE_PAGE_SIZE)
+
+    inline_cache.set(key, (results, next_offset))
+    return results, next_offset
+
+
+@router.inline_query()
+async def handle_inline_query(inline_query: InlineQuery):
+    query = " ".join(search_tokens(inline_query.query))
+    try:
+        offset = max(0, int(inline_query.offset or 0))
+    except ValueError:
+        offset = 0
+
+    if not await is_gate_passed(inline_query.from_user.id):
+        await inline_query.answer(
+            [],
+            cache_time=GATE_FAIL_TTL,
+            is_personal=True,
+            button=InlineQueryResultsButton(text="📢 Avval kanallarga obuna bo'ling", start_parameter="subscribe"),
+        )
+        return
+
+    if not query or (not query.isdigit() and len(query) < SEARCH_MIN_LEN):
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=False)
+        return
+
+    results, next_offset = await build_inline_results(query, offset)
+    # Majburiy kanallar bo'lsa Telegram keshi foydalanuvchiga xos bo'lishi kerak,
+    # aks holda obuna bo'lmagan user boshqaning keshlangan natijasini olib qo'yadi.
+    channels = await db.get_channels()
+    await inline_query.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=bool(channels),
+        next_offset=next_offset,
+    )
+
+
+@router.chosen_inline_result()
+async def handle_chosen_inline_result(chosen: ChosenInlineResult):
+    try:
+        content_id = int(chosen.result_id[1:].split("_", 1)[0])
+        await db.register_download(content_id, chosen.from_user.id)
+    except Exception as e:
+        logger.error(f"chosen_inline_result error: {e}")
+
+
+# ===================== DB SPLIT =====================
+async def download_count_flusher():
+    while True:
+        await asyncio.sleep(DOWNLOAD_FLUSH_SECONDS)
+        flush = asyncio.ensure_future(db.flush_download_counts())
+        try:
+            await asyncio.shield(flush)
+        except asyncio.CancelledError:
+            # shutdown: olingan hisoblar yo'qolmasin — yozuv tugaydi, qolgani main() dagi oxirgi flush da
+            await asyncio.wait([flush])
+            raise
+        except Exception as e:
+            logger.error(f"downloads_count flush error: {e}")
+
+
+def split_database(src: str, hot: str) -> None:
+    """
+    Bitta fayldagi bazani ikkiga bo'ladi (bot to'xtatilgan holda ishga tushiring):
+    - src -> faqat CATALOG_TABLES qoladi
+    - hot -> HOT_TABLES
+    Asl fayl nusxasi src + ".pre-split" ga saqlanadi.
+    """
+    if not hot or os.path.abspath(hot) == os.path.abspath(src):
+        raise SystemExit("HOT_DB_PATH .env da DB_PATH dan boshqa fayl bo'lishi kerak")
+    if os.path.exists(hot):
+        raise SystemExit(f"{hot} allaqachon mavjud")
+    backup = src + ".pre-split"
+    if os.path.exists(backup):
+        raise SystemExit(f"{backup} allaqachon mavjud")
+
+    con = sqlite3.connect(src)
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.execute("VACUUM INTO ?", (backup,))
+    con.execute("VACUUM INTO ?", (hot,))
+    for table in HOT_TABLES:
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+    con.commit()
+    con.execute("VACUUM")
+    con.close()
+
+    con = sqlite3.connect(hot)
+    for table in CATALOG_TABLES:
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+    con.commit()
+    con.execute("VACUUM")
+    con.close()
+    logger.info(f"Baza bo'lindi: katalog={src}, hot={hot}, nusxa={backup}")
+
+
 # ===================== MAIN =====================
+PREWARM_TOP_N = 500
+# sxema tekshiruvi + prewarm (production hajmidagi bazada); benchmarks/bench_startup.py shuni tekshiradi
+STARTUP_BUDGET_MS = 250
+
+_MODULE_DONE = time.perf_counter()
+
+
+async def startup() -> Dict[str, float]:
+    """Polling dan oldingi bosqichlar; har birining vaqti (s) logga yoziladi va qaytariladi."""
+    timings = {"imports": _IMPORTS_DONE - _BOOT_T0, "module": _MODULE_DONE - _IMPORTS_DONE}
+    t = time.perf_counter()
+    fast = await db.init_db()
+    timings["schema"] = time.perf_counter() - t
+    t = time.perf_counter()
+    warmed = await db.prewarm(PREWARM_TOP_N)
+    timings["prewarm"] = time.perf_counter() - t
+    if mirror_dbs:
+        # katalog keshlari umumiy va allaqachon isitilgan — mirror ga faqat sxema va o'z kanallari
+        t = time.perf_counter()
+        for mirror_db in mirror_dbs.values():
+            fast = await mirror_db.init_db() and fast
+            await mirror_db.get_channels()
+        timings["mirrors"] = time.perf_counter() - t
+    timings["total"] = time.perf_counter() - _BOOT_T0
+
+    logger.info(
+        "Startup: " + ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in timings.items())
+        + f" (sxema: {'mos' if fast else 'DDL bajarildi'}; kesh: {warmed})"
+    )
+    db_ms = (timings["schema"] + timings["prewarm"]) * 1000
+    if fast and db_ms > STARTUP_BUDGET_MS:
+        logger.warning(f"Startup DB bosqichlari {db_ms:.0f}ms > {STARTUP_BUDGET_MS}ms")
+    return timings
+
+
 async def main():
-    await db.init_db()
-    logger.info("Bot ishga tushdi...")
-    await dp.start_polling(bot)
+    bots = [bot, *setup_mirror_bots()]
+    await startup()
+    # botga xos fon vazifalari har bir botning o'z kontekstida (db — o'sha botning bazasi)
+    background = []
+    for b in bots:
+        background.append(scoped_task(b, leaderboard_refresher))
+        background.append(scoped_task(b, maintenance_loop))
+        background.append(scoped_task(b, lambda: db.migrate_timestamps()))
+        background.append(scoped_task(b, lambda: db.load_known_users()))
+        if BACKUP_INTERVAL > 0:
+            background.append(scoped_task(b, backup_loop))
+    flusher = asyncio.create_task(download_count_flusher()) if db.split or mirror_dbs else None
+    lag_monitor = asyncio.create_task(loop_lag_monitor())
+    install_profile_signal()
+    tracer = asyncio.create_task(trace_writer()) if TRACE_FILE else None
+    metrics_runner = await start_metrics_server() if METRICS_PORT else None
+    logger.info(f"Bot ishga tushdi... ({len(bots)} ta bot)")
+    try:
+        await dp.start_polling(*bots)
+    finally:
+        await stop_task(lag_monitor)
+        await stop_task(flusher)
+        if tracer:
+            await stop_task(tracer)
+            await flush_traces()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await db.flush_download_counts()
+        for manager in (db.primary, *mirror_dbs.values()):
+            await manager.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if "--split-db" in sys.argv[1:]:
+        split_database(DB_PATH, HOT_DB_PATH)
+    elif sys.argv[1:2] == ["--trace-summary"]:
+        trace_summary(sys.argv[2:])
+    else:
+        asyncio.run(main())
 
 